@@ -14,4 +14,6 @@ python3 data_preprocess.py \
   --src_dir ./src_data \
   --dst_dir ./cal_data \
   --pic_ext .rgb \
-  --read_mode opencv
+  --read_mode opencv \
+  --workers 0 \
+  --skip_mode hash
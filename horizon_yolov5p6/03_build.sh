@@ -12,5 +12,15 @@ cd $(dirname $0)
 config_file="./yolov5_config.yaml"
 model_type="onnx"
 # build model
-hb_mapper makertbin --config ${config_file}  \
-                    --model-type  ${model_type}
+# 同一个 onnx、配置、校准数据和工具链版本只转换一次，结果缓存在 ~/.cache/yolov5p6
+# 板端用的 bin 和 inference_image_demo.py 用的量化 onnx 一起缓存
+PYTHONPATH=.. python3 -m yolov5p6.artifact_cache \
+  --source ./model/yolov5_p6_512x512_6head.onnx \
+  --artifact ./model_output/yolov5_p6_512x512.bin \
+  --artifact ./model_output/yolov5_p6_512x512_quantized_model.onnx \
+  --shape 1,3,512,512 \
+  --config ${config_file} \
+  --calibration ./cal_data \
+  --toolkit "$(hb_mapper --version 2>&1 | tail -n 1)" \
+  -- hb_mapper makertbin --config ${config_file}  \
+                         --model-type  ${model_type}
@@ -6,8 +6,13 @@
 # reproduced, copied, transmitted, or used in any way for any purpose,
 # without the express written permission of Horizon Robotics Inc.
 
+import hashlib
+import json
 import os
 import sys
+import time
+from collections import Counter
+from multiprocessing import Pool
 sys.path.append('.')
 
 import click
@@ -47,17 +52,182 @@ def read_image(src_file, read_mode):
     return image
 
 
-def regular_preprocess(src_file, transformers, dst_dir, pic_ext, read_mode):
+def regular_preprocess(src_file, transformers, dst_dir, pic_ext, read_mode,
+                       pic_name=None):
     image = [read_image(src_file, read_mode)]
     for trans in transformers:
         image = trans(image)
 
-    filename = os.path.basename(src_file)
-    short_name, ext = os.path.splitext(filename)
-    pic_name = os.path.join(dst_dir, short_name + pic_ext)
+    if pic_name is None:
+        filename = os.path.basename(src_file)
+        short_name, ext = os.path.splitext(filename)
+        pic_name = os.path.join(dst_dir, short_name + pic_ext)
     print("write:%s" % pic_name)
     dtype = np.float32 if dst_dir.endswith("_f32") else np.uint8
-    image[0].astype(dtype).tofile(pic_name)
+    # 先写临时文件，中断时不会留下不完整的校准数据
+    tmp_name = pic_name + ".tmp"
+    image[0].astype(dtype).tofile(tmp_name)
+    os.replace(tmp_name, pic_name)
+    return pic_name
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def output_names(src_files, dst_dir, pic_ext):
+    """
+    output file of every source, decided up front in source order so the
+    result does not depend on which worker finishes first. sources sharing a
+    stem (a.jpg, a.png) keep their extension in the name
+    """
+    stems = [os.path.splitext(os.path.basename(f))[0] for f in src_files]
+    counts = Counter(stems)
+    names = []
+    for src_file, stem in zip(src_files, stems):
+        if counts[stem] > 1:
+            stem = os.path.basename(src_file).replace('.', '_')
+        names.append(os.path.join(dst_dir, stem + pic_ext))
+    return names
+
+
+def transformer_settings(transformers):
+    """
+    class and attributes of every transformer, recorded in the manifest so
+    changing calibration_transformers() regenerates the outputs
+    """
+    return [[type(trans).__name__,
+             {k: repr(v) for k, v in sorted(vars(trans).items())}]
+            for trans in transformers]
+
+
+def manifest_path(dst_dir):
+    # 不放在 dst_dir 里面，hb_mapper 会把目录下的所有文件当作校准数据
+    return dst_dir.rstrip('/\\') + '.manifest.json'
+
+
+def load_manifest(dst_dir):
+    try:
+        with open(manifest_path(dst_dir)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_manifest(dst_dir, manifest):
+    tmp_name = manifest_path(dst_dir) + '.tmp'
+    with open(tmp_name, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_name, manifest_path(dst_dir))
+
+
+def process_task(task):
+    """
+    one source image, run in a pool worker
+    :return: (status, output name, source digest), status is write / skip / fail
+    """
+    src_file, pic_name, dst_dir, pic_ext, read_mode, skip_mode, recorded = task
+    digest = None
+    if skip_mode == 'hash':
+        digest = file_digest(src_file)
+        if digest == recorded and os.path.exists(pic_name):
+            return 'skip', pic_name, digest
+    elif skip_mode == 'mtime':
+        if os.path.exists(pic_name) and \
+                os.path.getmtime(pic_name) >= os.path.getmtime(src_file):
+            return 'skip', pic_name, digest
+    try:
+        regular_preprocess(src_file, transformers, dst_dir, pic_ext, read_mode,
+                           pic_name)
+    except Exception as e:
+        print("fail:%s %s" % (src_file, e))
+        return 'fail', pic_name, None
+    return 'write', pic_name, digest
+
+
+def parallel_preprocess(src_files, dst_dir, pic_ext, read_mode, workers,
+                        skip_mode, report_every=100):
+    names = output_names(src_files, dst_dir, pic_ext)
+    manifest = load_manifest(dst_dir) if skip_mode == 'hash' else {}
+    # 配置不同的旧记录不能用来跳过
+    settings = {'pic_ext': pic_ext, 'read_mode': read_mode,
+                'transformers': transformer_settings(transformers)}
+    if manifest.get('settings') != settings:
+        manifest = {}
+    files = manifest.get('files', {})
+    tasks = [(src_file, pic_name, dst_dir, pic_ext, read_mode, skip_mode,
+              files.get(os.path.basename(pic_name)))
+             for src_file, pic_name in zip(src_files, names)]
+
+    counts = {'write': 0, 'skip': 0, 'fail': 0}
+    start = time.time()
+    pool = Pool(workers) if workers > 1 else None
+    try:
+        results = pool.imap(process_task, tasks) if pool else map(process_task,
+                                                                 tasks)
+        for done, (status, pic_name, digest) in enumerate(results, 1):
+            counts[status] += 1
+            if digest is not None and status != 'fail':
+                files[os.path.basename(pic_name)] = digest
+            if done % report_every == 0 or done == len(tasks):
+                elapsed = time.time() - start
+                print("progress: %d/%d, %.1f images/s" %
+                      (done, len(tasks), done / elapsed if elapsed else 0))
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    if skip_mode == 'hash':
+        save_manifest(dst_dir, {'settings': settings, 'files': files})
+    elapsed = time.time() - start
+    print("written %d, up to date %d, failed %d in %.1fs with %d workers, "
+          "%.1f images/s written" %
+          (counts['write'], counts['skip'], counts['fail'], elapsed, workers,
+           counts['write'] / elapsed if elapsed else 0))
+    return counts
+
+
+def archive_preprocess(archive_path, dst_dir, pic_ext, cal_img_num):
+    """
+    write the samples of a calibration archive (python -m yolov5p6.calib_archive)
+    as calibration files without decoding or resizing, build the archive with
+    the layout, size and padding calibration_transformers() produce, e.g.
+    --width 672 --height 672 --letterbox --pad_position boundary
+    --pad_value 127 --layout NCHW
+    """
+    sys.path.append('..')
+    from yolov5p6.calib_archive import CalibArchive
+
+    archive = CalibArchive(archive_path)
+    if archive.layout != 'NCHW':
+        print("warning: archive layout is %s, calibration_transformers "
+              "produce CHW" % archive.layout)
+    header = archive.header
+    # PadResizeTransformer 把图片放在左上角，右侧和下方填充 127
+    if header['letterbox'] and (header.get('pad_position', 'center') != 'boundary'
+                                or header.get('pad_value', 114) != 127):
+        print("warning: archive is padded %s with %s, PadResizeTransformer "
+              "pads boundary with 127" % (header.get('pad_position', 'center'),
+                                          header.get('pad_value', 114)))
+    dtype = np.float32 if dst_dir.endswith("_f32") else np.uint8
+    start = time.time()
+    count = 0
+    for name, sample in archive.samples():
+        if count >= cal_img_num:
+            break
+        pic_name = os.path.join(dst_dir, os.path.splitext(name)[0] + pic_ext)
+        tmp_name = pic_name + ".tmp"
+        sample.astype(dtype, copy=False).tofile(tmp_name)
+        os.replace(tmp_name, pic_name)
+        count += 1
+    elapsed = time.time() - start
+    print("written %d from %s in %.1fs" % (count, archive_path, elapsed))
+    return count
 
 
 def cifar_preprocess(src_file, data_loader, dst_dir, pic_ext, cal_img_num):
@@ -72,7 +242,9 @@ def cifar_preprocess(src_file, data_loader, dst_dir, pic_ext, cal_img_num):
 @click.command(help='''
 A Tool used to generate preprocess pics for calibration.
 ''')
-@click.option('--src_dir', type=str, help='calibration source file')
+@click.option('--src_dir',
+              type=str,
+              help='calibration source directory or calibration archive')
 @click.option('--dst_dir', type=str, help='generated calibration file')
 @click.option('--pic_ext',
               type=str,
@@ -83,19 +255,32 @@ A Tool used to generate preprocess pics for calibration.
               default="opencv",
               help='picture extension.')
 @click.option('--cal_img_num', type=int, default=100, help='cali picture num.')
-def main(src_dir, dst_dir, pic_ext, read_mode, cal_img_num):
+@click.option('--workers',
+              type=int,
+              default=1,
+              help='worker processes, 0 for one per cpu.')
+@click.option('--skip_mode',
+              type=click.Choice(["none", "mtime", "hash"]),
+              default="none",
+              help='regenerate everything (none), skip sources whose '
+              'content and transformer settings are unchanged since the last '
+              'run (hash), or whose output is newer (mtime, does not notice '
+              'transformer changes).')
+def main(src_dir, dst_dir, pic_ext, read_mode, cal_img_num, workers,
+         skip_mode):
     '''A Tool used to generate preprocess pics for calibration.'''
-    pic_num = 0
     os.makedirs(dst_dir, exist_ok=True)
-    if pic_ext.strip().split('_')[0] in regular_process_list:
+    if os.path.isfile(src_dir):
+        print("archive preprocess")
+        archive_preprocess(src_dir, dst_dir, pic_ext, cal_img_num)
+    elif pic_ext.strip().split('_')[0] in regular_process_list:
         print("regular preprocess")
-        for src_name in sorted(os.listdir(src_dir)):
-            pic_num += 1
-            if pic_num > cal_img_num:
-                break
-            src_file = os.path.join(src_dir, src_name)
-            regular_preprocess(src_file, transformers, dst_dir, pic_ext,
-                               read_mode)
+        src_files = [
+            os.path.join(src_dir, src_name)
+            for src_name in sorted(os.listdir(src_dir))[:cal_img_num]
+        ]
+        parallel_preprocess(src_files, dst_dir, pic_ext, read_mode,
+                            workers or os.cpu_count(), skip_mode)
     elif pic_ext.strip().split('_')[0] == ".cifar":
         print("cifar preprocess")
         data_loader = DataLoader(CifarDataset(src_dir), transformers, 1)
@@ -1,18 +1,67 @@
+import sys
+sys.path.append('..')
+
+import argparse
+import os
+
 import tensorrt as trt
+from yolov5p6 import YOLOV5P6_512X512
+from yolov5p6.artifact_cache import DEFAULT_CACHE_DIR, ArtifactCache, artifact_key, copy_atomic
+from yolov5p6.calib_archive import CalibArchive
+from yolov5p6.calibration import (CalibrationStream, calibration_batches, calibration_cache_path,
+                                   preprocess_settings, select_images)
+from yolov5p6.trt_profiles import make_profile, camera_profiles, replicate_profiles, save_profiles, sidecar_path
 
 G_LOGGER = trt.Logger()
 
-batch_size = 1
-imput_h = 512
-imput_w = 512
 
+class Int8EntropyCalibrator(trt.IInt8EntropyCalibrator2):
+    """
+    entropy calibrator fed by a CalibrationStream, batches are copied into one device buffer
+    :param batches: iterable of contiguous float32 arrays of the given shape, see calibration_batches and
+        CalibArchive.float_batches
+    """
+
+    def __init__(self, batches, shape, cache_file=None):
+        trt.IInt8EntropyCalibrator2.__init__(self)
+        import pycuda.driver as cuda
+        import pycuda.autoinit
+
+        self.shape = tuple(shape)
+        self.device_input = cuda.mem_alloc(trt.volume(self.shape) * trt.float32.itemsize)
+
+        def to_device(batch):
+            cuda.memcpy_htod(self.device_input, batch)
+            return int(self.device_input)
+
+        self.stream = CalibrationStream(batches, self.shape[0], cache_file, to_device)
+
+    def get_batch_size(self):
+        return self.stream.batch_size
 
-def get_engine(onnx_model_name, trt_model_name):
+    def get_batch(self, names):
+        return self.stream.get_batch(names)
+
+    def read_calibration_cache(self):
+        return self.stream.read_calibration_cache()
+
+    def write_calibration_cache(self, cache):
+        self.stream.write_calibration_cache(cache)
+
+
+def get_engine(onnx_model_name, trt_model_name, profiles, fp16=True, calibrator=None, input_shape=None):
+    """
+    :param profiles: list of OptimizationProfile, the onnx input needs dynamic dims wherever min != max
+    :param calibrator: Int8EntropyCalibrator to build an int8 engine, fp16 is still used for layers left in
+        float when fp16 is set
+    :param input_shape: fixed (batch, 3, h, w) set on the network input instead of profiles, as before profiles
+        were supported
+    """
     explicit_batch = 1 << (int)(trt.NetworkDefinitionCreationFlag.EXPLICIT_BATCH)
     with trt.Builder(G_LOGGER) as builder, builder.create_network(explicit_batch) as network, trt.OnnxParser(network,
                                                                                                              G_LOGGER) as parser:
-        builder.max_batch_size = batch_size
-        builder.max_workspace_size = 2 << 30
+        config = builder.create_builder_config()
+        config.max_workspace_size = 2 << 30
         print('Loading ONNX file from path {}...'.format(onnx_model_name))
         with open(onnx_model_name, 'rb') as model:
             print('Beginning ONNX file parsing')
@@ -24,9 +73,11 @@ def get_engine(onnx_model_name, trt_model_name):
         print('Building an engine from file {}; this may take a while...'.format(onnx_model_name))
 
         ####
-        # builder.int8_mode = True
-        # builder.int8_calibrator = calib
-        builder.fp16_mode = True
+        if calibrator is not None:
+            config.set_flag(trt.BuilderFlag.INT8)
+            config.int8_calibrator = calibrator
+        if fp16:
+            config.set_flag(trt.BuilderFlag.FP16)
         ####
 
         print("num layers:", network.num_layers)
@@ -34,8 +85,22 @@ def get_engine(onnx_model_name, trt_model_name):
         # if not last_layer.get_output(0):
         # network.mark_output(network.get_layer(network.num_layers - 1).get_output(0))//有的模型需要，有的模型在转onnx的之后已经指定了，就不需要这行
 
-        network.get_input(0).shape = [batch_size, 3, imput_h, imput_w]
-        engine = builder.build_cuda_engine(network)
+        input_name = network.get_input(0).name
+        if input_shape is not None:
+            network.get_input(0).shape = list(input_shape)
+        for profile in profiles:
+            print('profile {}: min {} opt {} max {}'.format(profile.name, profile.min_shape, profile.opt_shape,
+                                                           profile.max_shape))
+            trt_profile = builder.create_optimization_profile()
+            trt_profile.set_shape(input_name, profile.min_shape, profile.opt_shape, profile.max_shape)
+            config.add_optimization_profile(trt_profile)
+        if calibrator is not None and profiles:
+            # 校准按固定的 batch 尺寸运行
+            calib_profile = builder.create_optimization_profile()
+            calib_profile.set_shape(input_name, calibrator.shape, calibrator.shape, calibrator.shape)
+            config.set_calibration_profile(calib_profile)
+
+        engine = builder.build_engine(network, config)
         print("engine:", engine)
         print("Completed creating Engine")
         with open(trt_model_name, "wb") as f:
@@ -43,11 +108,137 @@ def get_engine(onnx_model_name, trt_model_name):
         return engine
 
 
+def get_engine_cached(onnx_model_name, trt_model_name, profiles, fp16=True, calibration=None,
+                      make_calibrator=None, input_shape=None, cache_dir=DEFAULT_CACHE_DIR, **extra):
+    """
+    get_engine() skipped when an engine for the same onnx content, precision, profiles, calibration images
+    and tensorRT version is cached
+    :param calibration: calibration directory or dataset.txt, hashed into the key of int8 engines
+    :param make_calibrator: callable creating the calibrator, only called when the engine has to be built
+    :param input_shape: see get_engine
+    :param extra: other options changing the engine, hashed into the key
+    """
+    precision = 'int8' if make_calibrator is not None else 'fp16' if fp16 else 'fp32'
+    key, fields = artifact_key(onnx_model_name, precision, [p.to_dict() for p in profiles] or input_shape,
+                               calibration=calibration if make_calibrator is not None else None,
+                               toolkit='tensorrt==' + trt.__version__, fp16=fp16, **extra)
+
+    def build(tmp_path):
+        calibrator = make_calibrator() if make_calibrator is not None else None
+        get_engine(onnx_model_name, tmp_path, profiles, fp16, calibrator, input_shape)
+
+    cache = ArtifactCache(cache_dir)
+    path = cache.get_or_build(key, build, '.trt', fields)
+    print('engine {} -> {}'.format(path, trt_model_name))
+    copy_atomic(path, trt_model_name)
+
+
+def parse_range(text):
+    """
+    '4' -> (4, 4, 4), '1,4,8' -> (1, 4, 8)
+    """
+    values = tuple(int(v) for v in text.split(','))
+    return values * 3 if len(values) == 1 else values
+
+
+def parse_camera(text):
+    """
+    'front=1920x1080' -> ('front', (1920, 1080))
+    """
+    name, size = text.split('=')
+    img_w, img_h = size.lower().split('x')
+    return name, (int(img_w), int(img_h))
+
+
 def main():
-    onnx_file_path = './yolov5_p6_512x512_6head.onnx'
-    engine_file_path = './yolov5_p6_512x512_6head.trt'
+    parser = argparse.ArgumentParser(description='build a tensorRT engine with optimization profiles')
+    parser.add_argument('--onnx', type=str, default='./yolov5_p6_512x512_6head.onnx')
+    parser.add_argument('--engine', type=str, default='./yolov5_p6_512x512_6head.trt')
+    parser.add_argument('--batch', type=str, default='1', help='batch size or min,opt,max')
+    parser.add_argument('--height', type=str, default='512', help='input height or min,opt,max')
+    parser.add_argument('--width', type=str, default='512', help='input width or min,opt,max')
+    parser.add_argument('--camera', type=str, action='append', default=[],
+                        help='name=WxH, adds a profile for the rect input of that camera, repeatable')
+    parser.add_argument('--long_side', type=int, default=None,
+                        help='long side of the camera profiles, defaults to the model input size')
+    parser.add_argument('--slots', type=int, default=2,
+                        help='copies of every profile, one per frame TensorRTBackend keeps in flight')
+    parser.add_argument('--fp32', action='store_true')
+    parser.add_argument('--int8', action='store_true', help='int8 engine calibrated on --calib images')
+    parser.add_argument('--calib', type=str, default='../rknn_yolov5p6/dataset.txt',
+                        help='calibration image directory, dataset.txt list or archive from yolov5p6.calib_archive')
+    parser.add_argument('--calib_num', type=int, default=None, help='use at most this many calibration images')
+    parser.add_argument('--calib_batch', type=int, default=None,
+                        help='calibration batch size, defaults to 8, or to --batch for a fixed shape engine')
+    parser.add_argument('--calib_cache', type=str, default='./yolov5_p6_512x512_6head.calib',
+                        help='calibration table, a digest of the calibration data and preprocessing is added to '
+                             'the name, calibration is skipped when that file exists')
+    parser.add_argument('--cache_dir', type=str, default=DEFAULT_CACHE_DIR,
+                        help='reuse engines built from the same onnx and options')
+    parser.add_argument('--no_cache', action='store_true')
+    args = parser.parse_args()
+
+    batch, height, width = parse_range(args.batch), parse_range(args.height), parse_range(args.width)
+    input_shape = None
+    if args.camera or any(len(set(r)) > 1 for r in (batch, height, width)):
+        profiles = [make_profile('default', batch, height, width)]
+        profiles += camera_profiles(YOLOV5P6_512X512, dict(parse_camera(c) for c in args.camera), batch=batch,
+                                    long_side=args.long_side)
+        # 同时运行的 context 各需要一个 profile
+        profiles = replicate_profiles(profiles, args.slots)
+        calib_batch = args.calib_batch or 8
+    else:
+        # 没有范围和摄像头时与之前一样生成固定输入尺寸的 engine，不需要 profile
+        profiles = []
+        input_shape = (batch[0], 3, height[0], width[0])
+        calib_batch = args.calib_batch or batch[0]
+        if calib_batch != batch[0]:
+            parser.error('a fixed shape engine calibrates with its own batch {}, got --calib_batch {}'.format(
+                batch[0], calib_batch))
+
+    make_calibrator = None
+    if args.int8:
+        spec = YOLOV5P6_512X512
+        shape = (calib_batch, 3, spec.input_h, spec.input_w)
+        if os.path.isfile(args.calib) and not args.calib.endswith('.txt'):
+            # 预处理好的校准数据包，直接按 batch 读取
+            archive = CalibArchive(args.calib)
+            if archive.input_size != (spec.input_h, spec.input_w):
+                parser.error('archive samples are {}, the network input is {}'.format(archive.input_size, shape[2:]))
+            num = len(archive)
+            # 数据包的预处理参数在文件里，参与摘要
+            calib_cache = calibration_cache_path(args.calib_cache, [args.calib], {'batch_size': calib_batch})
+
+            def batches():
+                return archive.float_batches(calib_batch)
+        else:
+            files = select_images(args.calib, args.calib_num)
+            num = len(files)
+            calib_cache = calibration_cache_path(args.calib_cache, files, preprocess_settings(spec, calib_batch))
+
+            def batches():
+                return calibration_batches(files, spec, calib_batch)
+        print('{} calibration images from {}, calibration table {}'.format(num, args.calib, calib_cache))
+        if num < calib_batch and not os.path.exists(calib_cache):
+            parser.error('{} calibration images are less than one batch of {}'.format(num, calib_batch))
+
+        def make_calibrator():
+            return Int8EntropyCalibrator(batches(), shape, calib_cache)
 
-    engine = get_engine(onnx_file_path, engine_file_path)
+    if args.no_cache:
+        get_engine(args.onnx, args.engine, profiles, fp16=not args.fp32,
+                   calibrator=make_calibrator() if make_calibrator is not None else None, input_shape=input_shape)
+    else:
+        get_engine_cached(args.onnx, args.engine, profiles, fp16=not args.fp32, calibration=args.calib,
+                          make_calibrator=make_calibrator, input_shape=input_shape, cache_dir=args.cache_dir,
+                          calib_num=args.calib_num if args.int8 else None,
+                          calib_batch=calib_batch if args.int8 else None)
+    if profiles:
+        # 运行时根据这个文件选择与输入尺寸匹配的 profile
+        save_profiles(sidecar_path(args.engine), profiles)
+    elif os.path.exists(sidecar_path(args.engine)):
+        # 之前生成的动态 engine 留下的文件
+        os.remove(sidecar_path(args.engine))
 
 
 if __name__ == '__main__':
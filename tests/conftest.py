@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 仓库没有安装包，测试直接从源码目录导入 yolov5p6
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
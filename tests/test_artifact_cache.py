@@ -0,0 +1,195 @@
+import os
+import threading
+import time
+
+import pytest
+
+from yolov5p6.artifact_cache import (LOCK_EXT, ArtifactCache, artifact_key, lock_owner, pack_files, read_lock,
+                                     unpack_files)
+
+
+class FakeConverter(object):
+    """
+    writes a deterministic artifact and counts how often it ran
+    """
+
+    def __init__(self, content=b'engine', delay=0.0):
+        self.content = content
+        self.delay = delay
+        self.calls = 0
+
+    def __call__(self, path):
+        self.calls += 1
+        time.sleep(self.delay)
+        with open(path, 'wb') as f:
+            f.write(self.content)
+
+
+@pytest.fixture
+def source(tmpdir):
+    path = os.path.join(str(tmpdir), 'model.onnx')
+    with open(path, 'wb') as f:
+        f.write(b'onnx')
+    return path
+
+
+def test_key_changes_with_every_input(tmpdir, source):
+    calib = tmpdir.mkdir('calib')
+    calib.join('a.jpg').write('a')
+    base, fields = artifact_key(source, 'int8', [1, 3, 512, 512], str(calib), 'tensorrt==7.2.3.4')
+    assert fields['precision'] == 'int8'
+    assert artifact_key(source, 'int8', [1, 3, 512, 512], str(calib), 'tensorrt==7.2.3.4')[0] == base
+
+    keys = [
+        artifact_key(source, 'fp16', [1, 3, 512, 512], str(calib), 'tensorrt==7.2.3.4')[0],
+        artifact_key(source, 'int8', [1, 3, 384, 640], str(calib), 'tensorrt==7.2.3.4')[0],
+        artifact_key(source, 'int8', [1, 3, 512, 512], str(calib), 'tensorrt==8.0')[0],
+        artifact_key(source, 'int8', [1, 3, 512, 512], str(calib), 'tensorrt==7.2.3.4', calib_batch=8)[0],
+    ]
+    calib.join('b.jpg').write('b')
+    keys.append(artifact_key(source, 'int8', [1, 3, 512, 512], str(calib), 'tensorrt==7.2.3.4')[0])
+    with open(source, 'ab') as f:
+        f.write(b'changed')
+    keys.append(artifact_key(source, 'int8', [1, 3, 512, 512], str(calib), 'tensorrt==7.2.3.4')[0])
+    assert len(set(keys + [base])) == len(keys) + 1
+
+
+def test_converter_skipped_on_hit(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join('cache')))
+    convert = FakeConverter()
+    path = cache.get_or_build('k', convert, '.trt', {'precision': 'fp16'})
+    assert path.endswith('k.trt') and open(path, 'rb').read() == b'engine'
+    assert cache.get_or_build('k', convert, '.trt') == path
+    assert convert.calls == 1
+    # 没有临时文件和锁文件残留
+    assert sorted(os.listdir(cache.root)) == ['k.meta.json', 'k.trt']
+
+
+def test_failed_conversion_leaves_nothing(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join('cache')))
+
+    def broken(path):
+        with open(path, 'wb') as f:
+            f.write(b'partial')
+        raise RuntimeError('converter crashed')
+
+    with pytest.raises(RuntimeError):
+        cache.get_or_build('k', broken, '.trt')
+    assert os.listdir(cache.root) == []
+    assert cache.get('k') is None
+
+
+def test_concurrent_workers_convert_once(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join('cache')))
+    convert = FakeConverter(delay=0.2)
+    paths = []
+    workers = [threading.Thread(target=lambda: paths.append(cache.get_or_build('k', convert, '.bin', poll=0.01)))
+               for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert convert.calls == 1
+    assert len(set(paths)) == 1 and len(paths) == 4
+
+
+def test_lock_of_a_running_owner_is_not_broken(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join('cache')), lock_timeout=0)
+    lock_path = cache.path('k', LOCK_EXT)
+    with open(lock_path, 'w') as f:
+        f.write(lock_owner())
+    os.utime(lock_path, (time.time() - 100, time.time() - 100))
+    # 锁的持有者（本进程）仍在运行，超时也不删除
+    cache._break_stale_lock(lock_path)
+    assert os.path.exists(lock_path)
+
+
+def test_stale_lock_of_a_dead_owner_is_broken(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join('cache')), lock_timeout=10)
+    lock_path = cache.path('k', LOCK_EXT)
+    host, _, token = lock_owner().split()
+    with open(lock_path, 'w') as f:
+        f.write('%s %d %s' % (host, 2 ** 22 + 1, token))
+    convert = FakeConverter()
+    os.utime(lock_path, (time.time() - 5, time.time() - 5))
+    cache._break_stale_lock(lock_path)
+    assert os.path.exists(lock_path)
+
+    os.utime(lock_path, (time.time() - 100, time.time() - 100))
+    assert cache.get_or_build('k', convert, poll=0.01) == cache.path('k')
+    assert convert.calls == 1 and not os.path.exists(lock_path)
+
+
+def test_lock_taken_over_by_another_worker_is_kept(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join('cache')))
+    lock_path = cache.path('k', LOCK_EXT)
+    other = lock_owner()
+
+    def build(path):
+        # 转换期间锁被当作过期删除，另一个进程重新获取了它
+        os.remove(lock_path)
+        with open(lock_path, 'w') as f:
+            f.write(other)
+        FakeConverter()(path)
+
+    cache.get_or_build('k', build)
+    assert read_lock(lock_path) == other
+
+
+def test_eviction_by_age_and_size(tmpdir):
+    fill = ArtifactCache(str(tmpdir.join('cache')))
+    now = time.time()
+    for index, key in enumerate(['old', 'a', 'b', 'c']):
+        path = fill.get_or_build(key, FakeConverter(b'x' * 100))
+        used = now - 5000 if key == 'old' else now - 100 + index
+        os.utime(path, (used, used))
+    cache = ArtifactCache(fill.root, max_bytes=250, max_age=1000)
+    cache.get('a')
+
+    # old 超过 max_age，之后按最近使用时间淘汰到 250 字节以内，刚用过的 a 保留
+    assert cache.evict(now=now + 1) == ['old', 'b']
+    assert [entry[2] for entry in cache.entries()] == ['c', 'a']
+    assert cache.get('b') is None
+
+
+def test_evict_keeps_the_returned_artifact(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join('cache')), max_bytes=50)
+    cache.get_or_build('a', FakeConverter(b'x' * 100))
+    path = cache.get_or_build('b', FakeConverter(b'y' * 100))
+    assert os.path.exists(path)
+    assert cache.get('a') is None
+
+
+def test_artifact_evicted_during_get_is_a_miss(tmpdir):
+    cache = ArtifactCache(str(tmpdir.join('cache')))
+    convert = FakeConverter()
+    cache.get_or_build('k', convert, '.trt')
+    artifact_path = cache._artifact_path
+
+    def evicted_after_check(key):
+        # 另一个进程在存在检查之后、更新时间之前淘汰了它
+        path = artifact_path(key)
+        ArtifactCache(cache.root).remove(key)
+        return path
+
+    cache._artifact_path = evicted_after_check
+    assert cache.get('k') is None
+    cache._artifact_path = artifact_path
+    path = cache.get_or_build('k', convert, '.trt')
+    assert os.path.exists(path) and convert.calls == 2
+
+
+def test_pack_and_unpack_several_outputs(tmpdir):
+    files = []
+    for name, content in [('model.bin', b'bin'), ('model_quantized_model.onnx', b'onnx')]:
+        path = str(tmpdir.join(name))
+        with open(path, 'wb') as f:
+            f.write(content)
+        files.append(path)
+    bundle = str(tmpdir.join('bundle.zip'))
+    pack_files(files, bundle)
+
+    # 目标目录不存在时自动创建
+    restored = [str(tmpdir.join('out', os.path.basename(f))) for f in files]
+    unpack_files(bundle, restored)
+    assert [open(p, 'rb').read() for p in restored] == [b'bin', b'onnx']
@@ -0,0 +1,40 @@
+import cv2
+import numpy as np
+
+from yolov5p6 import YOLOV5P6_512X512
+from yolov5p6.calib_archive import CalibArchive, build_archive
+
+HORIZON = YOLOV5P6_512X512.replace(input_w=672, input_h=672, letterbox=True, pad_position='boundary', pad_value=127)
+
+
+def pad_resize(image, target_h, target_w, pad_value=127):
+    # 地平线 PadResizeTransformer 的做法：图片放在左上角，右侧和下方填充
+    scale = min(target_w / image.shape[1], target_h / image.shape[0])
+    new_h, new_w = int(scale * image.shape[0]), int(scale * image.shape[1])
+    out = np.full((target_h, target_w, 3), pad_value, dtype=np.uint8)
+    out[:new_h, :new_w] = cv2.resize(image, (new_w, new_h))
+    return out
+
+
+def test_boundary_archive_matches_horizon_transformers(tmpdir):
+    rng = np.random.default_rng(0)
+    images = {'a.jpg': rng.integers(0, 256, (1080, 1920, 3), dtype=np.uint8),
+              'b.jpg': rng.integers(0, 256, (480, 640, 3), dtype=np.uint8)}
+    path = str(tmpdir.join('horizon.calset'))
+    assert build_archive(sorted(images), path, HORIZON, read=images.get) == 2
+
+    archive = CalibArchive(path)
+    assert archive.header['pad_position'] == 'boundary'
+    assert archive.header['pad_value'] == 127
+    for name, sample in archive.samples():
+        # PadResizeTransformer -> HWC2CHW -> BGR2RGB
+        expected = pad_resize(images[name], 672, 672)[..., ::-1].transpose((2, 0, 1))
+        np.testing.assert_array_equal(sample, expected)
+
+
+def test_center_archive_keeps_yolov5_padding(tmpdir):
+    image = np.zeros((256, 512, 3), dtype=np.uint8)
+    path = str(tmpdir.join('center.calset'))
+    build_archive(['a.jpg'], path, YOLOV5P6_512X512.replace(letterbox=True), read=lambda _: image)
+    sample = CalibArchive(path)[0]
+    assert (sample[:, :128] == 114).all() and (sample[:, 128:384] == 0).all() and (sample[:, 384:] == 114).all()
@@ -0,0 +1,116 @@
+import os
+
+import cv2
+import numpy as np
+
+from yolov5p6 import YOLOV5P6_512X512, Preprocessor
+from yolov5p6.calibration import (CalibrationStream, calibration_batches, calibration_cache_path,
+                                   preprocess_settings, select_images, write_dataset_txt)
+
+SPEC = YOLOV5P6_512X512.replace(input_w=64, input_h=64)
+
+
+class StubDevice(object):
+    """
+    stands in for the pycuda copy of the calibrator: keeps a copy of every batch and returns a fake pointer
+    """
+
+    def __init__(self):
+        self.copies = []
+
+    def __call__(self, batch):
+        self.copies.append(batch.copy())
+        return 1000 + len(self.copies)
+
+
+def write_images(tmpdir, count):
+    files = []
+    for index in range(count):
+        path = os.path.join(str(tmpdir), '%03d.jpg' % index)
+        cv2.imwrite(path, np.full((48, 80, 3), index * 20, dtype=np.uint8))
+        files.append(path)
+    return files
+
+
+def test_select_images_from_dir_and_list(tmpdir):
+    files = write_images(tmpdir, 10)
+    open(os.path.join(str(tmpdir), 'notes.txt'), 'w').close()
+    assert select_images(str(tmpdir)) == files
+
+    list_path = os.path.join(str(tmpdir), 'dataset.txt')
+    write_dataset_txt(files, list_path)
+    assert select_images(list_path) == [os.path.abspath(f) for f in files]
+    # 均匀抽取，包含首尾
+    assert select_images(list_path, 4) == [os.path.abspath(files[i]) for i in (0, 3, 6, 9)]
+
+
+def test_batches_are_preprocessed_like_inference_and_partial_batch_is_dropped(tmpdir):
+    files = write_images(tmpdir, 7)
+    stub = StubDevice()
+    stream = CalibrationStream(calibration_batches(files, SPEC, 3), 3, None, stub)
+
+    pointers = []
+    while True:
+        batch = stream.get_batch(['data'])
+        if batch is None:
+            break
+        pointers.append(batch)
+    # 7 张图，batch 3：两个完整 batch，最后 1 张不足一个 batch 被丢弃
+    assert pointers == [[1001], [1002]]
+    assert stream.count == 2
+    assert stream.get_batch(['data']) is None
+
+    preprocessor = Preprocessor(SPEC, swap_rb=True)
+    for index, copy in enumerate(stub.copies):
+        assert copy.shape == (3, 3, 64, 64) and copy.dtype == np.float32
+        for i in range(3):
+            expected = preprocessor(cv2.imread(files[index * 3 + i]))
+            np.testing.assert_array_equal(copy[i], expected.reshape(copy[i].shape))
+
+
+def test_unreadable_images_are_skipped(tmpdir):
+    files = write_images(tmpdir, 4)
+    files.insert(1, os.path.join(str(tmpdir), 'missing.jpg'))
+    batches = [b.copy() for b in calibration_batches(files, SPEC, 2)]
+    assert len(batches) == 2
+
+
+def test_calibration_cache_round_trip(tmpdir):
+    cache_file = os.path.join(str(tmpdir), 'model.calib')
+    stream = CalibrationStream([], 8, cache_file, StubDevice())
+    assert stream.read_calibration_cache() is None
+
+    table = b'TRT-7000-EntropyCalibration2\ndata: 3c010a14\n'
+    stream.write_calibration_cache(memoryview(table))
+    assert not os.path.exists(cache_file + '.tmp')
+
+    # 重新生成 engine 时读到同一份校准表，不再取 batch
+    rebuild = CalibrationStream(iter(()), 8, cache_file, StubDevice())
+    assert rebuild.read_calibration_cache() == table
+    assert rebuild.count == 0
+
+
+def test_no_cache_file_always_calibrates(tmpdir):
+    stream = CalibrationStream([], 8, None, StubDevice())
+    stream.write_calibration_cache(b'table')
+    assert stream.read_calibration_cache() is None
+    assert os.listdir(str(tmpdir)) == []
+
+
+def test_calibration_cache_keyed_on_data_and_preprocessing(tmpdir):
+    files = write_images(tmpdir, 4)
+    cache_file = os.path.join(str(tmpdir), 'model.calib')
+    path = calibration_cache_path(cache_file, files, preprocess_settings(SPEC, 2))
+    assert path.startswith(os.path.join(str(tmpdir), 'model.')) and path.endswith('.calib')
+    assert calibration_cache_path(cache_file, list(files), preprocess_settings(SPEC, 2)) == path
+
+    # 图片内容、图片列表、预处理和 batch 任何一个变化都换一个校准表
+    changed = [
+        calibration_cache_path(cache_file, files[:3], preprocess_settings(SPEC, 2)),
+        calibration_cache_path(cache_file, files, preprocess_settings(SPEC.replace(letterbox=True), 2)),
+        calibration_cache_path(cache_file, files, preprocess_settings(SPEC.replace(input_w=96), 2)),
+        calibration_cache_path(cache_file, files, preprocess_settings(SPEC, 4)),
+    ]
+    cv2.imwrite(files[0], np.full((48, 80, 3), 255, dtype=np.uint8))
+    changed.append(calibration_cache_path(cache_file, files, preprocess_settings(SPEC, 2)))
+    assert len({path} | set(changed)) == 1 + len(changed)
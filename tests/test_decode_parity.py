@@ -0,0 +1,143 @@
+from math import exp
+
+import numpy as np
+import pytest
+
+from yolov5p6 import NMS, YOLOV5N_640X384, YOLOV5P6_512X512, decode
+
+
+class LegacyBox(object):
+    def __init__(self, classId, score, xmin, ymin, xmax, ymax):
+        self.classId = classId
+        self.score = score
+        self.xmin = xmin
+        self.ymin = ymin
+        self.xmax = xmax
+        self.ymax = ymax
+
+
+def legacy_sigmoid(x):
+    return 1 / (1 + exp(-x))
+
+
+def legacy_postprocess(out, img_h, img_w, spec):
+    """
+    the per cell loop postprocess() of the demos used before decode(), only the constants come from spec
+    """
+    # numpy < 2 promoted the float32 scalars to python floats, tolist() keeps that arithmetic on numpy 2
+    output = [y.reshape((-1)).tolist() for y in out]
+    gs = 4 + 1 + spec.class_num
+    scale_h = img_h / spec.input_h
+    scale_w = img_w / spec.input_w
+    act = (lambda v: v) if spec.presigmoid else legacy_sigmoid
+
+    detectResult = []
+    for head in range(spec.output_head):
+        y = output[head]
+        grid_h, grid_w = spec.cell_size[head]
+        stride = spec.strides[head]
+        for h in range(grid_h):
+            for w in range(grid_w):
+                for a in range(spec.anchor_num):
+                    conf_scale = act(y[((a * gs + 4) * grid_h * grid_w) + h * grid_w + w])
+                    for cl in range(spec.class_num):
+                        conf = act(y[((a * gs + 5 + cl) * grid_h * grid_w) + h * grid_w + w]) * conf_scale
+
+                        if conf > spec.obj_thre[cl]:
+                            bx = (act(y[((a * gs + 0) * grid_h * grid_w) + h * grid_w + w]) * 2.0 - 0.5 + w) * stride
+                            by = (act(y[((a * gs + 1) * grid_h * grid_w) + h * grid_w + w]) * 2.0 - 0.5 + h) * stride
+                            bw = pow((act(y[((a * gs + 2) * grid_h * grid_w) + h * grid_w + w]) * 2), 2) * \
+                                spec.anchors[head][a][0]
+                            bh = pow((act(y[((a * gs + 3) * grid_h * grid_w) + h * grid_w + w]) * 2), 2) * \
+                                spec.anchors[head][a][1]
+
+                            xmin = (bx - bw / 2) * scale_w
+                            ymin = (by - bh / 2) * scale_h
+                            xmax = (bx + bw / 2) * scale_w
+                            ymax = (by + bh / 2) * scale_h
+
+                            xmin = xmin if xmin > 0 else 0
+                            ymin = ymin if ymin > 0 else 0
+                            xmax = xmax if xmax < img_w else img_w
+                            ymax = ymax if ymax < img_h else img_h
+
+                            if xmin >= 0 and ymin >= 0 and xmax <= img_w and ymax <= img_h:
+                                detectResult.append(LegacyBox(cl, conf, xmin, ymin, xmax, ymax))
+    return detectResult
+
+
+def legacy_iou(xmin1, ymin1, xmax1, ymax1, xmin2, ymin2, xmax2, ymax2):
+    innerWidth = max(min(xmax1, xmax2) - max(xmin1, xmin2), 0)
+    innerHeight = max(min(ymax1, ymax2) - max(ymin1, ymin2), 0)
+    innerArea = innerWidth * innerHeight
+    area1 = (xmax1 - xmin1) * (ymax1 - ymin1)
+    area2 = (xmax2 - xmin2) * (ymax2 - ymin2)
+    return innerArea / (area1 + area2 - innerArea)
+
+
+def legacy_nms(detectResult, nms_thre):
+    predBoxs = []
+    sort_detectboxs = sorted(detectResult, key=lambda x: x.score, reverse=True)
+    for i in range(len(sort_detectboxs)):
+        box = sort_detectboxs[i]
+        if box.classId != -1:
+            predBoxs.append(box)
+            for other in sort_detectboxs[i + 1:]:
+                if box.classId == other.classId and legacy_iou(box.xmin, box.ymin, box.xmax, box.ymax, other.xmin,
+                                                               other.ymin, other.xmax, other.ymax) > nms_thre:
+                    other.classId = -1
+    return predBoxs
+
+
+def synthetic_heads(spec, seed):
+    """
+    seeded raw head outputs with enough cells above the thresholds to give overlapping candidates
+    """
+    rng = np.random.default_rng(seed)
+    gs = 4 + 1 + spec.class_num
+    out = []
+    for grid_h, grid_w in spec.cell_size:
+        y = rng.normal(0, 1.5, (1, spec.anchor_num, gs, grid_h, grid_w)).astype(np.float32)
+        y[:, :, 4:] += rng.choice([-4.0, 2.0], (1, spec.anchor_num, 1, grid_h, grid_w), p=[0.97, 0.03])
+        if spec.presigmoid:
+            y = (1 / (1 + np.exp(-y))).astype(np.float32)
+        out.append(y.reshape((1, spec.anchor_num * gs, grid_h, grid_w)))
+    return out
+
+
+def assert_same(values, legacy, spec):
+    """
+    presigmoid outputs take exactly the same float64 arithmetic as the loop. np.exp and math.exp may round the
+    last bit differently, so after a sigmoid the values are compared to float64 rounding
+    """
+    if spec.presigmoid:
+        np.testing.assert_array_equal(values, legacy)
+    else:
+        np.testing.assert_allclose(values, legacy, rtol=1e-13, atol=1e-9)
+
+
+SPECS = [YOLOV5P6_512X512.replace(early_reject=False), YOLOV5P6_512X512.replace(early_reject=True),
+         YOLOV5N_640X384.replace(early_reject=False), YOLOV5N_640X384.replace(early_reject=True)]
+
+
+@pytest.mark.parametrize('spec', SPECS, ids=['sigmoid', 'sigmoid-early', 'presigmoid', 'presigmoid-early'])
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_decode_matches_legacy_loop(spec, seed):
+    out = synthetic_heads(spec, seed)
+    # caffe 模型按名字返回输出
+    out_arg = dict(zip(spec.output_names, out)) if spec.output_names is not None else out
+    img_h, img_w = 1080, 1920
+    legacy = legacy_postprocess(out, img_h, img_w, spec)
+    boxes, scores, class_ids = decode(out_arg, img_h, img_w, spec)
+
+    # 候选框的数量、顺序和类别完全一致
+    assert len(legacy) > 100
+    np.testing.assert_array_equal(class_ids, [b.classId for b in legacy])
+    assert_same(scores, [b.score for b in legacy], spec)
+    assert_same(boxes, [[b.xmin, b.ymin, b.xmax, b.ymax] for b in legacy], spec)
+
+    keep = NMS(boxes, scores, class_ids, spec.nms_thre, None, None)
+    kept = legacy_nms(legacy, spec.nms_thre)
+    np.testing.assert_array_equal(class_ids[keep], [b.classId for b in kept])
+    assert_same(scores[keep], [b.score for b in kept], spec)
+    assert_same(boxes[keep], [[b.xmin, b.ymin, b.xmax, b.ymax] for b in kept], spec)
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+from yolov5p6 import YOLOV5P6_512X512, DetectBox, Detections, load_detections, postprocess, save_detections
+from test_decode_parity import legacy_nms, legacy_postprocess, synthetic_heads
+
+
+def random_detections(n, seed=0):
+    rng = np.random.default_rng(seed)
+    xy = rng.uniform(0, 1000, (n, 2))
+    wh = rng.uniform(1, 200, (n, 2))
+    return Detections(np.concatenate((xy, xy + wh), axis=1), rng.random(n), rng.integers(0, 2, n))
+
+
+def assert_equal(a, b):
+    np.testing.assert_array_equal(a.boxes, b.boxes)
+    np.testing.assert_array_equal(a.scores, b.scores)
+    np.testing.assert_array_equal(a.class_ids, b.class_ids)
+
+
+def test_dtypes_and_length_check():
+    d = random_detections(5)
+    assert (d.boxes.dtype, d.scores.dtype, d.class_ids.dtype) == (np.float32, np.float32, np.uint8)
+    with pytest.raises(ValueError):
+        Detections(np.zeros((3, 4)), np.zeros(2), np.zeros(3))
+
+
+def test_indexing_and_slicing():
+    d = random_detections(10)
+    box = d[3]
+    assert isinstance(box, DetectBox)
+    assert (box.classId, box.score) == (int(d.class_ids[3]), float(d.scores[3]))
+    assert [box.xmin, box.ymin, box.xmax, box.ymax] == d.boxes[3].tolist()
+    assert d[-1].score == float(d.scores[-1])
+
+    part = d[2:7]
+    assert len(part) == 5
+    # 切片是视图
+    assert np.shares_memory(part.boxes, d.boxes)
+    assert_equal(part, Detections(d.boxes[2:7], d.scores[2:7], d.class_ids[2:7]))
+    assert_equal(d[np.array([4, 1])], Detections(d.boxes[[4, 1]], d.scores[[4, 1]], d.class_ids[[4, 1]]))
+    mask = d.scores >= 0.5
+    assert len(d[mask]) == int(mask.sum())
+    assert_equal(d[mask], d.filter(min_score=0.5))
+    assert len(d[:0]) == 0
+
+
+@pytest.mark.parametrize('n', [0, 1, 37])
+def test_bytes_round_trip(n):
+    d = random_detections(n)
+    data = d.to_bytes()
+    assert len(data) == 4 + 21 * n
+    assert_equal(Detections.from_bytes(data), d)
+
+
+def test_save_load_round_trip(tmpdir):
+    frames = [random_detections(n, seed) for seed, n in enumerate([3, 0, 12, 1])]
+    path = str(tmpdir.join('video.npz'))
+    save_detections(path, frames)
+    loaded = load_detections(path)
+    assert len(loaded) == len(frames)
+    for a, b in zip(loaded, frames):
+        assert_equal(a, b)
+
+
+def test_split_is_the_inverse_of_concat():
+    frames = [random_detections(n, seed) for seed, n in enumerate([4, 0, 2])]
+    merged = Detections.concat(frames)
+    assert len(merged) == 6
+    for a, b in zip(merged.split([4, 0, 2]), frames):
+        assert_equal(a, b)
+    with pytest.raises(ValueError):
+        merged.split([4, 1])
+
+
+def test_matches_the_legacy_detectbox_list():
+    spec = YOLOV5P6_512X512.replace(nms_pre_topk=None, max_det=None)
+    out = synthetic_heads(spec, 0)
+    img_h, img_w = 1080, 1920
+    legacy = legacy_nms(legacy_postprocess(out, img_h, img_w, spec), spec.nms_thre)
+    predbox = postprocess(out, img_h, img_w, spec)
+
+    assert len(predbox) == len(legacy) > 0
+    for box, old in zip(predbox, legacy):
+        assert box.classId == old.classId
+        # Detections 按 float32 保存
+        assert box.score == pytest.approx(old.score, rel=1e-6)
+        np.testing.assert_allclose([box.xmin, box.ymin, box.xmax, box.ymax], [old.xmin, old.ymin, old.xmax, old.ymax],
+                                   rtol=1e-6, atol=1e-3)
+    # 再转回 DetectBox 列表也不变
+    assert_equal(Detections.from_boxes(list(predbox)), predbox)
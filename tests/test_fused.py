@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from yolov5p6 import YOLOV5N_640X384, YOLOV5P6_512X512, decode_batch, sigmoid
+from yolov5p6.benchmarks.decode import sparse_outputs
+from yolov5p6.pipeline import nms_boxes
+
+fused = pytest.importorskip('yolov5p6.fused')
+if fused.numba is None:
+    pytest.skip('numba is not installed', allow_module_level=True)
+
+IMG_SIZES = [(1080, 1920), (480, 640), (720, 720)]
+SPECS = {
+    'stretch': YOLOV5P6_512X512,
+    'letterbox': YOLOV5P6_512X512.replace(letterbox=True),
+    'presigmoid': YOLOV5N_640X384,
+    'presigmoid_letterbox': YOLOV5N_640X384.replace(letterbox=True),
+}
+
+
+def heads(spec, seed, objects=20):
+    out = sparse_outputs(spec, len(IMG_SIZES), objects, seed)
+    if spec.presigmoid:
+        # caffe 导出的模型在图中已经做了 sigmoid
+        out = [sigmoid(y).astype(np.float32) for y in out]
+    return out
+
+
+def reference(out, spec, cell_masks=None, img_sizes=IMG_SIZES):
+    return [nms_boxes(boxes, scores, class_ids, spec)
+            for boxes, scores, class_ids in decode_batch(out, img_sizes, spec, cell_masks)]
+
+
+def assert_same(expected, actual):
+    assert len(expected) == len(actual)
+    for ref, fast in zip(expected, actual):
+        assert len(ref) == len(fast)
+        np.testing.assert_array_equal(ref.class_ids, fast.class_ids)
+        # 只有 exp() 的最后一位可能不同
+        np.testing.assert_allclose(fast.boxes, ref.boxes, rtol=1e-5, atol=1e-3)
+        np.testing.assert_allclose(fast.scores, ref.scores, rtol=1e-5, atol=1e-6)
+
+
+@pytest.mark.parametrize('name', sorted(SPECS))
+@pytest.mark.parametrize('seed', range(3))
+def test_matches_numpy_decode_and_nms(name, seed):
+    spec = SPECS[name]
+    out = heads(spec, seed)
+    expected = reference(out, spec)
+    assert sum(len(d) for d in expected) > 0
+    assert_same(expected, fused.postprocess_batch(out, IMG_SIZES, spec))
+
+
+@pytest.mark.parametrize('name', ['stretch', 'letterbox', 'presigmoid'])
+def test_matches_numpy_with_cell_masks(name):
+    spec = SPECS[name]
+    out = heads(spec, 7)
+    rng = np.random.default_rng(7)
+    masks = [rng.random(size) < 0.5 for size in spec.cell_size]
+    expected = reference(out, spec, masks)
+    assert sum(len(d) for d in expected) < sum(len(d) for d in reference(out, spec))
+    assert_same(expected, fused.postprocess_batch(out, IMG_SIZES, spec, masks))
+
+
+def test_single_image_postprocess():
+    spec = SPECS['letterbox']
+    out = [y[:1] for y in heads(spec, 3)]
+    img_h, img_w = IMG_SIZES[0]
+    assert_same(reference(out, spec, img_sizes=IMG_SIZES[:1]), [fused.postprocess(out, img_h, img_w, spec)])
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+
+from yolov5p6 import YOLOV5P6_512X512, decode, letterbox_info, sigmoid
+from yolov5p6.benchmarks.decode import sparse_outputs
+from yolov5p6.decode import content_cells
+from yolov5p6.pipeline import nms_boxes
+
+SPEC = YOLOV5P6_512X512
+LETTERBOX = SPEC.replace(letterbox=True)
+SIZES = [(1080, 1920), (1920, 1080), (480, 640), (500, 500)]
+
+
+@pytest.mark.parametrize('img_h, img_w', SIZES)
+@pytest.mark.parametrize('seed', range(3))
+def test_letterbox_decode_unmaps_the_network_boxes(img_h, img_w, seed):
+    out = sparse_outputs(SPEC, 1, 40, seed)
+    # 网络输入尺寸的“原图”上拉伸 decode 得到网络坐标的框
+    net_boxes, net_scores, net_ids = decode(out, SPEC.input_h, SPEC.input_w, SPEC)
+    boxes, scores, class_ids = decode(out, img_h, img_w, LETTERBOX.replace(skip_padding=False))
+
+    info = letterbox_info(img_h, img_w, LETTERBOX)
+    expected = (net_boxes - [info.pad_x, info.pad_y, info.pad_x, info.pad_y]) / info.scale
+    # 与逐 cell 的旧实现一样，只把 min 裁到 0、max 裁到图像边界
+    expected[:, :2] = np.maximum(expected[:, :2], 0)
+    expected[:, 2:] = np.minimum(expected[:, 2:], [img_w, img_h])
+    assert len(boxes) > 0
+    np.testing.assert_array_equal(class_ids, net_ids)
+    np.testing.assert_array_equal(scores, net_scores)
+    np.testing.assert_allclose(boxes, expected, rtol=1e-6, atol=1e-3)
+
+
+def content_only(out, spec, info):
+    """
+    objectness of every anchor whose center falls outside the resized image pushed far below the threshold
+    """
+    out = [y.copy() for y in out]
+    gs = 5 + spec.class_num
+    for y, stride, (grid_h, grid_w) in zip(out, spec.strides, spec.cell_size):
+        y = y.reshape((spec.anchor_num, gs, grid_h, grid_w))
+        cx = (sigmoid(y[:, 0]) * 2 - 0.5 + np.arange(grid_w)) * stride
+        cy = (sigmoid(y[:, 1]) * 2 - 0.5 + np.arange(grid_h)[:, np.newaxis]) * stride
+        inside = (cx >= info.pad_x) & (cx < info.pad_x + info.new_w) & \
+            (cy >= info.pad_y) & (cy < info.pad_y + info.new_h)
+        y[:, 4][~inside] = -20
+    return out
+
+
+@pytest.mark.parametrize('img_h, img_w', SIZES)
+@pytest.mark.parametrize('seed', range(3))
+def test_skip_padding_keeps_every_content_detection(img_h, img_w, seed):
+    info = letterbox_info(img_h, img_w, LETTERBOX)
+    out = content_only(sparse_outputs(SPEC, 1, 60, seed), SPEC, info)
+    full = nms_boxes(*decode(out, img_h, img_w, LETTERBOX.replace(skip_padding=False)), LETTERBOX)
+    skipped = nms_boxes(*decode(out, img_h, img_w, LETTERBOX), LETTERBOX)
+    assert len(full) > 0
+    np.testing.assert_array_equal(skipped.class_ids, full.class_ids)
+    np.testing.assert_array_equal(skipped.scores, full.scores)
+    np.testing.assert_array_equal(skipped.boxes, full.boxes)
+
+
+def test_skip_padding_skips_rows_of_a_wide_frame():
+    info = letterbox_info(1080, 1920, LETTERBOX)
+    grid_h, grid_w = SPEC.cell_size[0]
+    row0, row1, col0, col1 = content_cells([info], SPEC.strides[0], grid_h, grid_w)
+    assert (col0, col1) == (0, grid_w)
+    assert row0 > 0 and row1 < grid_h
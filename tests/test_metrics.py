@@ -0,0 +1,131 @@
+import json
+
+import numpy as np
+import pytest
+
+from yolov5p6 import YOLOV5P6_512X512, fused, metrics, postprocess, postprocess_batch
+from yolov5p6.benchmarks.decode import sparse_outputs
+from yolov5p6.metrics import BUCKETS, Hook, MetricsCollector, MetricsExporter
+
+
+class Recorder(Hook):
+    def __init__(self):
+        self.timings = []
+        self.counts = []
+
+    def on_timing(self, stage, seconds):
+        self.timings.append((stage, seconds))
+
+    def on_count(self, name, class_ids):
+        self.counts.append((name, list(class_ids)))
+
+
+@pytest.fixture
+def hook():
+    hook = metrics.add_hook(Recorder())
+    yield hook
+    metrics.remove_hook(hook)
+
+
+def test_collector_aggregates_timings_and_counts():
+    collector = MetricsCollector(['car', 'ped'])
+    for seconds in (0.001, 0.003, 0.002):
+        collector.on_timing('nms', seconds)
+    collector.on_count('candidates', [0, 0, 1, 3])
+    collector.on_count('detections', [0, 1])
+    collector.on_count('detections', [])
+
+    snapshot = collector.snapshot()
+    nms = snapshot['stages']['nms']
+    assert nms['count'] == 3
+    assert nms['sum_s'] == pytest.approx(0.006)
+    assert nms['mean_ms'] == pytest.approx(2.0)
+    assert nms['max_ms'] == pytest.approx(3.0)
+    # 没有名字的类别按编号统计
+    assert snapshot['counts']['candidates'] == {'car': 2, 'ped': 1, '2': 0, '3': 1}
+    assert snapshot['counts']['detections'] == {'car': 1, 'ped': 1}
+    assert snapshot['images'] == 2
+
+
+def test_prometheus_text_format():
+    collector = MetricsCollector(['car', 'ped'], prefix='test')
+    collector.on_timing('decode', 0.0007)
+    collector.on_timing('decode', 0.02)
+    collector.on_timing('decode', 5.0)
+    collector.on_count('detections', [1, 1])
+    lines = collector.prometheus().splitlines()
+
+    assert '# TYPE test_stage_seconds histogram' in lines
+    buckets = [line for line in lines if line.startswith('test_stage_seconds_bucket{stage="decode"')]
+    assert len(buckets) == len(BUCKETS) + 1
+    values = [int(line.rsplit(' ', 1)[1]) for line in buckets]
+    # 累计计数，单调不减，+Inf 等于总数
+    assert values == sorted(values)
+    assert 'test_stage_seconds_bucket{stage="decode",le="0.001"} 1' in lines
+    assert 'test_stage_seconds_bucket{stage="decode",le="0.025"} 2' in lines
+    assert 'test_stage_seconds_bucket{stage="decode",le="+Inf"} 3' in lines
+    assert 'test_stage_seconds_count{stage="decode"} 3' in lines
+    assert float(next(line for line in lines if line.startswith('test_stage_seconds_sum')).split()[1]) == \
+        pytest.approx(5.0207)
+    assert 'test_detections_total{class="ped"} 2' in lines
+    assert 'test_images_total 1' in lines
+
+
+def test_exporter_writes_jsonl_and_prometheus(tmpdir):
+    jsonl_path = str(tmpdir.join('metrics.jsonl'))
+    prom_path = str(tmpdir.join('metrics.prom'))
+    collector = MetricsCollector()
+    with MetricsExporter(collector, interval=60, prometheus_path=prom_path, jsonl_path=jsonl_path):
+        assert collector in metrics.hooks
+        metrics.record('render', 0.004)
+        metrics.record_nms(np.array([0, 1]), np.array([0]))
+    assert collector not in metrics.hooks
+    collector.write_jsonl(jsonl_path)
+
+    with open(jsonl_path) as f:
+        snapshots = [json.loads(line) for line in f]
+    assert len(snapshots) == 2
+    assert snapshots[0]['stages']['render']['count'] == 1
+    assert snapshots[0]['counts']['detections'] == {'car': 1, 'ped': 0}
+    with open(prom_path) as f:
+        assert 'yolov5p6_images_total 1' in f.read()
+
+
+def test_no_hook_fast_path(monkeypatch):
+    assert not metrics.hooks
+
+    def fail(*args):
+        raise AssertionError('nothing should be recorded without hooks')
+    monkeypatch.setattr(metrics, 'record', fail)
+    monkeypatch.setattr(metrics.time, 'perf_counter', fail)
+
+    @metrics.timed('decode')
+    def work(x):
+        return x + 1
+    assert work(1) == 2
+
+    monkeypatch.setattr(metrics, 'AVAILABLE', False)
+
+    def plain(x):
+        return x
+    assert metrics.timed('decode')(plain) is plain
+
+
+@pytest.mark.parametrize('use_fused', [False, True], ids=['numpy', 'fused'])
+def test_postprocess_reports_decode_and_nms(hook, monkeypatch, use_fused):
+    if use_fused and fused.numba is None:
+        pytest.skip('numba is not installed')
+    monkeypatch.setattr(fused, 'ENABLED', use_fused)
+    spec = YOLOV5P6_512X512
+    out = sparse_outputs(spec, 2, 10)
+
+    postprocess_batch(out, [(1080, 1920), (720, 1280)], spec)
+    stages = [stage for stage, _ in hook.timings]
+    assert stages.count('decode') == 1
+    assert stages.count('nms') == 2
+    assert stages[-1] == 'postprocess'
+    assert [name for name, _ in hook.counts] == ['candidates', 'detections'] * 2
+
+    del hook.timings[:]
+    postprocess([y[:1] for y in out], 1080, 1920, spec)
+    assert sorted(stage for stage, _ in hook.timings) == ['decode', 'nms', 'postprocess']
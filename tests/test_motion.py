@@ -0,0 +1,73 @@
+import numpy as np
+
+from yolov5p6 import Detections, Detector, GatedDetector, MotionGate
+
+
+class CountingDetector(Detector):
+    def __init__(self):
+        self.calls = 0
+
+    def detect(self, image, cell_masks=None):
+        self.calls += 1
+        return Detections([[10, 10, 50, 50]], [0.9], [self.calls % 2])
+
+
+def scene(seed=0):
+    # 有纹理的静态背景，噪声不超过 pixel_thre
+    return np.random.default_rng(seed).integers(0, 200, (360, 640, 3), dtype=np.uint8)
+
+
+def test_static_frames_reuse_the_detections():
+    detector = CountingDetector()
+    gated = GatedDetector(detector, MotionGate(max_skip=100))
+    background = scene()
+    first, ran = gated.detect(background)
+    assert ran
+    rng = np.random.default_rng(1)
+    for _ in range(10):
+        noisy = np.clip(background.astype(np.int16) + rng.integers(-3, 4, background.shape), 0, 255).astype(np.uint8)
+        predbox, ran = gated.detect(noisy)
+        assert not ran
+        assert predbox is first
+    assert detector.calls == 1
+    assert gated.skip_ratio == 10 / 11
+
+
+def test_motion_above_the_threshold_runs_the_detector():
+    gate = MotionGate(threshold=0.01, max_skip=100)
+    frame = scene()
+    assert gate(frame)
+    moved = frame.copy()
+    # 变化的面积不到阈值时仍然跳过
+    moved[:10, :10] = 255
+    assert gate.score(gate.thumbnail(moved)) < 0.01
+    assert not gate(moved)
+    moved[100:200, 200:400] = 255
+    assert gate.score(gate.thumbnail(moved)) >= 0.01
+    assert gate(moved)
+
+    detector = CountingDetector()
+    gated = GatedDetector(detector, MotionGate(threshold=0.01, max_skip=100))
+    gated.detect(frame)
+    predbox, ran = gated.detect(moved)
+    assert ran and detector.calls == 2
+    assert predbox.class_ids.tolist() == [0]
+
+
+def test_forced_refresh_after_max_skip():
+    detector = CountingDetector()
+    gated = GatedDetector(detector, MotionGate(max_skip=3))
+    frame = scene()
+    ran = [gated.detect(frame)[1] for _ in range(9)]
+    # 第一帧之后每 max_skip + 1 帧强制推理一次
+    assert ran == [True, False, False, False, True, False, False, False, True]
+    assert detector.calls == 3
+
+
+def test_reset_runs_the_next_frame():
+    detector = CountingDetector()
+    gated = GatedDetector(detector, MotionGate(max_skip=100))
+    frame = scene()
+    gated.detect(frame)
+    gated.reset()
+    assert gated.detect(frame)[1]
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+from yolov5p6 import YOLOV5P6_512X512, Preprocessor
+from yolov5p6.benchmarks.preprocess import allocated_per_frame, reference_preprocess
+
+SPEC = YOLOV5P6_512X512
+
+
+@pytest.fixture
+def frame():
+    return np.random.default_rng(0).integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+
+
+def test_matches_reference_preprocessing(frame):
+    np.testing.assert_array_equal(Preprocessor(SPEC, swap_rb=True)(frame), reference_preprocess(frame, SPEC))
+
+
+@pytest.mark.parametrize('spec', [SPEC, SPEC.replace(letterbox=True)], ids=['resize', 'letterbox'])
+def test_no_per_frame_allocation_after_warmup(frame, spec):
+    preprocessor = Preprocessor(spec, swap_rb=True)
+    blob = preprocessor(frame)
+    net, peak = allocated_per_frame(preprocessor, (frame,), 20)
+    # 只剩转置视图之类的小对象，没有任何图像大小的临时数组
+    assert net <= 0
+    assert peak < 4096
+    assert preprocessor(frame) is blob
+
+
+def test_reference_allocates_every_frame(frame):
+    # 确认 tracemalloc 能看到 numpy 的图像缓冲区，上面的断言才有意义
+    _, peak = allocated_per_frame(reference_preprocess, (frame, SPEC), 2)
+    assert peak > 3 * SPEC.input_h * SPEC.input_w * 4
+
+
+def test_writes_into_a_caller_buffer(frame):
+    preprocessor = Preprocessor(SPEC, swap_rb=True)
+    batch = np.zeros((2, 3, SPEC.input_h, SPEC.input_w), dtype=np.float32)
+    preprocessor(frame, out=batch[1])
+    np.testing.assert_array_equal(batch[1], reference_preprocess(frame, SPEC)[0])
+    assert not batch[0].any()
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from yolov5p6 import YOLOV5P6_512X512, RegionOfInterest
+from yolov5p6.preprocess import letterbox_info
+
+SPEC = YOLOV5P6_512X512
+
+
+def random_polygon(rng, img_w, img_h, size):
+    center = rng.uniform((0.2 * img_w, 0.2 * img_h), (0.8 * img_w, 0.8 * img_h))
+    angles = np.sort(rng.uniform(0, 2 * np.pi, rng.integers(3, 9)))
+    radius = rng.uniform(0.1, 0.5, angles.size)[:, np.newaxis] * size
+    return center + radius * np.stack((np.cos(angles), np.sin(angles)), axis=1)
+
+
+@pytest.mark.parametrize('spec', [SPEC, SPEC.replace(letterbox=True)], ids=['resize', 'letterbox'])
+@pytest.mark.parametrize('size', [24, 120, 600], ids=['upscaled', 'small', 'large'])
+@pytest.mark.parametrize('seed', range(5))
+def test_cell_masks_keep_every_center_drop_outside_keeps(spec, size, seed):
+    rng = np.random.default_rng(seed)
+    img_w, img_h = 1920, 1080
+    # 小多边形的裁剪图被放大到网络输入，一个裁剪像素占多个网络像素，边缘差异最大
+    roi = RegionOfInterest(random_polygon(rng, img_w, img_h, size), spec, margin=int(rng.integers(0, 8)))
+    geometry = roi.geometry(img_h, img_w)
+    crop_h, crop_w = geometry.mask.shape
+
+    # 裁剪图上 drop_outside 保留的每个像素，像素内的任意中心点都要落在 decode 保留的 cell 能预测的范围内
+    cy, cx = np.nonzero(geometry.mask)
+    if spec.letterbox:
+        info = letterbox_info(crop_h, crop_w, spec)
+        sx = sy = info.scale
+        px, py = info.pad_x, info.pad_y
+    else:
+        sx, sy, px, py = spec.input_w / crop_w, spec.input_h / crop_h, 0, 0
+    for dx, dy in [(0, 0), (0.999, 0), (0, 0.999), (0.999, 0.999), (0.5, 0.5)]:
+        nx = (cx + dx) * sx + px
+        ny = (cy + dy) * sy + py
+        for stride, mask in zip(spec.strides, geometry.cell_masks):
+            # 中心可以落在 cell 的 [-0.5, 1.5) 范围内，只要有一个能覆盖它的 cell 被保留即可
+            covered = np.zeros(nx.shape, dtype=bool)
+            for ox in (-1, 0, 1):
+                for oy in (-1, 0, 1):
+                    gx = np.floor(nx / stride).astype(int) + ox
+                    gy = np.floor(ny / stride).astype(int) + oy
+                    inside = (gx >= 0) & (gx < mask.shape[1]) & (gy >= 0) & (gy < mask.shape[0])
+                    reach = (nx >= (gx - 0.5) * stride) & (nx < (gx + 1.5) * stride) & \
+                            (ny >= (gy - 0.5) * stride) & (ny < (gy + 1.5) * stride)
+                    keep = np.zeros(nx.shape, dtype=bool)
+                    keep[inside] = mask[gy[inside], gx[inside]]
+                    covered |= keep & reach
+            assert covered.all()
@@ -0,0 +1,109 @@
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+from yolov5p6 import Detections
+from yolov5p6.server import DetectServer, MicroBatcher, Overloaded, Stopped
+
+
+class IdleBatcher(object):
+    # 这些请求在解码图片之前就被拒绝，不会提交给 batcher
+    def submit(self, image):
+        raise AssertionError('no request should reach the batcher')
+
+
+@pytest.fixture
+def server():
+    server = DetectServer(('127.0.0.1', 0), IdleBatcher(), ['car', 'ped'], max_body_size=1024)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def post(server, headers, body=b''):
+    with socket.create_connection(server.server_address, timeout=5) as sock:
+        request = 'POST /detect HTTP/1.1\r\nHost: test\r\n' + ''.join('%s: %s\r\n' % h for h in headers) + '\r\n'
+        sock.sendall(request.encode() + body)
+        response = b''
+        while True:
+            data = sock.recv(65536)
+            if not data:
+                break
+            response += data
+    status_line, rest = response.split(b'\r\n', 1)
+    return int(status_line.split()[1]), rest
+
+
+@pytest.mark.parametrize('headers, code', [
+    ([], 411),
+    ([('Content-Length', 'abc')], 400),
+    ([('Content-Length', '-5')], 400),
+    ([('Content-Length', '1025')], 413),
+    ([('Transfer-Encoding', 'chunked')], 411),
+])
+def test_rejects_bad_content_length(server, headers, code):
+    status, rest = post(server, headers)
+    assert status == code
+    # body 没有读取，连接必须关闭，post() 读到 EOF 才返回
+    assert b'Connection: close' in rest
+
+
+def test_reads_a_body_within_the_limit(server):
+    status, _ = post(server, [('Content-Length', '4'), ('Connection', 'close')], b'junk')
+    assert status == 400
+
+
+class BlockingDetector(object):
+    # 第一个 batch 阻塞到 release 被设置，期间队列可以被填满
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.batches = []
+
+    def detect_batch(self, images):
+        self.started.set()
+        self.release.wait(10)
+        self.batches.append(len(images))
+        return [Detections(np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=np.int64)) for _ in images]
+
+
+def test_stop_with_a_full_queue_rejects_pending_images():
+    detector = BlockingDetector()
+    batcher = MicroBatcher(detector, max_batch_size=2, max_wait_ms=0, queue_size=3).start()
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    running = batcher.submit(image)
+    assert detector.started.wait(5)
+    pending = [batcher.submit(image) for _ in range(3)]
+    with pytest.raises(Overloaded):
+        batcher.submit(image)
+
+    stopper = threading.Thread(target=batcher.stop, daemon=True)
+    stopper.start()
+    detector.release.set()
+    stopper.join(5)
+    assert not stopper.is_alive(), 'stop() blocked on the full queue'
+
+    # 正在运行的 batch 正常返回，排队的图片被拒绝
+    assert running.result(5)[1] == 1
+    for future in pending:
+        with pytest.raises(Stopped):
+            future.result(5)
+    assert detector.batches == [1]
+    with pytest.raises(Stopped):
+        batcher.submit(image)
+
+
+def test_stop_idle_batcher_and_submit_after_stop():
+    detector = BlockingDetector()
+    detector.release.set()
+    batcher = MicroBatcher(detector, max_wait_ms=0).start()
+    image = np.zeros((8, 8, 3), dtype=np.uint8)
+    assert len(batcher.submit(image).result(5)[0]) == 0
+    batcher.stop()
+    batcher.stop()
+    with pytest.raises(Stopped):
+        batcher.submit(image)
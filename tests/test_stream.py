@@ -0,0 +1,113 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from yolov5p6 import YOLOV5P6_512X512
+from yolov5p6.stream import StreamRunner
+
+
+class StubBackend(object):
+    """
+    preprocess sleeps a frame dependent time so the workers finish out of order, run returns empty heads
+    """
+
+    def __init__(self, fail_at=None, fail_stage='run'):
+        self.spec = YOLOV5P6_512X512
+        self.fail_at = fail_at
+        self.fail_stage = fail_stage
+
+    def preprocess(self, image):
+        frame_id = int(image[0, 0, 0])
+        if self.fail_stage == 'preprocess' and frame_id == self.fail_at:
+            raise RuntimeError('preprocess failed at %d' % frame_id)
+        time.sleep(0.001 * (frame_id % 3))
+        return np.full((1, 1), frame_id, dtype=np.float32)
+
+    def run(self, data):
+        if self.fail_stage == 'run' and self.fail_at in data[:, 0].astype(int).tolist():
+            raise RuntimeError('run failed at %d' % self.fail_at)
+        spec = self.spec
+        gs = 4 + 1 + spec.class_num
+        # objectness 很低，没有检测框
+        return [np.full((len(data), spec.anchor_num * gs, h, w), -20, dtype=np.float32) for h, w in spec.cell_size]
+
+
+def frames(num):
+    for i in range(num):
+        yield 'frame_%03d.jpg' % i, np.full((36, 64, 3), i, dtype=np.uint8)
+
+
+class ListSink(object):
+    def __init__(self):
+        self.results = []
+
+    def __call__(self, frame_id, name, image, predbox):
+        self.results.append((frame_id, name, int(image[0, 0, 0]), len(predbox)))
+
+
+def run_with_timeout(runner, source, timeout=30):
+    # 出错时流水线不能卡住，在子线程里运行并限定时间
+    outcome = {}
+
+    def target():
+        try:
+            outcome['stats'] = runner.run(source)
+        except BaseException as e:
+            outcome['error'] = e
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), 'StreamRunner.run did not return'
+    return outcome
+
+
+@pytest.mark.parametrize('workers,batch_size', [(1, 1), (3, 1), (3, 4)])
+def test_results_in_input_order(workers, batch_size):
+    sink = ListSink()
+    runner = StreamRunner(StubBackend(), sink, preprocess_workers=workers, queue_size=2, batch_size=batch_size,
+                          draw=False)
+    outcome = run_with_timeout(runner, frames(40))
+    assert 'error' not in outcome
+    assert sink.results == [(i, 'frame_%03d.jpg' % i, i, 0) for i in range(40)]
+
+    stats = outcome['stats']
+    assert stats['read'].count == stats['preprocess'].count == stats['inference'].count == 40
+    assert stats['sink'].count == 40
+
+
+def test_stops_at_end_of_stream():
+    sink = ListSink()
+    runner = StreamRunner(StubBackend(), sink, preprocess_workers=2, draw=False)
+    before = set(threading.enumerate())
+    assert 'error' not in run_with_timeout(runner, frames(0))
+    assert sink.results == []
+    assert 'error' not in run_with_timeout(runner, frames(5))
+    assert len(sink.results) == 5
+    # 所有阶段的线程都已退出
+    assert set(threading.enumerate()) <= before
+
+
+@pytest.mark.parametrize('stage', ['preprocess', 'run'])
+def test_worker_exception_reaches_the_caller(stage):
+    sink = ListSink()
+    runner = StreamRunner(StubBackend(fail_at=7, fail_stage=stage), sink, preprocess_workers=2, queue_size=2,
+                          draw=False)
+    before = set(threading.enumerate())
+    outcome = run_with_timeout(runner, frames(1000))
+    assert isinstance(outcome.get('error'), RuntimeError)
+    assert 'failed at 7' in str(outcome['error'])
+    assert len(sink.results) < 1000
+    assert set(threading.enumerate()) <= before
+
+
+def test_sink_exception_reaches_the_caller():
+    def sink(frame_id, name, image, predbox):
+        if frame_id == 3:
+            raise IOError('disk full')
+
+    runner = StreamRunner(StubBackend(), sink, preprocess_workers=2, queue_size=2, draw=False)
+    outcome = run_with_timeout(runner, frames(1000))
+    assert isinstance(outcome.get('error'), IOError)
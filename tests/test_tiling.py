@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from yolov5p6 import YOLOV5P6_512X512, Detections, Detector, TiledDetector, tile_grid
+
+SPEC = YOLOV5P6_512X512
+
+
+@pytest.mark.parametrize('img_h, img_w', [(1080, 1920), (2160, 3840), (512, 512), (300, 400), (600, 2000)])
+@pytest.mark.parametrize('overlap', [0.0, 0.2, 0.5])
+def test_tiles_cover_the_frame_with_overlap(img_h, img_w, overlap):
+    tiles = tile_grid(img_h, img_w, 512, 512, overlap)
+    covered = np.zeros((img_h, img_w), dtype=bool)
+    for x0, y0, x1, y1 in tiles:
+        assert 0 <= x0 < x1 <= img_w and 0 <= y0 < y1 <= img_h
+        # 比图像小的方向上块大小就是网络输入
+        assert x1 - x0 == min(512, img_w) and y1 - y0 == min(512, img_h)
+        covered[y0:y1, x0:x1] = True
+    assert covered.all()
+
+    # 边上的块贴着图像的右边和下边
+    assert tiles[:, 2].max() == img_w and tiles[:, 3].max() == img_h
+    for axis, size in ((0, img_w), (1, img_h)):
+        starts = np.unique(tiles[:, axis])
+        if len(starts) > 1:
+            shared = 512 - np.diff(starts)
+            assert shared.min() >= overlap * 512 - 1
+
+
+def test_invalid_overlap():
+    with pytest.raises(ValueError):
+        tile_grid(1080, 1920, 512, 512, 1.0)
+
+
+class ObjectsDetector(Detector):
+    """
+    'sees' the given frame boxes that lie completely inside a crop, in crop coordinates
+    """
+
+    def __init__(self, objects, tiles):
+        self.spec = SPEC
+        self.objects = objects
+        self.tiles = tiles
+
+    def detect_batch(self, images, cell_masks=None):
+        rects = [tuple(t) for t in self.tiles] + [None] * (len(images) - len(self.tiles))
+        results = []
+        for rect in rects:
+            if rect is None:
+                # 缩小的整图只看到最大的目标
+                results.append(self.objects[self.objects.areas > 100 * 100])
+                continue
+            x0, y0, x1, y1 = rect
+            b = self.objects.boxes
+            inside = (b[:, 0] >= x0) & (b[:, 1] >= y0) & (b[:, 2] <= x1) & (b[:, 3] <= y1)
+            seen = self.objects[inside]
+            results.append(Detections(seen.boxes - [x0, y0, x0, y0], seen.scores, seen.class_ids))
+        return results
+
+
+def test_merge_moves_boxes_back_and_removes_seam_duplicates():
+    img_h, img_w = 1080, 1920
+    objects = Detections([[700, 300, 760, 360],     # 两个块的重叠区域内
+                          [100, 100, 140, 150],     # 只在第一个块
+                          [1800, 900, 1900, 1000],  # 右下角的块
+                          [300, 200, 700, 700]],    # 大目标，只有整图能看到
+                         [0.9, 0.8, 0.7, 0.6], [0, 1, 0, 1])
+    tiles = tile_grid(img_h, img_w, SPEC.input_h, SPEC.input_w, 0.2)
+    detector = ObjectsDetector(objects, tiles)
+    tiled = TiledDetector(detector, overlap=0.2)
+
+    seen_by = sum(len(d) for d in detector.detect_batch([None] * (len(tiles) + 1)))
+    assert seen_by > len(objects)
+    predbox = tiled.detect(np.zeros((img_h, img_w, 3), dtype=np.uint8))
+    order = np.argsort(-objects.scores)
+    np.testing.assert_allclose(predbox.boxes, objects.boxes[order])
+    np.testing.assert_array_equal(predbox.class_ids, objects.class_ids[order])
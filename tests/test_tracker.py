@@ -0,0 +1,152 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from yolov5p6 import Detections, Detector, box_iou, tracker
+from yolov5p6.tracker import ByteTracker, KalmanBoxFilter, TrackedDetector, components, hungarian, \
+    linear_assignment
+
+
+@pytest.mark.parametrize('shape', [(0, 3), (3, 0), (0, 0)])
+def test_empty_cost_matrix(shape):
+    matches, rows, cols = linear_assignment(np.zeros(shape), 0.8)
+    assert matches.shape == (0, 2)
+    np.testing.assert_array_equal(rows, np.arange(shape[0]))
+    np.testing.assert_array_equal(cols, np.arange(shape[1]))
+
+
+def test_assignment_takes_the_cheaper_pairs():
+    cost = np.array([[0.1, 0.9], [0.2, 0.3]])
+    matches, rows, cols = linear_assignment(cost, 0.8)
+    assert sorted(map(tuple, matches)) == [(0, 0), (1, 1)]
+    assert rows.size == 0 and cols.size == 0
+
+
+def test_box_iou_of_integer_boxes():
+    a = np.array([[0, 0, 10, 10], [0, 0, 0, 0]], dtype=np.int32)
+    b = np.array([[5, 0, 15, 10]], dtype=np.int64)
+    iou = box_iou(a, b)
+    assert iou.dtype.kind == 'f'
+    np.testing.assert_allclose(iou, [[1 / 3], [0]])
+    np.testing.assert_array_equal(iou, box_iou(a.astype(np.float64), b.astype(np.float64)))
+
+
+def brute_force(cost):
+    # 行少于列时枚举每一行选哪一列，否则转置
+    if cost.shape[0] > cost.shape[1]:
+        return brute_force(cost.T)
+    n, m = cost.shape
+    return min(sum(cost[i, j] for i, j in enumerate(cols)) for cols in itertools.permutations(range(m), n))
+
+
+@pytest.mark.parametrize('shape', [(3, 5), (5, 3), (4, 4), (1, 6), (6, 2)])
+@pytest.mark.parametrize('seed', range(5))
+def test_hungarian_is_optimal(shape, seed):
+    cost = np.random.default_rng(seed).random(shape)
+    rows, cols = hungarian(cost)
+    assert len(rows) == min(shape)
+    assert len(set(rows.tolist())) == len(rows) and len(set(cols.tolist())) == len(cols)
+    assert cost[rows, cols].sum() == pytest.approx(brute_force(cost))
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_fallback_linear_assignment_matches_brute_force(monkeypatch, seed):
+    monkeypatch.setattr(tracker, 'linear_sum_assignment', None)
+    rng = np.random.default_rng(seed)
+    cost = rng.random((4, 6))
+    max_cost = 0.6
+    matches, rows, cols = linear_assignment(cost, max_cost)
+    assert (cost[matches[:, 0], matches[:, 1]] <= max_cost).all()
+    assert sorted(rows.tolist() + matches[:, 0].tolist()) == list(range(4))
+    assert sorted(cols.tolist() + matches[:, 1].tolist()) == list(range(6))
+    # 不可接受的配对换成很大的代价后，最优解先保证匹配数最多，再让代价最小
+    padded = np.where(cost <= max_cost, cost, max_cost + 1e5)
+    best = brute_force(padded)
+    unmatched = min(cost.shape) - len(matches)
+    assert cost[matches[:, 0], matches[:, 1]].sum() + unmatched * (max_cost + 1e5) == pytest.approx(best)
+
+
+def test_components_of_separate_clusters():
+    valid = np.array([[1, 1, 0, 0],
+                      [0, 1, 0, 0],
+                      [0, 0, 0, 1],
+                      [0, 0, 0, 0]], dtype=bool)
+    row_label, col_label = components(valid)
+    assert row_label[0] == row_label[1] == col_label[0] == col_label[1]
+    assert row_label[2] == col_label[3] != row_label[0]
+
+
+def test_kalman_follows_constant_velocity():
+    kalman = KalmanBoxFilter()
+    mean, covariance = kalman.initiate(np.array([[100., 50., 20., 40.]]))
+    for step in range(1, 15):
+        mean, covariance = kalman.predict(mean, covariance)
+        before = covariance[0, 0, 0]
+        mean, covariance = kalman.update(mean, covariance, np.array([[100. + 5 * step, 50., 20., 40.]]))
+        # 观测之后位置的方差变小
+        assert covariance[0, 0, 0] < before
+    np.testing.assert_allclose(mean[0, 4], 5, atol=0.5)
+    mean, _ = kalman.predict(mean, covariance)
+    np.testing.assert_allclose(mean[0, :4], [175, 50, 20, 40], atol=1)
+
+
+def boxes_at(x, score=0.9, class_id=0):
+    return Detections([[x, 100, x + 40, 180]], [score], [class_id])
+
+
+def test_track_ids_stay_stable():
+    tracker = ByteTracker()
+    ids = []
+    for frame in range(10):
+        predbox = Detections([[100 + 4 * frame, 100, 140 + 4 * frame, 180],
+                              [400 - 4 * frame, 300, 460 - 4 * frame, 380]], [0.9, 0.8], [0, 1])
+        boxes, track_ids = tracker.update(predbox)
+        ids.append(sorted(track_ids.tolist()))
+        np.testing.assert_allclose(boxes.boxes[np.argsort(track_ids)], predbox.boxes, atol=3)
+    assert ids == [[1, 2]] * 10
+
+
+def test_low_score_detection_extends_a_track():
+    tracker = ByteTracker(high_thre=0.5, low_thre=0.1)
+    _, ids = tracker.update(boxes_at(100))
+    # 分数在 low_thre 和 high_thre 之间，只能在第二次关联中延续已有的轨迹
+    boxes, low_ids = tracker.update(boxes_at(102, score=0.3))
+    assert low_ids.tolist() == ids.tolist()
+    assert boxes.scores.tolist() == [pytest.approx(0.3)]
+    # 没有轨迹可延续的低分框不会产生新轨迹
+    _, new_ids = tracker.update(Detections([[102, 100, 142, 180], [600, 600, 640, 680]], [0.3, 0.3], [0, 0]))
+    assert new_ids.tolist() == ids.tolist()
+    assert len(tracker) == 1
+
+
+def test_lost_tracks_are_dropped_after_max_lost():
+    tracker = ByteTracker(max_lost=3)
+    _, ids = tracker.update(boxes_at(100))
+    for _ in range(3):
+        assert len(tracker.update(Detections.empty())[0]) == 0
+        assert len(tracker) == 1
+    # 在 max_lost 帧之内重新出现，沿用原来的编号
+    _, again = tracker.update(boxes_at(100))
+    assert again.tolist() == ids.tolist()
+    for _ in range(4):
+        tracker.update(Detections.empty())
+    assert len(tracker) == 0
+
+
+class StubDetector(Detector):
+    def __init__(self):
+        self.calls = 0
+
+    def detect(self, image, cell_masks=None):
+        self.calls += 1
+        return boxes_at(100 + 10 * self.calls)
+
+
+def test_tracked_detector_runs_the_detector_every_interval():
+    detector = StubDetector()
+    tracked = TrackedDetector(detector, interval=3)
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+    ids = [tracked.detect(frame)[1].tolist() for _ in range(9)]
+    assert detector.calls == 3
+    assert ids == [[1]] * 9
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+from yolov5p6 import YOLOV5P6_512X512, rect_spec
+from yolov5p6.trt_profiles import (OptimizationProfile, camera_profiles, load_profiles, make_profile,
+                                   profile_copies, replicate_profiles, save_profiles, select_profile, sidecar_path)
+
+
+def test_profile_rejects_unordered_shapes():
+    with pytest.raises(ValueError):
+        OptimizationProfile('bad', (1, 3, 512, 512), (1, 3, 256, 512), (1, 3, 512, 512))
+
+
+def test_select_profile_prefers_closest_opt_then_smaller_max():
+    profiles = [
+        make_profile('wide', batch=(1, 1, 8), height=(256, 512, 1024), width=(256, 512, 1024)),
+        make_profile('small', batch=(1, 1, 4), height=(256, 512, 512), width=(256, 512, 512)),
+        make_profile('front', height=(384,) * 3, width=(512,) * 3),
+    ]
+    assert select_profile(profiles, (1, 3, 384, 512)) == 2
+    # wide 与 small 的 opt 相同，small 的缓冲区更小
+    assert select_profile(profiles, (1, 3, 512, 512)) == 1
+    assert select_profile(profiles, (8, 3, 1024, 1024)) == 0
+    with pytest.raises(ValueError):
+        select_profile(profiles, (16, 3, 512, 512))
+    with pytest.raises(ValueError):
+        select_profile(profiles, (1, 3, 512))
+
+
+def test_camera_profiles_match_rect_spec():
+    profiles = camera_profiles(YOLOV5P6_512X512, {'side': (1280, 720), 'front': (1920, 1080)}, batch=(1, 2, 4),
+                               long_side=1024)
+    assert [p.name for p in profiles] == ['front', 'side']
+    rect = rect_spec(YOLOV5P6_512X512, 1920, 1080, 1024)
+    assert profiles[0].opt_shape == (2, 3, rect.input_h, rect.input_w)
+    assert select_profile(profiles, (1, 3, rect.input_h, rect.input_w)) in (0, 1)
+
+
+def test_replicated_profiles_give_every_slot_its_own_copy():
+    profiles = replicate_profiles([make_profile('default'), make_profile('cam', height=(256,) * 3)], 2)
+    assert [p.name for p in profiles] == ['default', 'default', 'cam', 'cam']
+    assert profile_copies(profiles, select_profile(profiles, (1, 3, 512, 512))) == [0, 1]
+    assert profile_copies(profiles, select_profile(profiles, (1, 3, 256, 512))) == [2, 3]
+    assert profile_copies([make_profile('default')], 0) == [0]
+
+
+def test_sidecar_round_trip(tmpdir):
+    engine = os.path.join(str(tmpdir), 'yolov5_p6_512x512_6head.trt')
+    path = sidecar_path(engine)
+    assert path == os.path.join(str(tmpdir), 'yolov5_p6_512x512_6head.profiles.json')
+
+    profiles = replicate_profiles([make_profile('default', batch=(1, 2, 4)),
+                                   make_profile('front', height=(384,) * 3)], 2)
+    save_profiles(path, profiles)
+    assert os.listdir(str(tmpdir)) == [os.path.basename(path)]
+    loaded = load_profiles(path)
+    assert [p.to_dict() for p in loaded] == [p.to_dict() for p in profiles]
+    assert select_profile(loaded, (2, 3, 512, 512)) == 0
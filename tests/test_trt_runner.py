@@ -0,0 +1,180 @@
+import numpy as np
+import pytest
+
+from yolov5p6.trt_runner import AsyncRunner, BindingSpec
+
+
+class MockDeviceMem(object):
+    def __init__(self, nbytes, pointer):
+        self.data = bytearray(nbytes)
+        self.pointer = pointer
+
+    def __int__(self):
+        return self.pointer
+
+
+class MockStream(object):
+    """
+    records the enqueued work and runs it only on synchronize(), like a real stream would run it later
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self.pending = []
+        self.handle = id(self)
+
+    def synchronize(self):
+        for work in self.pending:
+            work()
+        self.pending = []
+
+
+class MockCuda(object):
+    def __init__(self):
+        self.log = []
+        self.allocations = 0
+        self.streams = []
+        self.memory = {}
+
+    def pagelocked_empty(self, size, dtype):
+        self.allocations += 1
+        return np.zeros(size, dtype)
+
+    def mem_alloc(self, nbytes):
+        self.allocations += 1
+        mem = MockDeviceMem(nbytes, 0x1000 * (len(self.memory) + 1))
+        self.memory[int(mem)] = mem
+        return mem
+
+    def Stream(self):
+        stream = MockStream(self.log)
+        self.streams.append(stream)
+        return stream
+
+    def memcpy_htod_async(self, device, host, stream):
+        def work():
+            device.data[:] = host.tobytes()
+        self.log.append(('htod', stream))
+        stream.pending.append(work)
+
+    def memcpy_dtoh_async(self, host, device, stream):
+        def work():
+            host[:] = np.frombuffer(bytes(device.data), dtype=host.dtype)
+        self.log.append(('dtoh', stream))
+        stream.pending.append(work)
+
+
+class MockEngine(object):
+    """
+    output = input * 2 + context id, executed on the stream of the slot
+    """
+
+    def __init__(self, cuda):
+        self.cuda = cuda
+        self.contexts = []
+
+    def create_context(self):
+        self.contexts.append(len(self.contexts))
+        return self.contexts[-1]
+
+    def execute(self, context, bindings, stream):
+        dev_in, dev_out = [self.cuda.memory[pointer] for pointer in bindings]
+
+        def work():
+            x = np.frombuffer(bytes(dev_in.data), dtype=np.float32)
+            dev_out.data[:] = (x * 2 + context).astype(np.float32).tobytes()
+        stream.log.append(('execute', stream))
+        stream.pending.append(work)
+
+
+SPECS = [BindingSpec('data', (1, 4), np.float32, True), BindingSpec('out', (1, 4), np.float32, False)]
+
+
+@pytest.fixture
+def mock():
+    cuda = MockCuda()
+    engine = MockEngine(cuda)
+    return AsyncRunner(SPECS, engine.create_context, cuda, slots=2, execute=engine.execute), cuda
+
+
+def frame(value):
+    return np.full((1, 4), value, dtype=np.float32)
+
+
+def test_buffers_are_allocated_once(mock):
+    runner, cuda = mock
+    allocations = cuda.allocations
+    assert allocations == 2 * 2 * 2
+    list(runner.run_all(frame(i) for i in range(10)))
+    runner.run(frame(1))
+    assert cuda.allocations == allocations
+    assert len(cuda.streams) == 2
+
+
+def test_slots_are_reused_in_submit_order(mock):
+    runner, _ = mock
+    first = runner.submit(frame(1), tag='a')
+    second = runner.submit(frame(2), tag='b')
+    assert first is not second
+    with pytest.raises(RuntimeError):
+        runner.submit(frame(3))
+    assert runner.in_flight == 2
+
+    # 先提交的先取回，取回后的 slot 排到空闲队列末尾
+    assert runner.collect()[0] == 'a'
+    assert runner.submit(frame(3), tag='c') is first
+    assert runner.collect()[0] == 'b'
+    assert runner.collect()[0] == 'c'
+    assert runner.submit(frame(4)) is second
+    runner.collect()
+    with pytest.raises(RuntimeError):
+        runner.collect()
+
+
+def test_copy_in_writes_the_pinned_buffer(mock):
+    runner, _ = mock
+    slot = runner._free[0]
+    host = slot.inputs[0].host
+    runner.submit(frame(5))
+    # 写入原有的页锁定内存，而不是替换它
+    assert slot.inputs[0].host is host
+    np.testing.assert_array_equal(host, 5)
+    runner.collect()
+
+
+def test_collect_copies_outputs_out_of_the_slot(mock):
+    runner, _ = mock
+    runner.submit(frame(1))
+    _, (copied,) = runner.collect(copy=True)
+    runner.submit(frame(2))
+    _, (view,) = runner.collect(copy=False)
+    # 第一个 slot 的 context 为 0，第二个为 1
+    np.testing.assert_array_equal(copied, np.full((1, 4), 2))
+    np.testing.assert_array_equal(view, np.full((1, 4), 5))
+
+    # 复用 slot 后 copy=True 的结果不变，copy=False 的视图被覆盖
+    runner.submit(frame(10))
+    runner.submit(frame(20))
+    runner.collect()
+    runner.collect()
+    np.testing.assert_array_equal(copied, np.full((1, 4), 2))
+    np.testing.assert_array_equal(view, np.full((1, 4), 41))
+
+
+def test_run_all_keeps_input_order_and_overlaps_frames(mock):
+    runner, cuda = mock
+    results = list(runner.run_all(frame(i) for i in range(5)))
+    contexts = [i % 2 for i in range(5)]
+    for i, (out,) in enumerate(results):
+        np.testing.assert_array_equal(out, np.full((1, 4), i * 2 + contexts[i]))
+    # 第二帧在等待第一帧之前已经入队
+    kinds = [(kind, cuda.streams.index(stream)) for kind, stream in cuda.log]
+    assert kinds[:6] == [('htod', 0), ('execute', 0), ('dtoh', 0), ('htod', 1), ('execute', 1), ('dtoh', 1)]
+
+
+def test_run_drops_uncollected_frames(mock):
+    runner, _ = mock
+    runner.submit(frame(7))
+    (out,) = runner.run(frame(3))
+    assert runner.in_flight == 0
+    np.testing.assert_array_equal(out, np.full((1, 4), 3 * 2 + 1))
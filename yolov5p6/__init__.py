@@ -0,0 +1,29 @@
+from .spec import CLASSES, ModelSpec, YOLOV5P6_512X512, YOLOV5N_640X384, rect_spec
+from .decode import sigmoid, decode, decode_batch
+from .nms import NMS, box_iou
+from .tables import HeadTable, decode_tables
+from .preprocess import LetterboxInfo, letterbox_info, letterbox, resize, preprocess, Preprocessor
+from .detections import DetectBox, Detections, save_detections, load_detections
+from .metrics import Hook, MetricsCollector, MetricsExporter, add_hook, remove_hook
+from .pipeline import postprocess, postprocess_batch, draw_detections, Backend, Detector
+
+# 这些模块也可以用 python -m 运行，第一次访问时才导入，否则 runpy 会提示模块已经在 sys.modules 中
+_LAZY = {
+    'tile_grid': 'tiling', 'TiledDetector': 'tiling',
+    'MotionGate': 'motion', 'GatedDetector': 'motion',
+    'ByteTracker': 'tracker', 'TrackedDetector': 'tracker',
+    'RegionOfInterest': 'roi', 'RoiDetector': 'roi', 'load_rois': 'roi',
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError('module %r has no attribute %r' % (__name__, name))
+    import importlib
+    value = getattr(importlib.import_module('.' + _LAZY[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY))
@@ -0,0 +1,377 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+import uuid
+import zipfile
+
+DEFAULT_CACHE_DIR = os.environ.get('YOLOV5P6_CACHE', os.path.expanduser('~/.cache/yolov5p6'))
+
+META_EXT = '.meta.json'
+LOCK_EXT = '.lock'
+
+
+def file_digest(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def lock_owner():
+    """
+    content written into a lock file: host, pid and a token unique to this acquisition
+    """
+    return '%s %d %s' % (socket.gethostname(), os.getpid(), uuid.uuid4().hex)
+
+
+def read_lock(lock_path):
+    try:
+        with open(lock_path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def owner_alive(owner):
+    """
+    True if the owner of a lock is a running process on this host, None when that cannot be told (another host,
+    or the lock content not written yet)
+    """
+    parts = owner.split()
+    if len(parts) != 3 or parts[0] != socket.gethostname():
+        return None
+    try:
+        os.kill(int(parts[1]), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def dataset_files(dataset):
+    """
+    files of a calibration set: every file under a directory, the images listed in a dataset.txt with relative
+    paths resolved against the txt like rknn does, or a single file such as a calibration archive
+    """
+    if os.path.isdir(dataset):
+        return sorted(os.path.join(root, name) for root, _, names in os.walk(dataset) for name in names)
+    if not dataset.endswith('.txt'):
+        return [dataset]
+    base = os.path.dirname(os.path.abspath(dataset))
+    with open(dataset) as f:
+        return [os.path.join(base, line.strip()) for line in f if line.strip()]
+
+
+def dataset_digest(dataset):
+    """
+    digest of the contents of a calibration set, independent of where it is stored
+    """
+    h = hashlib.sha256()
+    for path in dataset_files(dataset):
+        h.update(file_digest(path).encode())
+    return h.hexdigest()
+
+
+def toolkit_version(*dists):
+    """
+    installed version of the first distribution found, e.g. toolkit_version('rknn-toolkit2', 'rknn-toolkit')
+    """
+    from importlib import metadata
+    for dist in dists:
+        try:
+            return '%s==%s' % (dist, metadata.version(dist))
+        except metadata.PackageNotFoundError:
+            pass
+    return None
+
+
+def artifact_key(source, precision, input_shape, calibration=None, toolkit=None, **extra):
+    """
+    :param source: source model file, hashed by content
+    :param precision: fp32 / fp16 / int8 ...
+    :param input_shape: input shape or any json serializable shape description, e.g. optimization profiles
+    :param calibration: calibration dataset directory or dataset.txt, None when not quantizing
+    :param toolkit: converter name and version
+    :param extra: any other json serializable option changing the artifact
+    :return: key of the artifact and the fields it was computed from
+    """
+    fields = {
+        'source': file_digest(source),
+        'precision': precision,
+        'input_shape': input_shape,
+        'calibration': dataset_digest(calibration) if calibration is not None else None,
+        'toolkit': toolkit,
+    }
+    fields.update(extra)
+    key = hashlib.sha256(json.dumps(fields, sort_keys=True).encode()).hexdigest()
+    return key, fields
+
+
+class ArtifactCache(object):
+    """
+    converted models stored by key in one directory, files are written to a temporary name and renamed so
+    readers never see a partial artifact, and a lock file makes concurrent workers wait for one conversion
+    instead of all converting
+    :param root: cache directory
+    :param max_bytes: evict least recently used artifacts above this total size, None for no limit
+    :param max_age: evict artifacts not used for this many seconds, None for no limit
+    :param lock_timeout: a lock older than this is considered left over by a crashed worker, unless its owner is
+        a process still running on this host, e.g. during a long int8 calibration
+    """
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, max_bytes=None, max_age=None, lock_timeout=3600):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.lock_timeout = lock_timeout
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key, suffix=''):
+        return os.path.join(self.root, key + suffix)
+
+    def _meta_path(self, key):
+        return os.path.join(self.root, key + META_EXT)
+
+    def _artifact_path(self, key):
+        try:
+            with open(self._meta_path(key)) as f:
+                path = self.path(key, json.load(f)['suffix'])
+        except (IOError, ValueError):
+            return None
+        return path if os.path.exists(path) else None
+
+    def get(self, key):
+        """
+        :return: path of the artifact, None on a miss. marks the artifact as used
+        """
+        path = self._artifact_path(key)
+        if path is None:
+            return None
+        now = time.time()
+        try:
+            os.utime(path, (now, now))
+        except FileNotFoundError:
+            # 检查之后被其他进程淘汰，按未命中处理
+            return None
+        return path
+
+    def put(self, key, src_path, suffix='', fields=None):
+        """
+        copy a file into the cache
+        """
+        return self._store(key, suffix, fields, lambda tmp_path: shutil.copyfile(src_path, tmp_path))
+
+    def get_or_build(self, key, build, suffix='', fields=None, poll=1.0):
+        """
+        :param build: build(path) writes the artifact to path, only called on a miss
+        :return: path of the artifact in the cache
+        """
+        path = self.get(key)
+        if path is not None:
+            return path
+
+        lock_path = self.path(key, LOCK_EXT)
+        owner = lock_owner()
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                # 另一个进程正在转换同一个模型
+                path = self.get(key)
+                if path is not None:
+                    return path
+                self._break_stale_lock(lock_path)
+                time.sleep(poll)
+                continue
+            with os.fdopen(fd, 'w') as f:
+                f.write(owner)
+            break
+
+        try:
+            path = self.get(key)
+            if path is None:
+                path = self._store(key, suffix, fields, build)
+        finally:
+            # 锁被当作过期删除并由别的进程重新获取时，不能删掉别人的锁
+            if read_lock(lock_path) == owner:
+                os.remove(lock_path)
+        self.evict(keep=key)
+        return path
+
+    def _break_stale_lock(self, lock_path):
+        try:
+            age = time.time() - os.path.getmtime(lock_path)
+        except FileNotFoundError:
+            return
+        owner = read_lock(lock_path)
+        if owner is None or age <= self.lock_timeout or owner_alive(owner):
+            return
+        # 只删除刚才读到的那个锁，期间被别的进程换掉的新锁保留
+        if read_lock(lock_path) == owner:
+            os.remove(lock_path)
+
+    def _store(self, key, suffix, fields, build):
+        path = self.path(key, suffix)
+        fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', suffix=suffix, dir=self.root)
+        os.close(fd)
+        try:
+            build(tmp_path)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        meta = {'key': key, 'suffix': suffix, 'fields': fields, 'created': time.time()}
+        fd, tmp_meta = tempfile.mkstemp(prefix='.tmp-', suffix=META_EXT, dir=self.root)
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(tmp_meta, self._meta_path(key))
+        return path
+
+    def entries(self):
+        """
+        :return: list of (last used, size in bytes, key, path), oldest first
+        """
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(META_EXT):
+                continue
+            key = name[:-len(META_EXT)]
+            path = self._artifact_path(key)
+            if path is None:
+                continue
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, key, path))
+        return sorted(entries)
+
+    def remove(self, key):
+        path = self._artifact_path(key)
+        # 先删 meta，get() 就不会再返回这个文件
+        for p in (self._meta_path(key), path):
+            if p is not None and os.path.exists(p):
+                os.remove(p)
+
+    def evict(self, now=None, keep=None):
+        """
+        remove artifacts unused for longer than max_age, then the least recently used ones until the cache fits
+        in max_bytes
+        :param keep: key never evicted, e.g. the artifact just returned to the caller
+        :return: evicted keys
+        """
+        now = time.time() if now is None else now
+        entries = self.entries()
+        evicted = []
+        if self.max_age is not None:
+            for entry in list(entries):
+                if entry[2] != keep and now - entry[0] > self.max_age:
+                    self.remove(entry[2])
+                    evicted.append(entry[2])
+                    entries.remove(entry)
+        if self.max_bytes is not None:
+            total = sum(entry[1] for entry in entries)
+            for used, size, key, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                self.remove(key)
+                evicted.append(key)
+                total -= size
+        return evicted
+
+
+def _write_atomic(dst_path, write):
+    dst_dir = os.path.dirname(os.path.abspath(dst_path))
+    os.makedirs(dst_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', dir=dst_dir)
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, dst_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def copy_atomic(src_path, dst_path):
+    _write_atomic(dst_path, lambda tmp_path: shutil.copyfile(src_path, tmp_path))
+
+
+def pack_files(paths, dst_path):
+    """
+    several output files of one conversion stored as one uncompressed zip, so they are cached and evicted together
+    """
+    with zipfile.ZipFile(dst_path, 'w', zipfile.ZIP_STORED) as zf:
+        for index, path in enumerate(paths):
+            zf.write(path, str(index))
+
+
+def unpack_files(src_path, paths):
+    """
+    inverse of pack_files, every file is written atomically
+    """
+    with zipfile.ZipFile(src_path) as zf:
+        for index, path in enumerate(paths):
+            def write(tmp_path, name=str(index)):
+                with zf.open(name) as src, open(tmp_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+            _write_atomic(path, write)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='run a model conversion command only when its artifact is not cached, e.g. '
+                    'python -m yolov5p6.artifact_cache --source model.onnx --artifact out.bin -- hb_mapper ...')
+    parser.add_argument('--cache_dir', type=str, default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--source', type=str, required=True, help='source model')
+    parser.add_argument('--artifact', type=str, action='append', required=True,
+                        help='file the command writes, repeat for commands writing several files')
+    parser.add_argument('--precision', type=str, default='int8')
+    parser.add_argument('--shape', type=str, default=None, help='input shape, e.g. 1,3,512,512')
+    parser.add_argument('--calibration', type=str, default=None, help='calibration directory or dataset.txt')
+    parser.add_argument('--toolkit', type=str, default=None, help='converter name and version')
+    parser.add_argument('--config', type=str, action='append', default=[],
+                        help='config files of the converter, hashed into the key, repeatable')
+    parser.add_argument('--max_size_mb', type=float, default=None)
+    parser.add_argument('--max_age_days', type=float, default=None)
+    parser.add_argument('command', nargs=argparse.REMAINDER, help='conversion command after --')
+    args = parser.parse_args()
+
+    command = args.command[1:] if args.command[:1] == ['--'] else args.command
+    if not command:
+        parser.error('missing conversion command')
+
+    shape = [int(v) for v in args.shape.split(',')] if args.shape else None
+    # 多个输出文件打包成一个缓存项
+    extra = {'artifacts': [os.path.basename(a) for a in args.artifact]} if len(args.artifact) > 1 else {}
+    key, fields = artifact_key(args.source, args.precision, shape, args.calibration, args.toolkit,
+                               configs=[file_digest(c) for c in args.config], **extra)
+    cache = ArtifactCache(args.cache_dir,
+                          max_bytes=args.max_size_mb * (1 << 20) if args.max_size_mb is not None else None,
+                          max_age=args.max_age_days * 86400 if args.max_age_days is not None else None)
+
+    def build(tmp_path):
+        subprocess.check_call(command)
+        if extra:
+            pack_files(args.artifact, tmp_path)
+        else:
+            shutil.copyfile(args.artifact[0], tmp_path)
+
+    hit = cache.get(key) is not None
+    if extra:
+        unpack_files(cache.get_or_build(key, build, '.zip', fields), args.artifact)
+    else:
+        copy_atomic(cache.get_or_build(key, build, os.path.splitext(args.artifact[0])[1], fields), args.artifact[0])
+    print('%s %s -> %s' % ('cache hit' if hit else 'converted', key[:16], ', '.join(args.artifact)))
+
+
+if __name__ == '__main__':
+    main()
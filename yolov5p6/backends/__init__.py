@@ -0,0 +1,2 @@
+# 每个后端单独 import，避免没有安装的推理框架导致导入失败
+# from yolov5p6.backends.onnx_backend import OnnxBackend
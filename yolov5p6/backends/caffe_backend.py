@@ -0,0 +1,28 @@
+import os
+import sys
+
+from ..pipeline import Backend
+from ..preprocess import preprocess
+from ..spec import YOLOV5N_640X384
+
+
+class CaffeBackend(Backend):
+    def __init__(self, net_file, caffe_model, caffe_root='/root/caffe-master/', input_name='blob1',
+                 spec=YOLOV5N_640X384):
+        for path in (net_file, caffe_model):
+            if not os.path.exists(path):
+                raise FileNotFoundError(path + " does not exist")
+
+        sys.path.insert(0, os.path.join(caffe_root, 'python'))
+        import caffe
+
+        self.spec = spec
+        self.input_name = input_name
+        self.net = caffe.Net(net_file, caffe_model, caffe.TEST)
+
+    def preprocess(self, image):
+        return preprocess(image, self.spec)
+
+    def run(self, data):
+        self.net.blobs[self.input_name].data[...] = data
+        return self.net.forward()
@@ -0,0 +1,39 @@
+import numpy as np
+from horizon_tc_ui import HB_ONNXRuntime
+
+from ..pipeline import Backend
+from ..preprocess import resize
+from ..spec import YOLOV5P6_512X512
+
+
+class HorizonBackend(Backend):
+    """
+    :param model_path: quantized onnx model of the horizon toolchain
+    :param input_offset: offset of the uint8 input, see HB_ONNXRuntime.run
+    :param spec: ModelSpec of the model
+    :param input_layout: NHWC or NCHW input of the model, None uses the layout reported by the session
+    """
+
+    def __init__(self, model_path, input_offset=128, spec=YOLOV5P6_512X512, input_layout=None):
+        self.spec = spec
+        self.input_offset = input_offset
+        self.session = HB_ONNXRuntime(model_file=model_path)
+        self.session.set_dim_param(0, 0, '?')
+        self.input_name = self.session.input_names[0]
+        self.output_names = self.session.output_names
+        if input_layout not in (None, 'NHWC', 'NCHW'):
+            raise ValueError('invalid input_layout %s' % input_layout)
+        self.input_layout = input_layout
+
+    @property
+    def layout(self):
+        return self.input_layout if self.input_layout is not None else self.session.layout[0]
+
+    def preprocess(self, image):
+        data = np.expand_dims(resize(image, self.spec), axis=0)
+        if self.layout == 'NCHW':
+            data = np.ascontiguousarray(data.transpose((0, 3, 1, 2)))
+        return data
+
+    def run(self, data):
+        return self.session.run(self.output_names, {self.input_name: data}, input_offset=self.input_offset)
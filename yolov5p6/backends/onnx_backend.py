@@ -0,0 +1,130 @@
+import os
+import threading
+
+import numpy as np
+import onnxruntime as ort
+
+from ..pipeline import Backend
+from ..preprocess import Preprocessor
+from ..spec import YOLOV5P6_512X512
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    'disable': ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    'basic': ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    'extended': ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    'all': ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+EXECUTION_MODES = {
+    'sequential': ort.ExecutionMode.ORT_SEQUENTIAL,
+    'parallel': ort.ExecutionMode.ORT_PARALLEL,
+}
+
+
+def session_options(intra_op_num_threads=0, inter_op_num_threads=0, graph_optimization_level='all',
+                    execution_mode='sequential', optimized_model_path=None):
+    """
+    :param intra_op_num_threads: threads used inside one operator, 0 lets onnxruntime decide
+    :param inter_op_num_threads: threads used across operators in parallel execution mode, 0 lets onnxruntime decide
+    :param graph_optimization_level: disable / basic / extended / all
+    :param execution_mode: sequential / parallel
+    :param optimized_model_path: where onnxruntime writes the optimized graph, None to skip
+    """
+    if graph_optimization_level not in GRAPH_OPTIMIZATION_LEVELS:
+        raise ValueError(f"invalid graph_optimization_level {graph_optimization_level}")
+    if execution_mode not in EXECUTION_MODES:
+        raise ValueError(f"invalid execution_mode {execution_mode}")
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_num_threads
+    options.inter_op_num_threads = inter_op_num_threads
+    options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[graph_optimization_level]
+    options.execution_mode = EXECUTION_MODES[execution_mode]
+    if optimized_model_path is not None:
+        options.optimized_model_filepath = optimized_model_path
+    return options
+
+
+class OnnxBackend(Backend):
+    """
+    onnxruntime backend, the session is created once and reused for every run
+    :param model_path: onnx model
+    :param spec: ModelSpec of the model
+    :param providers: execution providers in priority order, None for every available provider
+    :param intra_op_num_threads, inter_op_num_threads, graph_optimization_level, execution_mode: see session_options
+    :param optimized_model_path: cache of the optimized graph, loaded instead of model_path when it is
+        newer, otherwise written while creating the session. with graph_optimization_level all the saved
+        graph may contain hardware specific kernels, only reuse it on the machine that wrote it
+    :param warmup: number of dummy runs done after loading so the first real run is not an outlier
+    :param max_batch_size: split larger batches into runs of this size when the batch dimension is dynamic
+    :param reuse_input_buffer: preprocess() returns the same per-thread buffer every call instead of a new one,
+        only for callers that run each input before preprocessing the next frame in the same thread
+    """
+
+    def __init__(self, model_path, spec=YOLOV5P6_512X512, providers=None, intra_op_num_threads=0,
+                 inter_op_num_threads=0, graph_optimization_level='all', execution_mode='sequential',
+                 optimized_model_path=None, warmup=1, max_batch_size=None,
+                 reuse_input_buffer=False):
+        self.spec = spec
+        self.reuse_input_buffer = reuse_input_buffer
+        self._local = threading.local()
+        self.providers = providers if providers is not None else ort.get_available_providers()
+
+        if optimized_model_path is not None and os.path.exists(optimized_model_path) and \
+                os.path.getmtime(optimized_model_path) >= os.path.getmtime(model_path):
+            # 已经优化过的图，跳过图优化直接加载
+            model_path = optimized_model_path
+            graph_optimization_level = 'disable'
+            optimized_model_path = None
+
+        options = session_options(intra_op_num_threads, inter_op_num_threads, graph_optimization_level,
+                                  execution_mode, optimized_model_path)
+        self.model_path = model_path
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=self.providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+        # 导出时固定了 batch 的模型只能按这个大小喂数据
+        batch_dim = self.session.get_inputs()[0].shape[0]
+        self.fixed_batch_size = batch_dim if isinstance(batch_dim, int) else None
+        self.max_batch_size = self.fixed_batch_size or max_batch_size
+
+        if warmup > 0:
+            self.warmup(warmup)
+
+    @property
+    def preprocessor(self):
+        # 中间缓冲区每个线程一份
+        if not hasattr(self._local, 'preprocessor'):
+            self._local.preprocessor = Preprocessor(self.spec)
+        return self._local.preprocessor
+
+    def preprocess(self, image):
+        if self.reuse_input_buffer:
+            return self.preprocessor(image)
+        return self.preprocessor(image, out=np.empty((1, 3, self.spec.input_h, self.spec.input_w), dtype=np.float32))
+
+    def preprocess_batch(self, images):
+        batch = np.empty((len(images), 3, self.spec.input_h, self.spec.input_w), dtype=np.float32)
+        for i, image in enumerate(images):
+            self.preprocessor(image, out=batch[i])
+        return batch
+
+    def run(self, data):
+        batch = data.shape[0]
+        if self.fixed_batch_size is not None:
+            direct = batch == self.fixed_batch_size
+        else:
+            direct = self.max_batch_size is None or batch <= self.max_batch_size
+        if direct:
+            return self.session.run(None, {self.input_name: data})
+
+        # 分块运行，固定 batch 的模型最后一块补零，结果按原始 batch 拼接
+        outputs = []
+        for start in range(0, batch, self.max_batch_size):
+            chunk = data[start:start + self.max_batch_size]
+            valid = chunk.shape[0]
+            if self.fixed_batch_size is not None and valid < self.fixed_batch_size:
+                pad = np.zeros((self.fixed_batch_size - valid,) + chunk.shape[1:], dtype=chunk.dtype)
+                chunk = np.concatenate((chunk, pad))
+            outputs.append([res[:valid] for res in self.session.run(None, {self.input_name: chunk})])
+        return [np.concatenate(res) for res in zip(*outputs)]
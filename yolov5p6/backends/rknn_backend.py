@@ -0,0 +1,34 @@
+from rknn.api import RKNN
+
+from ..pipeline import Backend
+from ..preprocess import resize
+from ..spec import YOLOV5P6_512X512
+
+
+class RKNNBackend(Backend):
+    """
+    :param rknn: RKNN object with the runtime already initialized
+    """
+
+    def __init__(self, rknn, spec=YOLOV5P6_512X512):
+        self.spec = spec
+        self.rknn = rknn
+
+    @classmethod
+    def from_file(cls, rknn_model, target=None, spec=YOLOV5P6_512X512):
+        rknn = RKNN()
+        if rknn.load_rknn(rknn_model) != 0:
+            raise RuntimeError('Load rknn model failed!')
+        if rknn.init_runtime(target=target) != 0:
+            raise RuntimeError('Init runtime environment failed!')
+        return cls(rknn, spec)
+
+    def preprocess(self, image):
+        # 归一化由 rknn.config 中的 mean/std 完成
+        return resize(image, self.spec)
+
+    def run(self, data):
+        return self.rknn.inference(inputs=[data])
+
+    def release(self):
+        self.rknn.release()
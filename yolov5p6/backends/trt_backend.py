@@ -0,0 +1,133 @@
+import collections
+import os
+
+import tensorrt as trt
+import pycuda.driver as cuda
+import pycuda.autoinit
+
+from ..pipeline import Backend
+from ..preprocess import preprocess
+from ..spec import YOLOV5P6_512X512
+from ..trt_profiles import load_profiles, profile_copies, select_profile, sidecar_path
+from ..trt_runner import AsyncRunner, BindingSpec
+
+TRT_LOGGER = trt.Logger()
+
+
+def get_engine_from_bin(engine_file_path):
+    print('Reading engine from file {}'.format(engine_file_path))
+    with open(engine_file_path, 'rb') as f, trt.Runtime(TRT_LOGGER) as runtime:
+        return runtime.deserialize_cuda_engine(f.read())
+
+
+def bindings_per_profile(engine):
+    return engine.num_bindings // engine.num_optimization_profiles
+
+
+def binding_specs(engine, context=None, profile_index=0):
+    """
+    bindings of one optimization profile, shapes are read from the context once its input shape is set
+    """
+    specs = []
+    offset = profile_index * bindings_per_profile(engine)
+    for index in range(offset, offset + bindings_per_profile(engine)):
+        if context is not None:
+            shape = tuple(context.get_binding_shape(index))
+        else:
+            shape = tuple(engine.get_binding_shape(index))
+        if engine.has_implicit_batch_dimension:
+            shape = (engine.max_batch_size,) + shape
+        specs.append(BindingSpec(engine.get_binding_name(index), shape, trt.nptype(engine.get_binding_dtype(index)),
+                                 engine.binding_is_input(index)))
+    return specs
+
+
+def engine_executor(engine):
+    if engine.has_implicit_batch_dimension:
+        def execute(context, bindings, stream):
+            context.execute_async(batch_size=1, bindings=bindings, stream_handle=stream.handle)
+    else:
+        def execute(context, bindings, stream):
+            context.execute_async_v2(bindings=bindings, stream_handle=stream.handle)
+    return execute
+
+
+def execute_profile(context, bindings, stream):
+    """
+    execute for ProfileContext, the bindings of the slot go to the position of its profile
+    """
+    context.context.execute_async_v2(bindings=context.before + bindings + context.after, stream_handle=stream.handle)
+
+
+class ProfileContext(object):
+    """
+    execution context bound to one optimization profile
+    :param before: zero bindings of the profiles before it
+    :param after: zero bindings of the profiles after it
+    """
+
+    def __init__(self, context, profile_index, before, after):
+        self.context = context
+        self.profile_index = profile_index
+        self.before = before
+        self.after = after
+
+
+def profile_context(engine, profile_index, input_shape):
+    """
+    execution context with the profile activated and the input shape set
+    """
+    per_profile = bindings_per_profile(engine)
+    offset = profile_index * per_profile
+    input_index = next(i for i in range(offset, offset + per_profile) if engine.binding_is_input(i))
+    context = engine.create_execution_context()
+    context.active_optimization_profile = profile_index
+    context.set_binding_shape(input_index, input_shape)
+    # 其它 profile 的 binding 位置填 0
+    return ProfileContext(context, profile_index, [0] * offset, [0] * (engine.num_bindings - offset - per_profile))
+
+
+class TensorRTBackend(Backend):
+    """
+    :param engine_file_path: serialized engine
+    :param spec: ModelSpec of the model
+    :param slots: frames kept in flight by run_stream(), each with its own pinned buffers, stream and context
+    :param profile_file: profiles json written by onnx2trt_rt7.py, defaults to the one next to the engine. the
+        profile accepting the (1, 3, spec.input_h, spec.input_w) input is selected, e.g. with a spec from rect_spec.
+        slot i runs on copy i of that profile, engines with fewer copies than slots run fewer slots
+    """
+
+    def __init__(self, engine_file_path, spec=YOLOV5P6_512X512, slots=2, profile_file=None):
+        self.spec = spec
+        self.engine = get_engine_from_bin(engine_file_path)
+        profile_file = profile_file or sidecar_path(engine_file_path)
+
+        if self.engine.has_implicit_batch_dimension or not os.path.exists(profile_file):
+            # 固定输入尺寸的 engine，多个 context 可以同时运行
+            self.profile_index = None
+            self.runner = AsyncRunner(binding_specs(self.engine), self.engine.create_execution_context, cuda,
+                                      slots=slots, execute=engine_executor(self.engine))
+            return
+
+        profiles = load_profiles(profile_file)
+        input_shape = (1, 3, spec.input_h, spec.input_w)
+        # 同时运行的 context 必须各用一个 profile，每个 slot 使用所选 profile 的一个副本
+        indices = profile_copies(profiles, select_profile(profiles, input_shape))
+        if len(indices) < slots:
+            print('engine has {} copies of profile {}, running {} slots instead of {}, rebuild with '
+                  'onnx2trt_rt7.py --slots {}'.format(len(indices), profiles[indices[0]].name, len(indices), slots,
+                                                      slots))
+            slots = len(indices)
+        self.profile_index = indices[0]
+        contexts = collections.deque(profile_context(self.engine, index, input_shape) for index in indices[:slots])
+        specs = binding_specs(self.engine, contexts[0].context, self.profile_index)
+        self.runner = AsyncRunner(specs, contexts.popleft, cuda, slots=slots, execute=execute_profile)
+
+    def preprocess(self, image):
+        return preprocess(image, self.spec)
+
+    def run(self, data):
+        return self.runner.run(data)
+
+    def run_stream(self, datas):
+        return self.runner.run_all(datas)
@@ -0,0 +1,74 @@
+import argparse
+import time
+
+import numpy as np
+
+from ..decode import decode_batch
+from ..spec import YOLOV5P6_512X512
+
+
+def sparse_outputs(spec, batch=1, objects=10, seed=0):
+    """
+    raw head outputs shaped like a real frame: almost every cell is background with objectness logits far below
+    the threshold, each of the objects per image is confident on a few cells of one head
+    """
+    rng = np.random.default_rng(seed)
+    gs = 4 + 1 + spec.class_num
+    ys = []
+    for grid_h, grid_w in spec.cell_size:
+        y = rng.normal(0, 1, (batch, spec.anchor_num, gs, grid_h, grid_w)).astype(np.float32)
+        y[:, :, 4] = rng.normal(-9, 2, (batch, spec.anchor_num, grid_h, grid_w))
+        ys.append(y)
+    for n in range(batch):
+        for _ in range(objects):
+            # 每个目标只落在一个输出头上，与真实的帧一样
+            y = ys[rng.integers(len(ys))]
+            grid_h, grid_w = y.shape[3:]
+            a = rng.integers(spec.anchor_num)
+            h = rng.integers(grid_h)
+            w = rng.integers(grid_w)
+            # 大分辨率的 head 上一个目标会激活周围几个 cell
+            r = 1 if grid_h >= 16 else 0
+            y[n, a, 4, max(h - r, 0):h + r + 1, max(w - r, 0):w + r + 1] = rng.normal(2, 1.5)
+            y[n, a, 5 + rng.integers(spec.class_num), h, w] = 3
+    return [y.reshape((batch, spec.anchor_num * gs) + y.shape[3:]) for y in ys]
+
+
+def timeit(func, args, number):
+    func(*args)
+    start = time.perf_counter()
+    for _ in range(number):
+        func(*args)
+    return (time.perf_counter() - start) / number * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='dense vs early reject decode on sparse outputs')
+    parser.add_argument('--batch', type=int, default=1)
+    parser.add_argument('--objects', type=int, default=10, help='objects per image')
+    parser.add_argument('--number', type=int, default=50)
+    args = parser.parse_args()
+
+    dense = YOLOV5P6_512X512.replace(early_reject=False)
+    early = YOLOV5P6_512X512.replace(early_reject=True)
+    out = sparse_outputs(dense, args.batch, args.objects)
+    img_sizes = [(1080, 1920)] * args.batch
+
+    cells = sum(y.size for y in out) // (5 + dense.class_num)
+    background = sum(int((y.reshape((args.batch, dense.anchor_num, -1) + y.shape[2:])[:, :, 4] < 0).sum()) for y in out)
+    print('anchors per batch: %d, background (objectness logit < 0): %.2f%%' % (cells, background * 100 / cells))
+
+    a = decode_batch(out, img_sizes, dense)
+    b = decode_batch(out, img_sizes, early)
+    for x, y in zip(a, b):
+        if not all(np.array_equal(u, v) for u, v in zip(x, y)):
+            raise AssertionError('early reject decode differs from dense decode')
+
+    print('%-14s %10s %12s' % ('', 'ms/batch', 'candidates'))
+    for name, spec in [('dense', dense), ('early_reject', early)]:
+        ms = timeit(decode_batch, (out, img_sizes, spec), args.number)
+        print('%-14s %10.3f %12d' % (name, ms, sum(len(s) for _, s, _ in b)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from .. import fused, metrics
+from ..decode import decode
+from ..pipeline import draw_detections, nms_boxes
+from ..spec import CLASSES
+from ..stream import IMAGE_EXTS
+
+PERCENTILES = (50, 95, 99)
+
+
+def create_backend(name, model, weights=None, providers=None, target=None, spec=None):
+    """
+    backends are imported on demand, only the runtime that is benchmarked has to be installed
+    :param name: onnx / trt / rknn / horizon / caffe
+    :param model: model file of that runtime (.onnx, .engine / .trt, .rknn, .bin, .prototxt)
+    :param weights: .caffemodel for caffe
+    :param spec: ModelSpec overriding the backend's own, None keeps the backend default (the caffe model has
+        3 heads, the others 6)
+    """
+    kwargs = {} if spec is None else {'spec': spec}
+    if name == 'onnx':
+        from ..backends.onnx_backend import OnnxBackend
+        return OnnxBackend(model, providers=providers, warmup=0, **kwargs)
+    if name == 'trt':
+        from ..backends.trt_backend import TensorRTBackend
+        return TensorRTBackend(model, **kwargs)
+    if name == 'rknn':
+        from ..backends.rknn_backend import RKNNBackend
+        return RKNNBackend.from_file(model, target, **kwargs)
+    if name == 'horizon':
+        from ..backends.horizon_backend import HorizonBackend
+        return HorizonBackend(model, **kwargs)
+    if name == 'caffe':
+        from ..backends.caffe_backend import CaffeBackend
+        if weights is None:
+            raise ValueError('caffe needs --weights')
+        return CaffeBackend(model, weights, **kwargs)
+    raise ValueError('unknown backend %s' % name)
+
+
+def load_images(source, num, size=(1080, 1920), seed=0):
+    """
+    RGB images from an image file or a directory, synthetic frames of size (h, w) if source is None
+    """
+    if source is None:
+        from .synthetic_model import synthetic_frame
+        rng = np.random.default_rng(seed)
+        return [synthetic_frame(rng, size) for _ in range(num)]
+    if os.path.isdir(source):
+        files = [os.path.join(source, name) for name in sorted(os.listdir(source))
+                 if os.path.splitext(name)[1].lower() in IMAGE_EXTS][:num]
+    else:
+        files = [source]
+    images = [cv2.imread(file) for file in files]
+    images = [cv2.cvtColor(image, cv2.COLOR_BGR2RGB) for image in images if image is not None]
+    if not images:
+        raise IOError('no readable image in %s' % source)
+    return images
+
+
+class StageTimer(metrics.Hook):
+    """
+    wall time of every named stage, one sample per iteration. registered as a metrics hook around the fused
+    kernel, which reports its decode and NMS parts itself
+    """
+
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, stage, seconds):
+        self.samples.setdefault(stage, []).append(seconds * 1000)
+
+    def on_timing(self, stage, seconds):
+        if stage in ('decode', 'nms'):
+            self.add(stage, seconds)
+
+    def summary(self):
+        """
+        :return: {stage: {mean_ms, p50_ms, p95_ms, p99_ms, max_ms, per_sec}} in stage order
+        """
+        result = {}
+        for stage, samples in self.samples.items():
+            samples = np.array(samples)
+            row = {'mean_ms': float(samples.mean())}
+            for p, value in zip(PERCENTILES, np.percentile(samples, PERCENTILES)):
+                row['p%d_ms' % p] = float(value)
+            row['max_ms'] = float(samples.max())
+            row['per_sec'] = 1000 / row['mean_ms'] if row['mean_ms'] > 0 else float('inf')
+            result[stage] = row
+        return result
+
+
+def run_once(backend, spec, image, dst_path, timer):
+    """
+    one image through every stage, decode and NMS are timed separately, inside the kernel when it is fused
+    :return: number of detections
+    """
+    clock = time.perf_counter
+    img_h, img_w = image.shape[:2]
+
+    start = clock()
+    data = backend.preprocess(image)
+    t = clock()
+    timer.add('preprocess', t - start)
+
+    out = backend.run(data)
+    t, last = clock(), t
+    timer.add('run', t - last)
+
+    if fused.ENABLED:
+        # 内核先上报 NMS，这里固定报告中 decode 在前
+        timer.samples.setdefault('decode', [])
+        timer.samples.setdefault('nms', [])
+        metrics.add_hook(timer)
+        try:
+            predbox = fused.postprocess(out, img_h, img_w, spec)
+        finally:
+            metrics.remove_hook(timer)
+        t = clock()
+    else:
+        boxes, scores, class_ids = decode(out, img_h, img_w, spec)
+        t, last = clock(), t
+        timer.add('decode', t - last)
+        predbox = nms_boxes(boxes, scores, class_ids, spec)
+        t, last = clock(), t
+        timer.add('nms', t - last)
+
+    # 画框会修改图像，复制不计入耗时
+    copy_start = clock()
+    canvas = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    t = clock()
+    copy_time = t - copy_start
+    draw_detections(canvas, predbox, CLASSES)
+    t, last = clock(), t
+    timer.add('draw', t - last)
+
+    cv2.imwrite(dst_path, canvas)
+    t, last = clock(), t
+    timer.add('imwrite', t - last)
+    timer.add('total', t - start - copy_time)
+    return len(predbox)
+
+
+def benchmark(backend, images, iterations, warmup, dst_dir):
+    """
+    :return: dict with per stage latency statistics, end to end throughput and detections per image
+    """
+    spec = backend.spec
+    dst_path = os.path.join(dst_dir, 'benchmark.jpg')
+    for i in range(warmup):
+        run_once(backend, spec, images[i % len(images)], dst_path, StageTimer())
+
+    timer = StageTimer()
+    counts = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        counts.append(run_once(backend, spec, images[i % len(images)], dst_path, timer))
+    elapsed = time.perf_counter() - start
+
+    return {
+        'iterations': iterations,
+        'warmup': warmup,
+        'fused': fused.ENABLED,
+        'input_size': [spec.input_w, spec.input_h],
+        'image_sizes': sorted({'%dx%d' % (image.shape[1], image.shape[0]) for image in images}),
+        'stages': timer.summary(),
+        'throughput_fps': iterations / elapsed,
+        'detections_mean': float(np.mean(counts)) if counts else 0.0,
+        'host': {'python': platform.python_version(), 'machine': platform.machine(), 'numpy': np.__version__},
+    }
+
+
+def print_report(result, baseline=None):
+    """
+    :param baseline: an earlier result, p50 change of every stage is printed next to it
+    """
+    header = '%-12s %10s %10s %10s %10s %10s' % ('stage', 'mean(ms)', 'p50(ms)', 'p95(ms)', 'p99(ms)', 'per sec')
+    if baseline is not None:
+        header += ' %12s' % 'p50 change'
+    print(header)
+    for stage, row in result['stages'].items():
+        line = '%-12s %10.3f %10.3f %10.3f %10.3f %10.1f' % (
+            stage, row['mean_ms'], row['p50_ms'], row['p95_ms'], row['p99_ms'], row['per_sec'])
+        if baseline is not None:
+            old = baseline['stages'].get(stage)
+            line += ' %11.1f%%' % ((row['p50_ms'] / old['p50_ms'] - 1) * 100) if old and old['p50_ms'] > 0 \
+                else ' %12s' % '-'
+        print(line)
+    print('throughput: %.1f images/sec, %.1f detections per image, fused decode + NMS: %s' % (
+        result['throughput_fps'], result['detections_mean'], result['fused']))
+    if result['fused']:
+        print('decode and nms are the two parts of the fused kernel, YOLOV5P6_FUSED=0 times the numpy functions')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='end to end latency of every stage: preprocess, run, decode, NMS, '
+                                                 'draw and imwrite')
+    parser.add_argument('--backend', type=str, default='onnx', choices=['onnx', 'trt', 'rknn', 'horizon', 'caffe'])
+    parser.add_argument('--model', type=str, default=None,
+                        help='model file, for onnx a synthetic six-head model is generated if not given')
+    parser.add_argument('--weights', type=str, default=None, help='.caffemodel for the caffe backend')
+    parser.add_argument('--target', type=str, default=None, help='rknn target, e.g. rk3588')
+    parser.add_argument('--cpu', action='store_true', help='onnxruntime CPUExecutionProvider only')
+    parser.add_argument('--source', type=str, default=None,
+                        help='image file or directory, synthetic 1920x1080 frames if not given')
+    parser.add_argument('--images', type=int, default=16, help='images loaded from the directory / generated')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--json', type=str, default=None, help='write the result as json, - for stdout')
+    parser.add_argument('--baseline', type=str, default=None, help='earlier --json result to compare against')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = args.model
+        providers = ['CPUExecutionProvider'] if args.cpu else None
+        if model is None:
+            if args.backend != 'onnx':
+                parser.error('--model is required for the %s backend' % args.backend)
+            from .synthetic_model import make_synthetic_model
+            model = make_synthetic_model(os.path.join(tmp, 'yolov5p6_synthetic.onnx'))
+            providers = ['CPUExecutionProvider']
+
+        backend = create_backend(args.backend, model, args.weights, providers, args.target)
+        images = load_images(args.source, args.images)
+        result = benchmark(backend, images, args.iterations, args.warmup, tmp)
+        result.update({'backend': args.backend, 'model': args.model or 'synthetic'})
+        if hasattr(backend, 'providers'):
+            result['providers'] = list(backend.providers)
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.json == '-':
+        print(json.dumps(result, indent=2))
+        return
+    print_report(result, baseline)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+        print('write:%s' % args.json)
+
+
+if __name__ == '__main__':
+    main()
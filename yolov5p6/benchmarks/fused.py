@@ -0,0 +1,59 @@
+import argparse
+
+import numpy as np
+
+from .. import fused
+from ..decode import decode_batch
+from ..pipeline import nms_boxes
+from ..spec import YOLOV5P6_512X512
+from .decode import sparse_outputs, timeit
+
+
+def reference_postprocess(out, img_sizes, spec):
+    """
+    the numpy decode + NMS path used when numba is not installed
+    """
+    return [nms_boxes(boxes, scores, class_ids, spec) for boxes, scores, class_ids in decode_batch(out, img_sizes, spec)]
+
+
+def check_parity(ref, fast):
+    """
+    :return: max abs difference of boxes and scores, raises when the kept boxes differ
+    """
+    box_diff = score_diff = 0.0
+    for a, b in zip(ref, fast):
+        if len(a) != len(b) or not np.array_equal(a.class_ids, b.class_ids):
+            raise AssertionError('fused kernel keeps different boxes: %d vs %d' % (len(a), len(b)))
+        if len(a):
+            box_diff = max(box_diff, float(np.abs(a.boxes - b.boxes).max()))
+            score_diff = max(score_diff, float(np.abs(a.scores - b.scores).max()))
+    return box_diff, score_diff
+
+
+def main():
+    parser = argparse.ArgumentParser(description='numpy decode + NMS vs the fused numba kernel')
+    parser.add_argument('--batch', type=int, default=1)
+    parser.add_argument('--number', type=int, default=50)
+    args = parser.parse_args()
+
+    if fused.numba is None:
+        print('numba is not installed, the fused kernel runs as plain python')
+        args.number = 1
+
+    print('%-22s %8s %12s %12s %10s %10s' % ('scene', 'kept', 'numpy(ms)', 'fused(ms)', 'box diff', 'score diff'))
+    for objects in [0, 10, 100, 400]:
+        for name, spec in [('', YOLOV5P6_512X512), (' letterbox', YOLOV5P6_512X512.replace(letterbox=True))]:
+            out = sparse_outputs(spec, args.batch, objects)
+            img_sizes = [(1080, 1920)] * args.batch
+            ref = reference_postprocess(out, img_sizes, spec)
+            # 第一次调用包含 numba 编译，timeit 会先调用一次
+            fast = fused.postprocess_batch(out, img_sizes, spec)
+            box_diff, score_diff = check_parity(ref, fast)
+            print('%-22s %8d %12.3f %12.3f %10.2g %10.2g' % (
+                '%d objects%s' % (objects, name), sum(len(d) for d in ref),
+                timeit(reference_postprocess, (out, img_sizes, spec), args.number),
+                timeit(fused.postprocess_batch, (out, img_sizes, spec), args.number), box_diff, score_diff))
+
+
+if __name__ == '__main__':
+    main()
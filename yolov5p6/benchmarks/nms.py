@@ -0,0 +1,84 @@
+import time
+import numpy as np
+
+from ..nms import NMS
+from ..spec import YOLOV5P6_512X512
+
+spec = YOLOV5P6_512X512
+
+
+def IOU(xmin1, ymin1, xmax1, ymax1, xmin2, ymin2, xmax2, ymax2):
+    xmin = max(xmin1, xmin2)
+    ymin = max(ymin1, ymin2)
+    xmax = min(xmax1, xmax2)
+    ymax = min(ymax1, ymax2)
+
+    innerWidth = max(xmax - xmin, 0)
+    innerHeight = max(ymax - ymin, 0)
+    innerArea = innerWidth * innerHeight
+
+    area1 = (xmax1 - xmin1) * (ymax1 - ymin1)
+    area2 = (xmax2 - xmin2) * (ymax2 - ymin2)
+
+    return innerArea / (area1 + area2 - innerArea)
+
+
+def pairwise_NMS(boxes, scores, class_ids):
+    """
+    the original O(n^2) DetectBox NMS, kept as the reference for comparison
+    """
+    order = sorted(range(len(scores)), key=lambda x: scores[x], reverse=True)
+    classes = [class_ids[i] for i in order]
+
+    keep = []
+    for i in range(len(order)):
+        if classes[i] == -1:
+            continue
+        keep.append(order[i])
+        for j in range(i + 1, len(order)):
+            if classes[i] == classes[j] and IOU(*boxes[order[i]], *boxes[order[j]]) > spec.nms_thre:
+                classes[j] = -1
+    return keep
+
+
+def crowded_scene(num, seed=0):
+    """
+    synthetic candidates clustered around a few objects, like the raw output of decode()
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.uniform(0, spec.input_w, (num // 10 + 1, 2))
+    xy = centers[rng.integers(0, len(centers), num)] + rng.normal(0, 6, (num, 2))
+    wh = rng.uniform(16, 96, (num, 2))
+    boxes = np.concatenate((xy - wh / 2, xy + wh / 2), axis=1)
+    scores = rng.uniform(0.4, 1.0, num)
+    class_ids = rng.integers(0, spec.class_num, num)
+    return boxes, scores, class_ids
+
+
+def timeit(func, args, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def main():
+    print('%10s %12s %12s %8s' % ('candidates', 'NMS(ms)', 'pairwise(ms)', 'kept'))
+    for num in [10, 100, 1000, 2000, 5000, 10000]:
+        boxes, scores, class_ids = crowded_scene(num)
+        # 不截断，衡量 NMS 本身的开销
+        args = (boxes, scores, class_ids, spec.nms_thre, None, None)
+        keep = NMS(*args)
+        fast = timeit(NMS, args, 5)
+        if num <= 2000:
+            slow = '%12.2f' % timeit(pairwise_NMS, (boxes.tolist(), scores.tolist(), class_ids.tolist()), 1)
+        else:
+            slow = '%12s' % '-'
+        print('%10d %12.2f %s %8d' % (num, fast, slow, len(keep)))
+
+
+if __name__ == '__main__':
+    print('This is main ...')
+    main()
@@ -0,0 +1,60 @@
+import argparse
+import os
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from ..pipeline import Detector
+from ..backends.onnx_backend import OnnxBackend
+from .synthetic_model import make_synthetic_model
+
+
+def load_images(image_path, num, size=(1080, 1920)):
+    if image_path is not None:
+        image = cv2.cvtColor(cv2.imread(image_path), cv2.COLOR_BGR2RGB)
+        return [image] * num
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, size + (3,), dtype=np.uint8) for _ in range(num)]
+
+
+def throughput(detector, images, batch_size, repeat):
+    """
+    images/sec of preprocess + run + decode + NMS over all images, best of repeat
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for i in range(0, len(images), batch_size):
+            detector.detect_batch(images[i:i + batch_size])
+        best = min(best, time.perf_counter() - start)
+    return len(images) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='onnxruntime images/sec vs batch size')
+    parser.add_argument('--model', type=str, default=None, help='onnx model, a synthetic six-head model if not given')
+    parser.add_argument('--image', type=str, default=None, help='test image, random 1920x1080 frames if not given')
+    parser.add_argument('--images', type=int, default=64, help='images per measurement')
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--threads', type=int, default=0, help='intra op threads, 0 lets onnxruntime decide')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = args.model or make_synthetic_model(os.path.join(tmp, 'yolov5p6_synthetic.onnx'))
+        images = load_images(args.image, args.images)
+
+        print('%10s %12s %12s' % ('batch', 'images/sec', 'ms/image'))
+        for batch_size in args.batch_sizes:
+            backend = OnnxBackend(model, providers=['CPUExecutionProvider'], intra_op_num_threads=args.threads,
+                                  max_batch_size=batch_size)
+            detector = Detector(backend)
+            detector.detect_batch(images[:batch_size])
+            fps = throughput(detector, images, batch_size, args.repeat)
+            print('%10d %12.1f %12.2f' % (batch_size, fps, 1000 / fps))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from ..preprocess import Preprocessor
+from ..spec import YOLOV5P6_512X512
+
+
+def reference_preprocess(src, spec):
+    """
+    the original demo preprocessing, one temporary per step
+    """
+    img = cv2.cvtColor(src, cv2.COLOR_BGR2RGB)
+    img = cv2.resize(img, (spec.input_w, spec.input_h))
+    img = img * 0.00392156
+    img = img.astype(np.float32)
+    img = img.transpose((2, 0, 1))
+    img = np.ascontiguousarray(img)
+    return np.expand_dims(img, axis=0)
+
+
+def timeit(func, args, number):
+    func(*args)
+    start = time.perf_counter()
+    for _ in range(number):
+        func(*args)
+    return (time.perf_counter() - start) / number * 1000
+
+
+def allocated_per_frame(func, args, number):
+    """
+    net bytes still allocated and peak bytes allocated per frame, measured with tracemalloc after a warmup call
+    """
+    func(*args)
+    tracemalloc.start()
+    func(*args)
+    before, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    for _ in range(number):
+        func(*args)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (after - before) / number, peak - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description='preprocess latency and per-frame allocations')
+    parser.add_argument('--image', type=str, default=None, help='test image, a random 1920x1080 frame if not given')
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    spec = YOLOV5P6_512X512
+    if args.image is not None:
+        src = cv2.imread(args.image)
+    else:
+        src = np.random.default_rng(0).integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+
+    preprocessor = Preprocessor(spec, swap_rb=True)
+    if not np.array_equal(preprocessor(src), reference_preprocess(src, spec)):
+        raise AssertionError('Preprocessor output differs from the reference preprocessing')
+
+    print('%-12s %10s %16s %16s' % ('', 'ms/frame', 'net bytes/frame', 'peak bytes'))
+    for name, func, func_args in [('reference', reference_preprocess, (src, spec)),
+                                  ('Preprocessor', preprocessor, (src,))]:
+        ms = timeit(func, func_args, args.number)
+        net, peak = allocated_per_frame(func, func_args, args.number)
+        print('%-12s %10.3f %16.1f %16d' % (name, ms, net, peak))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import argparse
+import http.client
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.parse
+
+import cv2
+import numpy as np
+
+from ..server import create_server
+from .synthetic_model import make_synthetic_model
+
+
+def encode_image(source, size=(1080, 1920)):
+    """
+    jpeg bytes of an image file, a random frame of size (h, w) if source is None
+    """
+    if source is not None:
+        with open(source, 'rb') as f:
+            return f.read()
+    image = np.random.default_rng(0).integers(0, 256, size + (3,), dtype=np.uint8)
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+def client(host, port, body, stop, latencies, batch_sizes, errors):
+    conn = http.client.HTTPConnection(host, port)
+    headers = {'Content-Type': 'image/jpeg'}
+    try:
+        while not stop.is_set():
+            start = time.perf_counter()
+            conn.request('POST', '/detect', body, headers)
+            response = conn.getresponse()
+            data = response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+            latencies.append(time.perf_counter() - start)
+            batch_sizes.append(json.loads(data)['batch_size'])
+    finally:
+        conn.close()
+
+
+def load_test(host, port, body, concurrency, duration):
+    """
+    concurrency keep-alive clients posting the same image for duration seconds
+    :return: dict with requests/sec, latency percentiles and mean batch size
+    """
+    stop = threading.Event()
+    latencies, batch_sizes, errors = [], [], []
+    threads = [threading.Thread(target=client, args=(host, port, body, stop, latencies, batch_sizes, errors),
+                                daemon=True) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, (50, 95, 99)) if latencies.size else (0.0, 0.0, 0.0)
+    return {'requests': int(latencies.size), 'errors': len(errors), 'rps': latencies.size / elapsed,
+            'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99),
+            'mean_batch': float(np.mean(batch_sizes)) if batch_sizes else 0.0}
+
+
+def main():
+    from ..backends.onnx_backend import OnnxBackend
+
+    parser = argparse.ArgumentParser(description='throughput and tail latency of the detection server vs the '
+                                                 'batching window')
+    parser.add_argument('--url', type=str, default=None,
+                        help='load an already running server, e.g. http://127.0.0.1:8080, '
+                             'otherwise one server per --max_wait_ms is started in this process')
+    parser.add_argument('--model', type=str, default=None, help='onnx model, a synthetic six-head model if not given')
+    parser.add_argument('--image', type=str, default=None, help='posted image, a random 1920x1080 jpeg if not given')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per measurement')
+    parser.add_argument('--max_batch_size', type=int, default=8)
+    parser.add_argument('--max_wait_ms', type=float, nargs='+', default=[0, 2, 5, 10, 20])
+    parser.add_argument('--threads', type=int, default=0, help='onnxruntime intra op threads')
+    parser.add_argument('--json', type=str, default=None, help='write the results as json')
+    args = parser.parse_args()
+
+    body = encode_image(args.image)
+    print('%12s %8s %10s %10s %10s %10s %10s %8s' % ('max_wait_ms', 'requests', 'req/sec', 'p50(ms)', 'p95(ms)',
+                                                    'p99(ms)', 'mean batch', 'errors'))
+    results = []
+
+    def report(window, result):
+        result['max_wait_ms'] = window
+        results.append(result)
+        print('%12s %8d %10.1f %10.2f %10.2f %10.2f %10.2f %8d' % (
+            window, result['requests'], result['rps'], result['p50_ms'], result['p95_ms'], result['p99_ms'],
+            result['mean_batch'], result['errors']))
+
+    if args.url is not None:
+        url = urllib.parse.urlparse(args.url)
+        report('server', load_test(url.hostname, url.port or 80, body, args.concurrency, args.duration))
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            model = args.model or make_synthetic_model(os.path.join(tmp, 'yolov5p6_synthetic.onnx'))
+            backend = OnnxBackend(model, providers=['CPUExecutionProvider'], intra_op_num_threads=args.threads,
+                                  max_batch_size=args.max_batch_size)
+            for window in args.max_wait_ms:
+                server = create_server(backend, port=0, max_batch_size=args.max_batch_size, max_wait_ms=window)
+                thread = threading.Thread(target=server.serve_forever, daemon=True)
+                thread.start()
+                try:
+                    host, port = server.server_address
+                    report(window, load_test(host, port, body, args.concurrency, args.duration))
+                finally:
+                    server.shutdown()
+                    server.server_close()
+                    server.batcher.stop()
+
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('write:%s' % args.json)
+
+
+if __name__ == '__main__':
+    main()
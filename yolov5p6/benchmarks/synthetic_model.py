@@ -0,0 +1,81 @@
+import argparse
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper, numpy_helper
+
+from ..spec import YOLOV5P6_512X512
+
+
+def make_synthetic_model(path, spec=YOLOV5P6_512X512, batch_size=None, seed=0, opset=13):
+    """
+    tiny onnx model with the same input and head output shapes as the real export, used to run the
+    onnxruntime path without the real weights. every head is avgpool(stride) -> 1x1 conv, objectness rises
+    with the brightness of the cell, so on synthetic_frame() only the cells covering the bright objects pass the
+    thresholds, like a real frame
+    :param path: where to save the model
+    :param spec: ModelSpec giving input size, strides and anchors
+    :param batch_size: fixed batch size, None for a dynamic batch dimension
+    """
+    rng = np.random.default_rng(seed)
+    gs = 4 + 1 + spec.class_num
+    channels = spec.anchor_num * gs
+    batch = batch_size if batch_size is not None else 'batch'
+
+    nodes = []
+    initializers = []
+    outputs = []
+    for head, (stride, (grid_h, grid_w)) in enumerate(zip(spec.strides, spec.cell_size)):
+        weight = rng.normal(0, 3.0, (spec.anchor_num, gs, 3, 1, 1)).astype(np.float32)
+        bias = np.zeros((spec.anchor_num, gs), dtype=np.float32)
+        # 背景（平均亮度 < 0.4）的 objectness logit < -3，亮目标（> 0.75）的 > 1；
+        # stride 8、16 的输出头不响应，否则每个目标会覆盖上百个 cell
+        weight[:, 4] = rng.uniform(3.5, 4.5, (spec.anchor_num, 3, 1, 1))
+        bias[:, 4] = -8.0 if stride >= 32 else -16.0
+        # 类别由红、蓝通道的差决定
+        weight[:, 5:] = 0
+        weight[:, 5, 0], weight[:, 5, 2] = 6.0, -6.0
+        weight[:, 6, 0], weight[:, 6, 2] = -6.0, 6.0
+        name = 'output%d' % (head + 1)
+
+        initializers.append(numpy_helper.from_array(weight.reshape((channels, 3, 1, 1)), 'w%d' % head))
+        initializers.append(numpy_helper.from_array(bias.reshape(-1), 'b%d' % head))
+        nodes.append(helper.make_node('AveragePool', ['data'], ['pool%d' % head], kernel_shape=[stride, stride],
+                                      strides=[stride, stride]))
+        nodes.append(helper.make_node('Conv', ['pool%d' % head, 'w%d' % head, 'b%d' % head], [name]))
+        outputs.append(helper.make_tensor_value_info(name, TensorProto.FLOAT, [batch, channels, grid_h, grid_w]))
+
+    inputs = [helper.make_tensor_value_info('data', TensorProto.FLOAT, [batch, 3, spec.input_h, spec.input_w])]
+    graph = helper.make_graph(nodes, 'yolov5p6_synthetic', inputs, outputs, initializers)
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid('', opset)])
+    model.ir_version = 8
+    onnx.checker.check_model(model)
+    onnx.save(model, path)
+    return path
+
+
+def synthetic_frame(rng, size=(1080, 1920), objects=12):
+    """
+    RGB frame for the synthetic model: dark noise with bright red or blue rectangles of random size, each one
+    leaves a realistic cluster of overlapping candidates for decode and NMS
+    :param size: (h, w)
+    """
+    img_h, img_w = size
+    frame = rng.integers(0, 80, size + (3,), dtype=np.uint8)
+    for _ in range(objects):
+        box_w = int(rng.integers(img_w // 30, img_w // 4))
+        box_h = int(rng.integers(img_h // 20, img_h // 3))
+        x = int(rng.integers(0, img_w - box_w))
+        y = int(rng.integers(0, img_h - box_h))
+        color = (255, 200, 160) if rng.random() < 0.5 else (160, 200, 255)
+        frame[y:y + box_h, x:x + box_w] = color
+    return frame
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='generate a tiny onnx model with the yolov5p6 head shapes')
+    parser.add_argument('path', type=str)
+    parser.add_argument('--batch_size', type=int, default=None, help='fixed batch size, dynamic if not given')
+    args = parser.parse_args()
+    make_synthetic_model(args.path, batch_size=args.batch_size)
+    print('write:%s' % args.path)
@@ -0,0 +1,92 @@
+import argparse
+import time
+
+import numpy as np
+
+from ..detections import Detections
+from ..nms import box_iou
+from ..tracker import ByteTracker, linear_sum_assignment
+
+
+def simulate(objects, frames, img_size=(1080, 1920), miss=0.05, seed=0):
+    """
+    objects moving at constant speed inside the frame, detections are the true boxes with pixel noise, a few
+    missed and a few with a low score
+    :return: list of (true boxes, Detections) per frame
+    """
+    rng = np.random.default_rng(seed)
+    img_h, img_w = img_size
+    size = rng.uniform(20, 80, (objects, 2))
+    center = np.stack((rng.uniform(size[:, 0], img_w - size[:, 0]), rng.uniform(size[:, 1], img_h - size[:, 1])),
+                      axis=1)
+    velocity = rng.normal(0, 3, (objects, 2))
+    class_ids = rng.integers(0, 2, objects)
+
+    result = []
+    for _ in range(frames):
+        center += velocity
+        # 碰到边界反弹
+        bounce = (center < size) | (center > np.array([img_w, img_h]) - size)
+        velocity[bounce] *= -1
+        truth = np.concatenate((center - size / 2, center + size / 2), axis=1)
+
+        seen = rng.random(objects) > miss
+        boxes = truth[seen] + rng.normal(0, 1.5, (int(seen.sum()), 4))
+        scores = np.where(rng.random(int(seen.sum())) < 0.1, rng.uniform(0.15, 0.5, int(seen.sum())),
+                          rng.uniform(0.5, 0.95, int(seen.sum())))
+        result.append((truth, Detections(boxes, scores, class_ids[seen])))
+    return result
+
+
+def id_switches(truth, boxes, ids, last_ids):
+    """
+    number of objects whose matched track id changed since the previous frame, updates last_ids in place
+    """
+    if len(boxes) == 0:
+        return 0
+    iou = box_iou(truth, boxes)
+    best = iou.argmax(axis=1)
+    found = iou[np.arange(len(truth)), best] > 0.5
+    current = np.where(found, ids[best], -1)
+    switched = int(((last_ids >= 0) & (current >= 0) & (current != last_ids)).sum())
+    last_ids[found] = current[found]
+    return switched
+
+
+def main():
+    parser = argparse.ArgumentParser(description='ByteTracker cost per frame vs number of tracks')
+    parser.add_argument('--objects', type=int, nargs='+', default=[10, 50, 100, 200, 400, 800])
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--interval', type=int, default=3, help='detector runs every interval-th frame')
+    args = parser.parse_args()
+
+    print('linear assignment: %s' % ('scipy' if linear_sum_assignment is not None else 'numpy hungarian'))
+    print('%8s %8s %14s %14s %10s %10s' % ('objects', 'tracks', 'update(ms)', 'predict(ms)', 'id switch', 'coverage'))
+    for objects in args.objects:
+        frames = simulate(objects, args.frames)
+        tracker = ByteTracker()
+        last_ids = np.full(objects, -1, dtype=np.int64)
+        update_time = predict_time = 0.0
+        updates = predicts = switches = 0
+        covered = []
+        for index, (truth, predbox) in enumerate(frames):
+            start = time.perf_counter()
+            if index % args.interval == 0:
+                boxes, ids = tracker.update(predbox)
+                update_time += time.perf_counter() - start
+                updates += 1
+            else:
+                boxes, ids = tracker.predict()
+                predict_time += time.perf_counter() - start
+                predicts += 1
+            switches += id_switches(truth, boxes.boxes, ids, last_ids)
+            if len(boxes):
+                covered.append(float((box_iou(truth, boxes.boxes).max(axis=1) > 0.5).mean()))
+
+        print('%8d %8d %14.3f %14.3f %10d %9.1f%%' % (
+            objects, len(tracker), update_time / max(updates, 1) * 1000, predict_time / max(predicts, 1) * 1000,
+            switches, np.mean(covered) * 100 if covered else 0.0))
+
+
+if __name__ == '__main__':
+    main()
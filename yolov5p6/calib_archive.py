@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+
+import cv2
+import numpy as np
+
+from .calibration import select_images
+from .preprocess import Preprocessor, normalize_lut, resize
+from .spec import YOLOV5P6_512X512
+
+MAGIC = b'Y5CALSET'
+# 数据块按页对齐，位置记录在头部的 offset 中
+ALIGN = 4096
+VERSION = 1
+LAYOUTS = ('NCHW', 'NHWC')
+DTYPES = ('uint8', 'float32')
+
+
+def sample_shape(layout, height, width):
+    return (3, height, width) if layout == 'NCHW' else (height, width, 3)
+
+
+def _header_bytes(header):
+    text = json.dumps(header).encode()
+    return MAGIC + np.uint32(len(text)).tobytes() + text
+
+
+def _write_header(f, header):
+    data = _header_bytes(header)
+    if len(data) > header['offset']:
+        raise ValueError('calibration archive header is larger than %d bytes' % header['offset'])
+    f.seek(0)
+    f.write(data + b'\0' * (header['offset'] - len(data)))
+
+
+def build_archive(files, path, spec=YOLOV5P6_512X512, dtype='uint8', layout='NCHW', read=cv2.imread):
+    """
+    preprocess images once into a single archive: a json header followed by one contiguous
+    (count, 3, h, w) or (count, h, w, 3) block of RGB samples
+    :param files: image paths, unreadable ones are skipped
+    :param spec: input size and resize / letterbox mode, letterbox padding follows spec.pad_position and
+        spec.pad_value, use boundary / 127 for the horizon PadResizeTransformer
+    :param dtype: uint8 keeps the resized pixels (rknn / horizon normalize inside the model),
+        float32 stores the normalized network input exactly like Preprocessor
+    :param layout: NCHW or NHWC
+    :return: number of samples written
+    """
+    if dtype not in DTYPES:
+        raise ValueError('invalid dtype %s' % dtype)
+    if layout not in LAYOUTS:
+        raise ValueError('invalid layout %s' % layout)
+
+    shape = sample_shape(layout, spec.input_h, spec.input_w)
+    header = {
+        'version': VERSION,
+        'dtype': dtype,
+        'layout': layout,
+        'shape': [len(files)] + list(shape),
+        'color': 'RGB',
+        'letterbox': spec.letterbox,
+        'pad_position': spec.pad_position,
+        'pad_value': spec.pad_value,
+        'names': [os.path.basename(file) for file in files],
+        'offset': 0,
+    }
+    # 按全部文件名预留头部空间，跳过的图片只会让头部变短，之后原位改写
+    header['offset'] = (len(_header_bytes(header)) + 32 + ALIGN - 1) // ALIGN * ALIGN
+    header['names'] = []
+    offset = header['offset']
+    preprocessor = Preprocessor(spec, swap_rb=True) if dtype == 'float32' else None
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        _write_header(f, header)
+        f.truncate(offset + len(files) * int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    block = np.memmap(tmp_path, dtype=dtype, mode='r+', offset=offset, shape=(len(files),) + shape) \
+        if files else np.empty((0,) + shape, dtype=dtype)
+
+    count = 0
+    for file in files:
+        image = read(file)
+        if image is None:
+            print('skip unreadable calibration image %s' % file)
+            continue
+        if preprocessor is not None:
+            preprocessor(image, out=block[count] if layout == 'NCHW' else None)
+            if layout == 'NHWC':
+                np.copyto(block[count], preprocessor.blob[0].transpose((1, 2, 0)))
+        else:
+            rgb = resize(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), spec)
+            np.copyto(block[count], rgb.transpose((2, 0, 1)) if layout == 'NCHW' else rgb)
+        header['names'].append(os.path.basename(file))
+        count += 1
+    if isinstance(block, np.memmap):
+        block.flush()
+    del block
+
+    header['shape'][0] = count
+    with open(tmp_path, 'r+b') as f:
+        _write_header(f, header)
+        f.truncate(offset + count * int(np.prod(shape)) * np.dtype(dtype).itemsize)
+    os.replace(tmp_path, path)
+    return count
+
+
+class CalibArchive(object):
+    """
+    read-only memory map of an archive written by build_archive, samples and batches are views into the
+    mapping, nothing is decoded or copied until a toolchain touches the pages
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            head = f.read(len(MAGIC) + 4)
+            if head[:len(MAGIC)] != MAGIC:
+                raise ValueError('%s is not a calibration archive' % path)
+            size = int(np.frombuffer(head[len(MAGIC):], dtype=np.uint32)[0])
+            self.header = json.loads(f.read(size).decode())
+        if self.header['version'] != VERSION:
+            raise ValueError('unsupported calibration archive version %s' % self.header['version'])
+
+        self.path = path
+        self.dtype = np.dtype(self.header['dtype'])
+        self.layout = self.header['layout']
+        self.names = self.header['names']
+        shape = tuple(self.header['shape'])
+        self.data = np.memmap(path, dtype=self.dtype, mode='r', offset=self.header['offset'], shape=shape) \
+            if shape[0] > 0 else np.empty(shape, dtype=self.dtype)
+
+    def __len__(self):
+        return self.data.shape[0]
+
+    def __getitem__(self, index):
+        return self.data[index]
+
+    @property
+    def sample_shape(self):
+        return self.data.shape[1:]
+
+    @property
+    def input_size(self):
+        """
+        (h, w) of the samples
+        """
+        return self.sample_shape[1:] if self.layout == 'NCHW' else self.sample_shape[:2]
+
+    def samples(self):
+        """
+        (name, sample view) in archive order
+        """
+        for i in range(len(self)):
+            yield self.names[i], self.data[i]
+
+    def batches(self, batch_size, drop_last=True):
+        """
+        contiguous (batch_size, ...) views, the last incomplete batch is dropped unless drop_last is False
+        """
+        end = len(self) - len(self) % batch_size if drop_last else len(self)
+        for start in range(0, end, batch_size):
+            yield self.data[start:start + batch_size]
+
+    def float_batches(self, batch_size, scale=None):
+        """
+        NCHW float32 network input batches, views for float32 NCHW archives, otherwise normalized with the
+        Preprocessor lookup table into one reused buffer
+        """
+        if self.dtype == np.float32 and self.layout == 'NCHW':
+            for batch in self.batches(batch_size):
+                yield batch
+            return
+
+        lut = normalize_lut() if scale is None else normalize_lut(scale)
+        out = None
+        for batch in self.batches(batch_size):
+            if self.layout == 'NHWC':
+                batch = batch.transpose((0, 3, 1, 2))
+            if out is None:
+                out = np.empty(batch.shape, dtype=np.float32)
+            if self.dtype == np.uint8:
+                np.take(lut, batch, out=out)
+            else:
+                np.copyto(out, batch)
+            yield out
+
+
+def write_npy_dataset(archive, dst_dir, txt_name='dataset.txt'):
+    """
+    rknn build() only reads a dataset list, write each sample as NHWC .npy plus the list so quantization skips
+    jpeg decoding and resizing
+    :return: path of the list file
+    """
+    os.makedirs(dst_dir, exist_ok=True)
+    lines = []
+    for i, (name, sample) in enumerate(archive.samples()):
+        if archive.layout == 'NCHW':
+            sample = sample.transpose((1, 2, 0))
+        npy_name = '%06d_%s.npy' % (i, os.path.splitext(name)[0])
+        np.save(os.path.join(dst_dir, npy_name), np.ascontiguousarray(sample))
+        lines.append(npy_name)
+    txt_path = os.path.join(dst_dir, txt_name)
+    with open(txt_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    return txt_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='preprocess calibration images into one memory-mapped archive')
+    parser.add_argument('--src', type=str, required=True, help='image directory or dataset.txt list')
+    parser.add_argument('--output', type=str, required=True, help='archive path, e.g. calib.calset')
+    parser.add_argument('--num', type=int, default=None, help='use at most this many images')
+    parser.add_argument('--width', type=int, default=YOLOV5P6_512X512.input_w)
+    parser.add_argument('--height', type=int, default=YOLOV5P6_512X512.input_h)
+    parser.add_argument('--letterbox', action='store_true')
+    parser.add_argument('--pad_position', type=str, choices=('center', 'boundary'), default='center',
+                        help='letterbox image position, boundary (top left) for horizon PadResizeTransformer')
+    parser.add_argument('--pad_value', type=int, default=YOLOV5P6_512X512.pad_value,
+                        help='letterbox padding value, 127 for horizon PadResizeTransformer')
+    parser.add_argument('--dtype', type=str, choices=DTYPES, default='uint8')
+    parser.add_argument('--layout', type=str, choices=LAYOUTS, default='NCHW')
+    args = parser.parse_args()
+
+    spec = YOLOV5P6_512X512.replace(input_w=args.width, input_h=args.height, letterbox=args.letterbox,
+                                    pad_position=args.pad_position, pad_value=args.pad_value)
+    files = select_images(args.src, args.num)
+    count = build_archive(files, args.output, spec, args.dtype, args.layout)
+    archive = CalibArchive(args.output)
+    print('%d samples %s %s %s -> %s' % (count, args.dtype, args.layout, archive.sample_shape, args.output))
+
+
+if __name__ == '__main__':
+    main()
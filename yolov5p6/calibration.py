@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+
+import cv2
+import numpy as np
+
+from .artifact_cache import file_digest
+from .preprocess import SCALE, Preprocessor
+from .stream import IMAGE_EXTS
+
+
+def select_images(source, limit=None):
+    """
+    calibration images from a directory (sorted by name) or from a list file in the rknn dataset.txt format,
+    one path per line relative to the list file
+    :param limit: keep at most this many images, spread evenly over the sorted list
+    """
+    if os.path.isdir(source):
+        files = [os.path.join(source, name) for name in sorted(os.listdir(source))
+                 if os.path.splitext(name)[1].lower() in IMAGE_EXTS]
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source) as f:
+            files = [os.path.join(base, line.strip()) for line in f if line.strip()]
+
+    if limit is not None and len(files) > limit:
+        files = [files[i] for i in np.linspace(0, len(files) - 1, limit).round().astype(int)]
+    return files
+
+
+def write_dataset_txt(files, path):
+    """
+    write an image list in the rknn dataset.txt format, paths relative to the list file
+    """
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, 'w') as f:
+        for file in files:
+            f.write(os.path.relpath(os.path.abspath(file), base) + '\n')
+
+
+def calibration_batches(files, spec, batch_size, read=cv2.imread):
+    """
+    (batch_size, 3, h, w) float32 batches preprocessed exactly like inference (RGB, resize or letterbox, / 255),
+    the last incomplete batch is dropped. the same buffer is yielded every time
+    :param read: path -> BGR image, None if unreadable
+    """
+    preprocessor = Preprocessor(spec, swap_rb=True)
+    batch = np.empty((batch_size, 3, spec.input_h, spec.input_w), dtype=np.float32)
+    filled = 0
+    for file in files:
+        image = read(file)
+        if image is None:
+            print('skip unreadable calibration image %s' % file)
+            continue
+        preprocessor(image, out=batch[filled])
+        filled += 1
+        if filled == batch_size:
+            yield batch
+            filled = 0
+
+
+def preprocess_settings(spec, batch_size):
+    """
+    the options calibration_batches preprocesses with, anything changing the calibration input
+    """
+    return {'input_size': [spec.input_w, spec.input_h], 'letterbox': spec.letterbox, 'pad_value': spec.pad_value,
+            'pad_position': spec.pad_position, 'scale': SCALE, 'swap_rb': True, 'batch_size': batch_size}
+
+
+def calibration_cache_path(cache_file, files, settings):
+    """
+    cache_file with a digest of the calibration files and settings before its extension, e.g.
+    model.calib -> model.3f2a9c1b04d7.calib, so another dataset or preprocessing calibrates again instead of
+    reusing a stale table
+    :param files: calibration images, or the calibration archive
+    :param settings: json serializable options, see preprocess_settings
+    """
+    h = hashlib.sha256(json.dumps(settings, sort_keys=True).encode())
+    for path in files:
+        h.update(file_digest(path).encode())
+    root, ext = os.path.splitext(cache_file)
+    return '%s.%s%s' % (root, h.hexdigest()[:12], ext)
+
+
+class CalibrationStream(object):
+    """
+    the part of a TensorRT calibrator that does not need a GPU: hands out batches and reads / writes the
+    calibration cache, so a rebuild with an existing cache skips calibration entirely
+    :param batches: iterable of (batch_size, 3, h, w) float32 arrays, see calibration_batches
+    :param batch_size: batch size of the arrays
+    :param cache_file: calibration cache path, None to always calibrate
+    :param to_device: to_device(array) -> device pointer holding a copy of the array
+    """
+
+    def __init__(self, batches, batch_size, cache_file, to_device):
+        self.batches = iter(batches)
+        self.batch_size = batch_size
+        self.cache_file = cache_file
+        self.to_device = to_device
+        self.count = 0
+
+    def get_batch(self, names):
+        """
+        :return: one device pointer per input name, None when the calibration set is exhausted
+        """
+        batch = next(self.batches, None)
+        if batch is None:
+            return None
+        self.count += 1
+        return [self.to_device(batch)]
+
+    def read_calibration_cache(self):
+        if self.cache_file is not None and os.path.exists(self.cache_file):
+            with open(self.cache_file, 'rb') as f:
+                return f.read()
+        return None
+
+    def write_calibration_cache(self, cache):
+        if self.cache_file is None:
+            return
+        tmp_path = self.cache_file + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(bytes(cache))
+        os.replace(tmp_path, self.cache_file)
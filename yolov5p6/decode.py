@@ -0,0 +1,231 @@
+import numpy as np
+
+from . import metrics
+from .preprocess import letterbox_info
+from .tables import decode_tables
+
+
+def sigmoid(x):
+    return 1 / (1 + np.exp(-x))
+
+
+def logit(p):
+    return np.log(p / (1 - p))
+
+
+def objectness_floor(spec):
+    """
+    raw objectness below which no class can pass its threshold: sigmoid(obj) * sigmoid(cls) > t needs
+    sigmoid(obj) > t, i.e. obj > logit(t). lowered by a small margin so rounding never rejects a real candidate
+    """
+    thre = min(spec.obj_thre)
+    if spec.presigmoid:
+        return thre - 1e-6
+    return logit(thre) - 1e-6
+
+
+def dense_candidates(y, thre, presigmoid, mask=None):
+    """
+    sigmoid on the whole head, then threshold every (cell, anchor, class)
+    :param mask: (h, w) bool, only cells set in it are candidates, None for all
+    :return: n, h, w, a, cl indices, xywh (k, 4) and scores (k,) of the candidates
+    """
+    # 输出已经过 sigmoid 时也按 float64 相乘，与原来逐点循环的标量运算一致
+    y = y.astype(np.float64)
+    if not presigmoid:
+        y = sigmoid(y)
+
+    # (batch, h, w, anchor, class)，与逐点循环的遍历顺序一致
+    conf = (y[:, :, 5:] * y[:, :, 4:5]).transpose((0, 3, 4, 1, 2))
+    passed = conf > thre
+    if mask is not None:
+        passed &= mask[np.newaxis, :, :, np.newaxis, np.newaxis]
+    n, h, w, a, cl = np.nonzero(passed)
+    return n, h, w, a, cl, y[n, a, :4, h, w], conf[n, h, w, a, cl]
+
+
+def sparse_candidates(y, thre, presigmoid, obj_floor, mask=None):
+    """
+    reject on the raw objectness first, sigmoid and class thresholds only for the surviving cells
+    :return: same as dense_candidates, in the same order
+    """
+    # (batch, h, w, anchor)，保证与 dense_candidates 的顺序一致
+    passed = y[:, :, 4].transpose((0, 2, 3, 1)) > obj_floor
+    if mask is not None:
+        passed &= mask[np.newaxis, :, :, np.newaxis]
+    n, h, w, a = np.nonzero(passed)
+    cand = y[n, a, :, h, w].astype(np.float64)
+    if not presigmoid:
+        cand = sigmoid(cand)
+
+    conf = cand[:, 5:] * cand[:, 4:5]
+    k, cl = np.nonzero(conf > thre)
+    return n[k], h[k], w[k], a[k], cl, cand[k, :4], conf[k, cl]
+
+
+def head_outputs(out, spec):
+    """
+    head outputs in stride order, whether the runtime returned a list or a dict
+    """
+    if isinstance(out, dict):
+        names = spec.output_names if spec.output_names is not None else sorted(out)
+        return [out[name] for name in names]
+    return list(out)
+
+
+def head_view(y, spec, head):
+    """
+    view of one head output as (batch, anchor, 5 + class, h, w)
+    """
+    grid_h, grid_w = spec.cell_size[head]
+    gs = 4 + 1 + spec.class_num
+    if spec.layout == 'NHWC':
+        return y.reshape((-1, grid_h, grid_w, spec.anchor_num, gs)).transpose((0, 3, 4, 1, 2))
+    return y.reshape((-1, spec.anchor_num, gs, grid_h, grid_w))
+
+
+def image_transforms(img_sizes, spec):
+    """
+    per image mapping from network to source coordinates, source = (network - pad) * scale
+    :return: scale_x, scale_y, pad_x, pad_y arrays and the LetterboxInfo list (None when stretching)
+    """
+    img_h = img_sizes[:, 0]
+    img_w = img_sizes[:, 1]
+    if not spec.letterbox:
+        zeros = np.zeros(len(img_sizes))
+        return img_w / spec.input_w, img_h / spec.input_h, zeros, zeros, None
+
+    infos = [letterbox_info(h, w, spec) for h, w in img_sizes]
+    scale = np.array([1 / info.scale for info in infos])
+    pad_x = np.array([info.pad_x for info in infos], dtype=np.float64)
+    pad_y = np.array([info.pad_y for info in infos], dtype=np.float64)
+    return scale, scale, pad_x, pad_y, infos
+
+
+def content_cells(infos, stride, grid_h, grid_w):
+    """
+    rows and columns of a head whose cells can predict a center inside the resized image of any image in the
+    batch, a center may move -0.5 to 1.5 cells from its cell
+    :return: row_start, row_end, col_start, col_end
+    """
+    top = min(info.pad_y for info in infos)
+    bottom = max(info.pad_y + info.new_h for info in infos)
+    left = min(info.pad_x for info in infos)
+    right = max(info.pad_x + info.new_w for info in infos)
+
+    rows = np.arange(grid_h)
+    cols = np.arange(grid_w)
+    valid_rows = np.nonzero(((rows + 1.5) * stride > top) & ((rows - 0.5) * stride < bottom))[0]
+    valid_cols = np.nonzero(((cols + 1.5) * stride > left) & ((cols - 0.5) * stride < right))[0]
+    return valid_rows[0], valid_rows[-1] + 1, valid_cols[0], valid_cols[-1] + 1
+
+
+def head_cells(spec, head, grid_h, grid_w, infos=None, cell_masks=None):
+    """
+    cells of one head worth decoding: the rows and columns that can reach the letterboxed content and the
+    bounding rectangle of the cell mask
+    :return: row_start, row_end, col_start, col_end, mask cropped to them (None without cell_masks)
+    """
+    row0, row1, col0, col1 = 0, grid_h, 0, grid_w
+    if infos is not None and spec.skip_padding:
+        row0, row1, col0, col1 = content_cells(infos, spec.strides[head], grid_h, grid_w)
+    if cell_masks is None:
+        return row0, row1, col0, col1, None
+
+    mask = cell_masks[head]
+    rows = np.nonzero(mask.any(axis=1))[0]
+    cols = np.nonzero(mask.any(axis=0))[0]
+    if rows.size == 0:
+        return 0, 0, 0, 0, mask[:0, :0]
+    row0, row1 = max(row0, rows[0]), min(row1, rows[-1] + 1)
+    col0, col1 = max(col0, cols[0]), min(col1, cols[-1] + 1)
+    row1, col1 = max(row0, row1), max(col0, col1)
+    return row0, row1, col0, col1, mask[row0:row1, col0:col1]
+
+
+@metrics.timed('decode')
+def decode_batch(out, img_sizes, spec, cell_masks=None):
+    """
+    vectorized decode of all heads for a whole batch
+    :param out: head outputs as returned by the runtime, batch first
+    :param img_sizes: (img_h, img_w) of every source image in the batch
+    :param spec: ModelSpec of the model
+    :param cell_masks: optional (h, w) bool mask of every head shared by the batch, cells outside it are skipped
+        (see roi.RegionOfInterest)
+    :return: list with boxes (N, 4) [xmin, ymin, xmax, ymax], scores (N,), class ids (N,) of every image
+    """
+    out = head_outputs(out, spec)
+    img_sizes = np.array(img_sizes, dtype=np.float64).reshape((-1, 2))
+    img_h = img_sizes[:, 0]
+    img_w = img_sizes[:, 1]
+    scale_w, scale_h, pad_x, pad_y, infos = image_transforms(img_sizes, spec)
+    thre = np.array(spec.obj_thre)
+    tables = decode_tables(spec)
+    obj_floor = objectness_floor(spec)
+
+    boxes = []
+    scores = []
+    class_ids = []
+    batch_ids = []
+    for head in range(spec.output_head):
+        y = head_view(out[head], spec, head)
+        # 只解码可能落在图像内容区域和 mask 内的 grid
+        row0, row1, col0, col1, mask = head_cells(spec, head, y.shape[3], y.shape[4], infos, cell_masks)
+        y = y[..., row0:row1, col0:col1]
+        if y.shape[3] == 0 or y.shape[4] == 0:
+            continue
+
+        if spec.early_reject:
+            n, h, w, a, cl, xywh, conf = sparse_candidates(y, thre, spec.presigmoid, obj_floor, mask)
+        else:
+            n, h, w, a, cl, xywh, conf = dense_candidates(y, thre, spec.presigmoid, mask)
+        if n.size == 0:
+            continue
+
+        xywh = xywh.astype(np.float64)
+        table = tables[head]
+        grid = table.grid_xy[0, :, h + row0, w + col0]
+        anchor = table.anchor_wh[a, :, 0, 0]
+        # stride 是 2 的幂，(x + grid) * stride 与 x * stride + grid * stride 结果逐位相同
+        bx = (xywh[:, 0] * 2.0 - 0.5) * table.stride + grid[:, 0]
+        by = (xywh[:, 1] * 2.0 - 0.5) * table.stride + grid[:, 1]
+        bw = (xywh[:, 2] * 2) ** 2 * anchor[:, 0]
+        bh = (xywh[:, 3] * 2) ** 2 * anchor[:, 1]
+
+        xmin = np.maximum((bx - bw / 2 - pad_x[n]) * scale_w[n], 0)
+        ymin = np.maximum((by - bh / 2 - pad_y[n]) * scale_h[n], 0)
+        xmax = np.minimum((bx + bw / 2 - pad_x[n]) * scale_w[n], img_w[n])
+        ymax = np.minimum((by + bh / 2 - pad_y[n]) * scale_h[n], img_h[n])
+
+        boxes.append(np.stack((xmin, ymin, xmax, ymax), axis=1))
+        scores.append(conf.astype(np.float64))
+        class_ids.append(cl)
+        batch_ids.append(n)
+
+    batch = len(img_sizes)
+    if len(boxes) == 0:
+        return [(np.zeros((0, 4)), np.zeros((0,)), np.zeros((0,), dtype=np.int64)) for _ in range(batch)]
+
+    boxes = np.concatenate(boxes)
+    scores = np.concatenate(scores)
+    class_ids = np.concatenate(class_ids)
+    batch_ids = np.concatenate(batch_ids)
+
+    # 按图片分组，组内保持 head 的顺序
+    order = np.argsort(batch_ids, kind='stable')
+    bounds = np.cumsum(np.bincount(batch_ids, minlength=batch))[:-1]
+    return list(zip(np.split(boxes[order], bounds), np.split(scores[order], bounds),
+                    np.split(class_ids[order], bounds)))
+
+
+def decode(out, img_h, img_w, spec, cell_masks=None):
+    """
+    vectorized decode of all heads for a single image
+    :param out: head outputs as returned by the runtime
+    :param img_h: source image height
+    :param img_w: source image width
+    :param spec: ModelSpec of the model
+    :param cell_masks: see decode_batch
+    :return: boxes (N, 4) [xmin, ymin, xmax, ymax], scores (N,), class ids (N,)
+    """
+    return decode_batch(out, [(img_h, img_w)], spec, cell_masks)[0]
@@ -0,0 +1,167 @@
+import numpy as np
+
+
+class DetectBox(object):
+    """
+    one detection, returned when iterating Detections
+    """
+    __slots__ = ('classId', 'score', 'xmin', 'ymin', 'xmax', 'ymax')
+
+    def __init__(self, classId, score, xmin, ymin, xmax, ymax):
+        self.classId = classId
+        self.score = score
+        self.xmin = xmin
+        self.ymin = ymin
+        self.xmax = xmax
+        self.ymax = ymax
+
+    def __repr__(self):
+        return 'DetectBox(%d, %.4f, %.1f, %.1f, %.1f, %.1f)' % (
+            self.classId, self.score, self.xmin, self.ymin, self.xmax, self.ymax)
+
+
+class Detections(object):
+    """
+    detections of one image as parallel arrays, 21 bytes of data per box
+    :param boxes: (n, 4) xmin, ymin, xmax, ymax, stored as float32
+    :param scores: (n,) stored as float32
+    :param class_ids: (n,) stored as uint8
+    """
+    __slots__ = ('boxes', 'scores', 'class_ids')
+
+    def __init__(self, boxes, scores, class_ids):
+        self.boxes = np.asarray(boxes, dtype=np.float32).reshape((-1, 4))
+        self.scores = np.asarray(scores, dtype=np.float32).reshape(-1)
+        self.class_ids = np.asarray(class_ids, dtype=np.uint8).reshape(-1)
+        if not len(self.boxes) == len(self.scores) == len(self.class_ids):
+            raise ValueError('boxes, scores and class_ids differ in length: %d %d %d' % (
+                len(self.boxes), len(self.scores), len(self.class_ids)))
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty((0, 4), dtype=np.float32), np.empty(0, dtype=np.float32), np.empty(0, dtype=np.uint8))
+
+    @classmethod
+    def from_boxes(cls, predbox):
+        """
+        from an iterable of DetectBox
+        """
+        predbox = list(predbox)
+        if not predbox:
+            return cls.empty()
+        return cls([(b.xmin, b.ymin, b.xmax, b.ymax) for b in predbox], [b.score for b in predbox],
+                   [b.classId for b in predbox])
+
+    def __len__(self):
+        return len(self.scores)
+
+    def __getitem__(self, index):
+        """
+        an int gives a DetectBox, a slice, index array or boolean mask gives Detections (views for slices)
+        """
+        if isinstance(index, (int, np.integer)):
+            xmin, ymin, xmax, ymax = self.boxes[index].tolist()
+            return DetectBox(int(self.class_ids[index]), float(self.scores[index]), xmin, ymin, xmax, ymax)
+        return Detections(self.boxes[index], self.scores[index], self.class_ids[index])
+
+    def __iter__(self):
+        for class_id, score, (xmin, ymin, xmax, ymax) in zip(self.class_ids.tolist(), self.scores.tolist(),
+                                                             self.boxes.tolist()):
+            yield DetectBox(class_id, score, xmin, ymin, xmax, ymax)
+
+    def __repr__(self):
+        return 'Detections(%d boxes)' % len(self)
+
+    def filter(self, min_score=None, classes=None):
+        """
+        :param min_score: keep scores >= min_score
+        :param classes: keep these class ids
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if min_score is not None:
+            mask &= self.scores >= min_score
+        if classes is not None:
+            mask &= np.isin(self.class_ids, classes)
+        return self[mask]
+
+    def by_class(self, class_id):
+        return self[self.class_ids == class_id]
+
+    def per_class(self):
+        """
+        dict of class id -> Detections of that class, keeping the order of the boxes
+        """
+        return {int(c): self.by_class(c) for c in np.unique(self.class_ids)}
+
+    def sorted(self):
+        """
+        highest score first, ties keep their order
+        """
+        return self[np.argsort(-self.scores, kind='stable')]
+
+    @property
+    def areas(self):
+        return (self.boxes[:, 2] - self.boxes[:, 0]) * (self.boxes[:, 3] - self.boxes[:, 1])
+
+    @staticmethod
+    def concat(items):
+        items = list(items)
+        if not items:
+            return Detections.empty()
+        return Detections(np.concatenate([d.boxes for d in items]), np.concatenate([d.scores for d in items]),
+                          np.concatenate([d.class_ids for d in items]))
+
+    def split(self, counts):
+        """
+        inverse of concat, views of consecutive runs of counts[i] boxes
+        """
+        ends = np.cumsum(counts)
+        if len(ends) and ends[-1] != len(self):
+            raise ValueError('counts sum to %d, expected %d' % (ends[-1], len(self)))
+        return [self[start:end] for start, end in zip(np.concatenate(([0], ends[:-1])), ends)]
+
+    def to_list(self, classes=None):
+        """
+        json serializable list of dicts, class names added when classes is given
+        """
+        result = []
+        for box in self:
+            item = {'class_id': box.classId, 'score': box.score, 'box': [box.xmin, box.ymin, box.xmax, box.ymax]}
+            if classes is not None:
+                item['class'] = classes[box.classId]
+            result.append(item)
+        return result
+
+    def to_bytes(self):
+        return np.uint32(len(self)).tobytes() + self.boxes.tobytes() + self.scores.tobytes() + \
+            self.class_ids.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        read-only views into data, nothing is copied
+        """
+        n = int(np.frombuffer(data, dtype=np.uint32, count=1)[0])
+        boxes = np.frombuffer(data, dtype=np.float32, count=n * 4, offset=4).reshape((n, 4))
+        scores = np.frombuffer(data, dtype=np.float32, count=n, offset=4 + n * 16)
+        class_ids = np.frombuffer(data, dtype=np.uint8, count=n, offset=4 + n * 20)
+        return cls(boxes, scores, class_ids)
+
+
+def save_detections(path, frames):
+    """
+    detections of many frames (e.g. a long video) in one .npz, the boxes of all frames are stored as one array
+    """
+    frames = list(frames)
+    merged = Detections.concat(frames)
+    np.savez(path, boxes=merged.boxes, scores=merged.scores, class_ids=merged.class_ids,
+             counts=np.array([len(d) for d in frames], dtype=np.int64))
+
+
+def load_detections(path):
+    """
+    :return: list of Detections, one per frame
+    """
+    with np.load(path) as data:
+        merged = Detections(data['boxes'], data['scores'], data['class_ids'])
+        return merged.split(data['counts'])
@@ -0,0 +1,194 @@
+import math
+import os
+import time
+
+import numpy as np
+
+from . import metrics
+from .decode import head_outputs, head_view, image_transforms, head_cells, objectness_floor
+from .detections import Detections
+from .tables import decode_tables
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# 安装了 numba 时 postprocess 自动使用编译后的内核，YOLOV5P6_FUSED=0 可以关闭
+ENABLED = numba is not None and os.environ.get('YOLOV5P6_FUSED', '1') != '0'
+
+
+def _jit(func):
+    if numba is None:
+        return func
+    # numpy 的浮点除零语义（0 / 0 得到 nan），与 NMS 的数组实现一致
+    return numba.njit(cache=True, nogil=True, error_model='numpy')(func)
+
+
+@_jit
+def _decode_head(y, n, thre, obj_floor, presigmoid, stride, anchor_wh, scale_w, scale_h, pad_x, pad_y,
+                 img_w, img_h, row0, row1, col0, col1, mask, boxes, scores, class_ids, count):
+    """
+    threshold, sigmoid, box decode and clipping of one head of one image in a single pass, candidates are
+    appended to boxes / scores / class_ids from count on in (h, w, anchor, class) order
+    :param mask: (h, w) bool of the whole head, cells not set are skipped
+    :return: new count
+    """
+    num_anchor = y.shape[1]
+    num_class = y.shape[2] - 5
+    for h in range(row0, row1):
+        for w in range(col0, col1):
+            if not mask[h, w]:
+                continue
+            for a in range(num_anchor):
+                raw_obj = y[n, a, 4, h, w]
+                if not raw_obj > obj_floor:
+                    continue
+                obj = np.float64(raw_obj) if presigmoid else 1 / (1 + math.exp(-np.float64(raw_obj)))
+
+                decoded = False
+                xmin = ymin = xmax = ymax = 0.0
+                for cl in range(num_class):
+                    if presigmoid:
+                        conf = np.float64(y[n, a, 5 + cl, h, w]) * obj
+                    else:
+                        conf = 1 / (1 + math.exp(-np.float64(y[n, a, 5 + cl, h, w]))) * obj
+                    if not conf > thre[cl]:
+                        continue
+
+                    if not decoded:
+                        if presigmoid:
+                            x = np.float64(y[n, a, 0, h, w])
+                            yy = np.float64(y[n, a, 1, h, w])
+                            bw = np.float64(y[n, a, 2, h, w])
+                            bh = np.float64(y[n, a, 3, h, w])
+                        else:
+                            x = 1 / (1 + math.exp(-np.float64(y[n, a, 0, h, w])))
+                            yy = 1 / (1 + math.exp(-np.float64(y[n, a, 1, h, w])))
+                            bw = 1 / (1 + math.exp(-np.float64(y[n, a, 2, h, w])))
+                            bh = 1 / (1 + math.exp(-np.float64(y[n, a, 3, h, w])))
+                        bx = (x * 2.0 - 0.5) * stride + np.float64(w * stride)
+                        by = (yy * 2.0 - 0.5) * stride + np.float64(h * stride)
+                        bw = (bw * 2) * (bw * 2) * anchor_wh[a, 0]
+                        bh = (bh * 2) * (bh * 2) * anchor_wh[a, 1]
+                        xmin = max((bx - bw / 2 - pad_x) * scale_w, 0.0)
+                        ymin = max((by - bh / 2 - pad_y) * scale_h, 0.0)
+                        xmax = min((bx + bw / 2 - pad_x) * scale_w, img_w)
+                        ymax = min((by + bh / 2 - pad_y) * scale_h, img_h)
+                        decoded = True
+
+                    boxes[count, 0] = xmin
+                    boxes[count, 1] = ymin
+                    boxes[count, 2] = xmax
+                    boxes[count, 3] = ymax
+                    scores[count] = conf
+                    class_ids[count] = cl
+                    count += 1
+    return count
+
+
+@_jit
+def _nms(boxes, scores, class_ids, nms_thre, pre_topk, max_det):
+    """
+    same greedy class-offset NMS as nms.NMS, pre_topk / max_det < 0 for no limit
+    """
+    order = np.argsort(-scores, kind='mergesort')
+    if 0 <= pre_topk < order.size:
+        order = order[:pre_topk]
+    k = order.size
+    keep = np.empty(k, dtype=np.int64)
+    if k == 0:
+        return keep
+
+    offset_unit = boxes.max() + 1
+    xmin = np.empty(k)
+    ymin = np.empty(k)
+    xmax = np.empty(k)
+    ymax = np.empty(k)
+    areas = np.empty(k)
+    for i in range(k):
+        b = order[i]
+        offset = class_ids[b] * offset_unit
+        xmin[i] = boxes[b, 0] + offset
+        ymin[i] = boxes[b, 1] + offset
+        xmax[i] = boxes[b, 2] + offset
+        ymax[i] = boxes[b, 3] + offset
+        areas[i] = (boxes[b, 2] - boxes[b, 0]) * (boxes[b, 3] - boxes[b, 1])
+
+    suppressed = np.zeros(k, dtype=np.bool_)
+    num_keep = 0
+    for i in range(k):
+        if suppressed[i]:
+            continue
+        if 0 <= max_det <= num_keep:
+            break
+        keep[num_keep] = order[i]
+        num_keep += 1
+        cls = class_ids[order[i]]
+        for j in range(i + 1, k):
+            # 不同类别平移后不相交，iou 为 0
+            if suppressed[j] or class_ids[order[j]] != cls:
+                continue
+            inner_w = max(min(xmax[i], xmax[j]) - max(xmin[i], xmin[j]), 0.0)
+            inner_h = max(min(ymax[i], ymax[j]) - max(ymin[i], ymin[j]), 0.0)
+            inner = inner_w * inner_h
+            if inner / (areas[i] + areas[j] - inner) > nms_thre:
+                suppressed[j] = True
+    return keep[:num_keep]
+
+
+def postprocess_batch(out, img_sizes, spec, cell_masks=None):
+    """
+    fused decode + NMS, same results as pipeline.postprocess_batch up to the last bit of exp()
+    :param cell_masks: see decode.decode_batch
+    :return: list of Detections, one per image
+    """
+    start = time.perf_counter()
+    out = head_outputs(out, spec)
+    img_sizes = np.array(img_sizes, dtype=np.float64).reshape((-1, 2))
+    scale_w, scale_h, pad_x, pad_y, infos = image_transforms(img_sizes, spec)
+    thre = np.array(spec.obj_thre, dtype=np.float64)
+    obj_floor = objectness_floor(spec)
+    tables = decode_tables(spec)
+
+    heads = []
+    capacity = 0
+    for head in range(spec.output_head):
+        y = head_view(out[head], spec, head)
+        cells = head_cells(spec, head, y.shape[3], y.shape[4], infos, cell_masks)[:4]
+        mask = cell_masks[head] if cell_masks is not None else np.ones(y.shape[3:], dtype=np.bool_)
+        anchor_wh = tables[head].anchor_wh[:, :, 0, 0].astype(np.float64)
+        heads.append((y, tables[head].stride, anchor_wh, cells, mask))
+        capacity += (cells[1] - cells[0]) * (cells[3] - cells[2]) * spec.anchor_num * spec.class_num
+
+    pre_topk = -1 if spec.nms_pre_topk is None else spec.nms_pre_topk
+    max_det = -1 if spec.max_det is None else spec.max_det
+    boxes = np.empty((capacity, 4))
+    scores = np.empty(capacity)
+    class_ids = np.empty(capacity, dtype=np.int64)
+    results = []
+    # 与 numpy 实现一样上报 decode（整个 batch 一次）和 NMS（每张图一次）的耗时
+    timing = bool(metrics.hooks)
+    decode_seconds = time.perf_counter() - start if timing else 0.0
+    for n in range(len(img_sizes)):
+        t0 = time.perf_counter() if timing else 0.0
+        count = 0
+        for y, stride, anchor_wh, (row0, row1, col0, col1), mask in heads:
+            count = _decode_head(y, n, thre, obj_floor, spec.presigmoid, stride, anchor_wh, scale_w[n], scale_h[n],
+                                 pad_x[n], pad_y[n], img_sizes[n, 1], img_sizes[n, 0], row0, row1, col0, col1,
+                                 mask, boxes, scores, class_ids, count)
+        if timing:
+            t1 = time.perf_counter()
+            decode_seconds += t1 - t0
+        keep = _nms(boxes[:count], scores[:count], class_ids[:count], spec.nms_thre, pre_topk, max_det)
+        if timing:
+            metrics.record('nms', time.perf_counter() - t1)
+            metrics.record_nms(class_ids[:count], class_ids[keep])
+        results.append(Detections(boxes[keep], scores[keep], class_ids[keep]))
+    if timing:
+        metrics.record('decode', decode_seconds)
+    return results
+
+
+def postprocess(out, img_h, img_w, spec, cell_masks=None):
+    return postprocess_batch(out, [(img_h, img_w)], spec, cell_masks)[0]
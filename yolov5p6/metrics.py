@@ -0,0 +1,238 @@
+import functools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from .spec import CLASSES
+
+# YOLOV5P6_METRICS=0 去掉所有包装，被装饰的函数就是原函数
+AVAILABLE = os.environ.get('YOLOV5P6_METRICS', '1') != '0'
+
+# 没有注册 hook 时，被包装的函数只多一次列表判断
+hooks = []
+
+# 秒，Prometheus histogram 的 le 边界
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Hook(object):
+    """
+    receives the timings and counts of the pipeline, subclasses override what they need. called from the
+    thread doing the work, implementations must be thread safe and fast
+    """
+
+    def on_timing(self, stage, seconds):
+        """
+        :param stage: preprocess / inference / postprocess / decode / nms / render
+        """
+        pass
+
+    def on_count(self, name, class_ids):
+        """
+        :param name: candidates (boxes entering NMS) or detections (boxes kept), one event per image
+        :param class_ids: class id of every box
+        """
+        pass
+
+
+def add_hook(hook):
+    if hook not in hooks:
+        hooks.append(hook)
+    return hook
+
+
+def remove_hook(hook):
+    if hook in hooks:
+        hooks.remove(hook)
+
+
+def record(stage, seconds):
+    for hook in hooks:
+        hook.on_timing(stage, seconds)
+
+
+def record_nms(candidate_ids, kept_ids):
+    """
+    class ids of the boxes entering and leaving NMS for one image
+    """
+    for hook in hooks:
+        hook.on_count('candidates', candidate_ids)
+        hook.on_count('detections', kept_ids)
+
+
+def timed(stage):
+    """
+    decorator reporting the wall time of every call to the hooks as stage
+    """
+
+    def wrap(func):
+        if not AVAILABLE:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not hooks:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(stage, time.perf_counter() - start)
+        return wrapper
+    return wrap
+
+
+class StageHistogram(object):
+    def __init__(self):
+        self.buckets = np.zeros(len(BUCKETS) + 1, dtype=np.int64)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.buckets[np.searchsorted(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+
+class MetricsCollector(Hook):
+    """
+    cumulative stage histograms and per class box counters, exported as Prometheus text or json
+    :param classes: class names used as labels, ids without a name are labelled by the number
+    :param prefix: metric name prefix
+    """
+
+    def __init__(self, classes=CLASSES, prefix='yolov5p6'):
+        self.classes = list(classes)
+        self.prefix = prefix
+        self.stages = {}
+        self.counts = {'candidates': np.zeros(len(self.classes), dtype=np.int64),
+                       'detections': np.zeros(len(self.classes), dtype=np.int64)}
+        self.images = 0
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+
+    def on_timing(self, stage, seconds):
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = StageHistogram()
+            self.stages[stage].add(seconds)
+
+    def on_count(self, name, class_ids):
+        counts = np.bincount(np.asarray(class_ids, dtype=np.int64), minlength=len(self.classes))
+        with self.lock:
+            total = self.counts.get(name)
+            if total is None or total.size < counts.size:
+                grown = np.zeros(counts.size, dtype=np.int64)
+                if total is not None:
+                    grown[:total.size] = total
+                total = self.counts[name] = grown
+            total[:counts.size] += counts
+            if name == 'detections':
+                self.images += 1
+
+    def class_name(self, class_id):
+        return self.classes[class_id] if class_id < len(self.classes) else str(class_id)
+
+    def snapshot(self):
+        """
+        :return: json serializable dict of all values so far
+        """
+        with self.lock:
+            stages = {stage: {'count': h.count, 'sum_s': h.sum, 'mean_ms': h.sum / h.count * 1000 if h.count else 0.0,
+                              'max_ms': h.max * 1000} for stage, h in self.stages.items()}
+            counts = {name: {self.class_name(i): int(n) for i, n in enumerate(total)}
+                      for name, total in self.counts.items()}
+            images = self.images
+        return {'time': time.time(), 'uptime_s': time.time() - self.start_time, 'images': images,
+                'stages': stages, 'counts': counts}
+
+    def prometheus(self):
+        """
+        :return: Prometheus text exposition format
+        """
+        p = self.prefix
+        lines = ['# HELP %s_stage_seconds wall time of each pipeline stage' % p,
+                 '# TYPE %s_stage_seconds histogram' % p]
+        with self.lock:
+            for stage, h in self.stages.items():
+                cumulative = np.cumsum(h.buckets)
+                for le, n in zip(BUCKETS, cumulative):
+                    lines.append('%s_stage_seconds_bucket{stage="%s",le="%g"} %d' % (p, stage, le, n))
+                lines.append('%s_stage_seconds_bucket{stage="%s",le="+Inf"} %d' % (p, stage, h.count))
+                lines.append('%s_stage_seconds_sum{stage="%s"} %.9f' % (p, stage, h.sum))
+                lines.append('%s_stage_seconds_count{stage="%s"} %d' % (p, stage, h.count))
+            for name, total in self.counts.items():
+                lines.append('# TYPE %s_%s_total counter' % (p, name))
+                for i, n in enumerate(total):
+                    lines.append('%s_%s_total{class="%s"} %d' % (p, name, self.class_name(i), n))
+            lines.append('# TYPE %s_images_total counter' % p)
+            lines.append('%s_images_total %d' % (p, self.images))
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path):
+        """
+        atomic write, e.g. into the node_exporter textfile collector directory
+        """
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(self.prometheus())
+        os.replace(tmp_path, path)
+
+    def write_jsonl(self, path):
+        """
+        append one snapshot line
+        """
+        with open(path, 'a') as f:
+            f.write(json.dumps(self.snapshot()) + '\n')
+
+
+class MetricsExporter(object):
+    """
+    background thread writing the collector every interval seconds and once more on stop
+    :param prometheus_path: Prometheus text file, rewritten each time
+    :param jsonl_path: json lines file, one snapshot appended each time
+    """
+
+    def __init__(self, collector, interval=10.0, prometheus_path=None, jsonl_path=None):
+        self.collector = collector
+        self.interval = interval
+        self.prometheus_path = prometheus_path
+        self.jsonl_path = jsonl_path
+        self._stop = threading.Event()
+        self._thread = None
+
+    def export(self):
+        if self.prometheus_path is not None:
+            self.collector.write_prometheus(self.prometheus_path)
+        if self.jsonl_path is not None:
+            self.collector.write_jsonl(self.jsonl_path)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self.export()
+
+    def start(self):
+        add_hook(self.collector)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name='metrics-exporter', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        remove_hook(self.collector)
+        self.export()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,171 @@
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from .nms import box_iou
+from .pipeline import Detector, draw_detections
+from .stream import VideoSink, open_source
+
+
+class MotionGate(object):
+    """
+    decides per frame whether the scene changed enough to run the detector. the frame is shrunk to a small gray
+    thumbnail and compared to the thumbnail of the last frame that was run, so slow changes still add up
+    :param width: thumbnail width, the height keeps the aspect ratio
+    :param pixel_thre: gray level difference counted as a changed thumbnail pixel
+    :param threshold: fraction of changed thumbnail pixels that triggers inference
+    :param max_skip: run at least every max_skip + 1 frames even without motion, 0 runs every frame
+    """
+
+    def __init__(self, width=96, pixel_thre=12, threshold=0.002, max_skip=25):
+        self.width = width
+        self.pixel_thre = pixel_thre
+        self.threshold = threshold
+        self.max_skip = max_skip
+        self.reference = None
+        self.skipped = 0
+
+    def thumbnail(self, frame):
+        img_h, img_w = frame.shape[:2]
+        height = max(int(round(img_h * self.width / img_w)), 1)
+        small = cv2.resize(frame, (self.width, height), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+
+    def score(self, thumbnail):
+        """
+        fraction of thumbnail pixels that changed since the reference, 1 without a reference
+        """
+        if self.reference is None or self.reference.shape != thumbnail.shape:
+            return 1.0
+        return np.count_nonzero(cv2.absdiff(thumbnail, self.reference) > self.pixel_thre) / thumbnail.size
+
+    def __call__(self, frame):
+        """
+        :param frame: HWC uint8 frame
+        :return: True when the detector should run on this frame
+        """
+        thumbnail = self.thumbnail(frame)
+        if self.skipped >= self.max_skip or self.score(thumbnail) >= self.threshold:
+            self.reference = thumbnail
+            self.skipped = 0
+            return True
+        self.skipped += 1
+        return False
+
+    def reset(self):
+        self.reference = None
+        self.skipped = 0
+
+
+class GatedDetector(object):
+    """
+    Detector for fixed cameras that reuses the previous detections while the MotionGate sees no change
+    :param detector: Detector, or a Backend which is wrapped into one
+    :param gate: MotionGate
+    """
+
+    def __init__(self, detector, gate=None):
+        self.detector = detector if isinstance(detector, Detector) else Detector(detector)
+        self.gate = gate if gate is not None else MotionGate()
+        self.last = None
+        self.frames = 0
+        self.inferred = 0
+
+    def detect(self, frame):
+        """
+        :param frame: RGB HWC uint8 frame
+        :return: Detections, True if the detector ran on this frame
+        """
+        self.frames += 1
+        if self.last is not None and not self.gate(frame):
+            return self.last, False
+        if self.last is None:
+            self.gate(frame)
+        self.last = self.detector.detect(frame)
+        self.inferred += 1
+        return self.last, True
+
+    @property
+    def skip_ratio(self):
+        return 1 - self.inferred / self.frames if self.frames else 0.0
+
+    def reset(self):
+        self.gate.reset()
+        self.last = None
+
+
+def match_ratio(reference, predbox, iou_thre=0.5):
+    """
+    fraction of the reference boxes overlapped above iou_thre by a box of the same class in predbox, 1 if the
+    reference is empty
+    """
+    if len(reference) == 0:
+        return 1.0
+    if len(predbox) == 0:
+        return 0.0
+    iou = box_iou(reference.boxes, predbox.boxes)
+    iou[reference.class_ids[:, np.newaxis] != predbox.class_ids[np.newaxis]] = 0
+    return float((iou.max(axis=1) > iou_thre).mean())
+
+
+def main():
+    from .backends.onnx_backend import OnnxBackend
+
+    parser = argparse.ArgumentParser(description='motion gated detection on a fixed camera video')
+    parser.add_argument('--model', type=str, required=True, help='onnx model')
+    parser.add_argument('--source', type=str, required=True, help='video file, stream url or image directory')
+    parser.add_argument('--output', type=str, default=None, help='result video')
+    parser.add_argument('--width', type=int, default=96, help='thumbnail width of the motion score')
+    parser.add_argument('--pixel_thre', type=int, default=12)
+    parser.add_argument('--threshold', type=float, default=0.002, help='changed pixel fraction that runs inference')
+    parser.add_argument('--max_skip', type=int, default=25, help='run at least every max_skip + 1 frames')
+    parser.add_argument('--compare', action='store_true',
+                        help='also run every frame and report how far the reused detections drift')
+    args = parser.parse_args()
+
+    detector = Detector(OnnxBackend(args.model))
+    gated = GatedDetector(detector, MotionGate(args.width, args.pixel_thre, args.threshold, args.max_skip))
+    sink = VideoSink(args.output) if args.output is not None else None
+
+    gated_time = full_time = 0.0
+    recall = []
+    precision = []
+    try:
+        for frame_id, (name, frame) in enumerate(open_source(args.source)):
+            image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            start = time.perf_counter()
+            predbox, ran = gated.detect(image)
+            elapsed = time.perf_counter() - start
+            gated_time += elapsed
+
+            if args.compare:
+                if ran:
+                    reference = predbox
+                    full_time += elapsed
+                else:
+                    start = time.perf_counter()
+                    reference = detector.detect(image)
+                    full_time += time.perf_counter() - start
+                recall.append(match_ratio(reference, predbox))
+                precision.append(match_ratio(predbox, reference))
+
+            if sink is not None:
+                sink(frame_id, name, draw_detections(frame, predbox, detector.spec.classes), predbox)
+    finally:
+        if sink is not None:
+            sink.close()
+
+    frames = gated.frames
+    print('%d frames, %d inferred, skip ratio %.1f%%' % (frames, gated.inferred, gated.skip_ratio * 100))
+    if gated_time > 0:
+        print('effective fps %.1f' % (frames / gated_time))
+    if args.compare and frames:
+        print('every frame fps %.1f' % (frames / full_time))
+        print('drift vs every frame: recall %.3f, precision %.3f (iou > 0.5, same class), min recall %.3f' % (
+            np.mean(recall), np.mean(precision), np.min(recall)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import numpy as np
+
+from . import metrics
+
+
+def box_iou(boxes_a, boxes_b):
+    """
+    :param boxes_a: (N, 4) [xmin, ymin, xmax, ymax]
+    :param boxes_b: (M, 4)
+    :return: (N, M) iou of every pair, 0 for empty boxes
+    """
+    # 整数框先转成浮点，原地除法才有地方存 iou
+    dtype = np.result_type(boxes_a, boxes_b, np.float32)
+    a = np.ascontiguousarray(np.asarray(boxes_a).T, dtype=dtype)[:, :, np.newaxis]
+    b = np.ascontiguousarray(np.asarray(boxes_b).T, dtype=dtype)[:, np.newaxis]
+    # 原地运算，(N, M) 的临时数组只有两个
+    inner = np.minimum(a[2], b[2])
+    inner -= np.maximum(a[0], b[0])
+    np.maximum(inner, 0, out=inner)
+    inner_h = np.minimum(a[3], b[3])
+    inner_h -= np.maximum(a[1], b[1])
+    np.maximum(inner_h, 0, out=inner_h)
+    inner *= inner_h
+
+    union = np.add((a[2] - a[0]) * (a[3] - a[1]), (b[2] - b[0]) * (b[3] - b[1]), out=inner_h)
+    union -= inner
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.divide(inner, union, out=inner)
+    inner[~(union > 0)] = 0
+    return inner
+
+
+@metrics.timed('nms')
+def NMS(boxes, scores, class_ids, nms_thre=0.45, pre_topk=3000, max_det=300, metric='iou'):
+    """
+    class-aware greedy NMS on arrays
+    :param boxes: (N, 4) [xmin, ymin, xmax, ymax]
+    :param scores: (N,)
+    :param class_ids: (N,)
+    :param nms_thre: iou above which the lower scored box is suppressed
+    :param pre_topk: only the pre_topk highest scores take part, None for no limit
+    :param max_det: stop after max_det boxes are kept, None for no limit
+    :param metric: iou, or ios (intersection over the smaller box) which also removes a box cut off at a tile
+        border inside the complete box of the same object
+    :return: indices of kept boxes, highest score first
+    """
+    if metric not in ('iou', 'ios'):
+        raise ValueError('invalid metric %s' % metric)
+    order = np.argsort(-scores, kind='stable')[:pre_topk]
+    if order.size == 0:
+        return order
+
+    # 按类别平移坐标，不同类别的框互不相交，所有类别一次完成
+    offset = class_ids[order].astype(np.float64) * (boxes.max() + 1)
+    xmin = boxes[order, 0] + offset
+    ymin = boxes[order, 1] + offset
+    xmax = boxes[order, 2] + offset
+    ymax = boxes[order, 3] + offset
+    areas = (boxes[order, 2] - boxes[order, 0]) * (boxes[order, 3] - boxes[order, 1])
+
+    keep = []
+    remain = np.arange(order.size)
+    while remain.size > 0 and (max_det is None or len(keep) < max_det):
+        i = remain[0]
+        keep.append(i)
+        rest = remain[1:]
+
+        inner_w = np.maximum(np.minimum(xmax[i], xmax[rest]) - np.maximum(xmin[i], xmin[rest]), 0)
+        inner_h = np.maximum(np.minimum(ymax[i], ymax[rest]) - np.maximum(ymin[i], ymin[rest]), 0)
+        inner = inner_w * inner_h
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if metric == 'iou':
+                iou = inner / (areas[i] + areas[rest] - inner)
+            else:
+                iou = inner / np.minimum(areas[i], areas[rest])
+
+        remain = rest[~(iou > nms_thre)]
+
+    return order[keep]
@@ -0,0 +1,178 @@
+import collections
+
+import cv2
+import numpy as np
+
+from . import fused, metrics
+from .decode import decode, decode_batch
+from .detections import DetectBox, Detections
+from .nms import NMS
+from .tables import decode_tables
+
+
+def nms_boxes(boxes, scores, class_ids, spec):
+    keep = NMS(boxes, scores, class_ids, spec.nms_thre, spec.nms_pre_topk, spec.max_det)
+    if metrics.hooks:
+        metrics.record_nms(class_ids, class_ids[keep])
+    return Detections(boxes[keep], scores[keep], class_ids[keep])
+
+
+@metrics.timed('postprocess')
+def postprocess(out, img_h, img_w, spec, cell_masks=None):
+    """
+    decode + NMS, the fused compiled kernel when numba is installed
+    :param out: head outputs as returned by the runtime
+    :param img_h: source image height
+    :param img_w: source image width
+    :param spec: ModelSpec of the model
+    :param cell_masks: optional per head (h, w) bool masks of the cells to decode, see roi.RegionOfInterest
+    :return: Detections, highest score first
+    """
+    if fused.ENABLED:
+        return fused.postprocess(out, img_h, img_w, spec, cell_masks)
+    boxes, scores, class_ids = decode(out, img_h, img_w, spec, cell_masks)
+    return nms_boxes(boxes, scores, class_ids, spec)
+
+
+@metrics.timed('postprocess')
+def postprocess_batch(out, img_sizes, spec, cell_masks=None):
+    """
+    decode + NMS for a batch of images
+    :param img_sizes: (img_h, img_w) of every source image in the batch
+    :param cell_masks: see postprocess, shared by the batch
+    :return: list of Detections, one per image
+    """
+    if fused.ENABLED:
+        return fused.postprocess_batch(out, img_sizes, spec, cell_masks)
+    return [nms_boxes(boxes, scores, class_ids, spec)
+            for boxes, scores, class_ids in decode_batch(out, img_sizes, spec, cell_masks)]
+
+
+@metrics.timed('render')
+def draw_detections(image, predbox, classes):
+    for box in predbox:
+        xmin = int(box.xmin)
+        ymin = int(box.ymin)
+        xmax = int(box.xmax)
+        ymax = int(box.ymax)
+
+        cv2.rectangle(image, (xmin, ymin), (xmax, ymax), (0, 255, 0), 2)
+        ptext = (xmin, ymin)
+        title = classes[box.classId] + "%.2f" % box.score
+        cv2.putText(image, title, ptext, cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2, cv2.LINE_AA)
+    return image
+
+
+class Backend(object):
+    """
+    runtime adapter used by Detector: preprocess -> run, decode and NMS are shared
+
+    subclasses set `spec` to the ModelSpec describing their outputs, including
+    whether the graph already applies the sigmoid and the head layout
+    """
+    spec = None
+
+    def preprocess(self, image):
+        """
+        RGB HWC uint8 image -> runtime input
+        """
+        raise NotImplementedError
+
+    def preprocess_batch(self, images):
+        """
+        RGB HWC uint8 images -> one contiguous batch, requires preprocess() to return a batch of one
+        """
+        first = self.preprocess(images[0])
+        batch = np.empty((len(images),) + first.shape[1:], dtype=first.dtype)
+        batch[0] = first[0]
+        for i in range(1, len(images)):
+            batch[i] = self.preprocess(images[i])[0]
+        return batch
+
+    def run(self, data):
+        """
+        runtime input -> head outputs, a list in stride order or a dict keyed by spec.output_names
+        """
+        raise NotImplementedError
+
+    def run_stream(self, datas):
+        """
+        iterable of runtime inputs -> generator of head outputs in input order, runtimes that can keep several
+        frames in flight override this
+        """
+        for data in datas:
+            yield self.run(data)
+
+    def warmup(self, times=1):
+        """
+        run a black frame through the runtime so lazy initialization happens before the first real frame
+        """
+        data = self.preprocess(np.zeros((self.spec.input_h, self.spec.input_w, 3), dtype=np.uint8))
+        for _ in range(times):
+            self.run(data)
+
+
+class Detector(object):
+    """
+    :param backend: Backend adapter
+    :param table_cache: optional .npz file holding the decode tables, for instant startup
+    """
+
+    def __init__(self, backend, table_cache=None):
+        self.backend = backend
+        self.spec = backend.spec
+        decode_tables(self.spec, table_cache)
+
+    @metrics.timed('preprocess')
+    def _preprocess(self, image):
+        return self.backend.preprocess(image)
+
+    @metrics.timed('preprocess')
+    def _preprocess_batch(self, images):
+        return self.backend.preprocess_batch(images)
+
+    @metrics.timed('inference')
+    def _run(self, data):
+        return self.backend.run(data)
+
+    def detect(self, image, cell_masks=None):
+        """
+        :param image: RGB HWC uint8 image
+        :param cell_masks: only decode these cells, see postprocess
+        :return: Detections in image coordinates
+        """
+        img_h, img_w = image.shape[:2]
+        data = self._preprocess(image)
+        out = self._run(data)
+        return postprocess(out, img_h, img_w, self.spec, cell_masks)
+
+    def detect_batch(self, images, cell_masks=None):
+        """
+        :param images: list of RGB HWC uint8 images, sizes may differ
+        :param cell_masks: see detect, shared by all images
+        :return: list of Detections, one per image
+        """
+        if len(images) == 0:
+            return []
+        img_sizes = [image.shape[:2] for image in images]
+        data = self._preprocess_batch(images)
+        out = self._run(data)
+        return postprocess_batch(out, img_sizes, self.spec, cell_masks)
+
+    def detect_stream(self, images):
+        """
+        :param images: iterable of RGB HWC uint8 images
+        :return: generator of Detections in input order, inference of the next image may overlap the
+            postprocess of the current one depending on the backend. metrics hooks see preprocess and
+            postprocess, inference overlaps them and is not timed
+        """
+        img_sizes = collections.deque()
+
+        def datas():
+            for image in images:
+                img_sizes.append(image.shape[:2])
+                yield self._preprocess(image)
+
+        for out in self.backend.run_stream(datas()):
+            img_h, img_w = img_sizes.popleft()
+            yield postprocess(out, img_h, img_w, self.spec)
@@ -0,0 +1,130 @@
+import cv2
+import numpy as np
+
+SCALE = 0.00392156
+
+
+def normalize_lut(scale=SCALE):
+    """
+    uint8 -> float32 lookup table, gives exactly the values of multiplying in float64 and casting to float32
+    """
+    return (np.arange(256, dtype=np.float64) * scale).astype(np.float32)
+
+
+_LUT = normalize_lut()
+
+
+class LetterboxInfo(object):
+    """
+    where the resized image sits inside the letterboxed input
+    :param scale: resize ratio, network pixels per source pixel
+    :param pad_x: left padding
+    :param pad_y: top padding
+    :param new_w: resized image width
+    :param new_h: resized image height
+    """
+
+    def __init__(self, scale, pad_x, pad_y, new_w, new_h):
+        self.scale = scale
+        self.pad_x = pad_x
+        self.pad_y = pad_y
+        self.new_w = new_w
+        self.new_h = new_h
+
+
+def letterbox_info(img_h, img_w, spec):
+    scale = min(spec.input_w / img_w, spec.input_h / img_h)
+    new_w = min(int(round(img_w * scale)), spec.input_w)
+    new_h = min(int(round(img_h * scale)), spec.input_h)
+    if spec.pad_position == 'boundary':
+        return LetterboxInfo(scale, 0, 0, new_w, new_h)
+    return LetterboxInfo(scale, (spec.input_w - new_w) // 2, (spec.input_h - new_h) // 2, new_w, new_h)
+
+
+def letterbox(src, spec):
+    """
+    aspect preserving resize, placed by spec.pad_position and padded with spec.pad_value to the network input size
+    :return: uint8 HWC image, LetterboxInfo
+    """
+    info = letterbox_info(src.shape[0], src.shape[1], spec)
+    img = np.full((spec.input_h, spec.input_w, 3), spec.pad_value, dtype=np.uint8)
+    img[info.pad_y:info.pad_y + info.new_h, info.pad_x:info.pad_x + info.new_w] = \
+        cv2.resize(src, (info.new_w, info.new_h))
+    return img, info
+
+
+def resize(src, spec):
+    """
+    resize an RGB image to the network input size, uint8 HWC, letterboxed if spec.letterbox
+    """
+    if spec.letterbox:
+        return letterbox(src, spec)[0]
+    return cv2.resize(src, (spec.input_w, spec.input_h))
+
+
+def preprocess(src, spec):
+    """
+    resize an RGB image and normalize it to a new float32 (1, 3, h, w) blob, safe to call from several threads
+    """
+    img = cv2.LUT(resize(src, spec), _LUT)
+    return np.ascontiguousarray(img.transpose((2, 0, 1)))[np.newaxis]
+
+
+class Preprocessor(object):
+    """
+    resize + normalize + HWC to NCHW into preallocated buffers, no per-frame allocation after the first call
+    (letterbox mode allocates once more whenever the source size changes).
+    the returned blob is overwritten by the next call, use one Preprocessor per thread
+    :param spec: ModelSpec giving the input size
+    :param swap_rb: swap the R and B channels, lets BGR frames from cv2 skip a full size cvtColor
+    :param scale: normalization factor
+    :param interpolation: cv2 resize interpolation
+    """
+
+    def __init__(self, spec, swap_rb=False, scale=SCALE, interpolation=cv2.INTER_LINEAR):
+        self.spec = spec
+        self.swap_rb = swap_rb
+        self.interpolation = interpolation
+        self.lut = normalize_lut(scale)
+
+        self.resized = np.empty((spec.input_h, spec.input_w, 3), dtype=np.uint8)
+        self.normalized = np.empty((spec.input_h, spec.input_w, 3), dtype=np.float32)
+        self.blob = np.empty((1, 3, spec.input_h, spec.input_w), dtype=np.float32)
+
+        # letterbox 模式下，源图尺寸不变时复用缩放缓冲区，填充区域也只需要写一次
+        self.info = None
+        self._src_size = None
+        self._content = None
+
+    def __call__(self, src, out=None):
+        """
+        :param src: uint8 HWC image
+        :param out: (3, h, w) or (1, 3, h, w) float32 buffer to write to instead of the own blob, e.g. a slot of
+            a batch or a runtime input buffer
+        :return: the filled buffer
+        """
+        if out is None:
+            out = self.blob
+
+        if self.spec.letterbox:
+            self._letterbox(src)
+        else:
+            cv2.resize(src, (self.spec.input_w, self.spec.input_h), dst=self.resized,
+                       interpolation=self.interpolation)
+        cv2.LUT(self.resized, self.lut, dst=self.normalized)
+        chw = self.normalized.transpose((2, 0, 1))
+        if self.swap_rb:
+            chw = chw[::-1]
+        np.copyto(out.reshape(chw.shape), chw)
+        return out
+
+    def _letterbox(self, src):
+        if src.shape[:2] != self._src_size:
+            self._src_size = src.shape[:2]
+            self.info = letterbox_info(src.shape[0], src.shape[1], self.spec)
+            self._content = np.empty((self.info.new_h, self.info.new_w, 3), dtype=np.uint8)
+            self.resized.fill(self.spec.pad_value)
+
+        info = self.info
+        cv2.resize(src, (info.new_w, info.new_h), dst=self._content, interpolation=self.interpolation)
+        np.copyto(self.resized[info.pad_y:info.pad_y + info.new_h, info.pad_x:info.pad_x + info.new_w], self._content)
@@ -0,0 +1,190 @@
+import argparse
+import json
+
+import cv2
+import numpy as np
+
+from .pipeline import Detector, draw_detections
+from .preprocess import letterbox_info
+
+# fillPoly 的定点小数位数，多边形顶点按 1/16 像素取整
+_SHIFT = 4
+
+
+def _fill(polygon, height, width):
+    mask = np.zeros((height, width), dtype=np.uint8)
+    points = np.round(np.asarray(polygon, dtype=np.float64) * (1 << _SHIFT)).astype(np.int32)
+    cv2.fillPoly(mask, [points], 1, lineType=cv2.LINE_8, shift=_SHIFT)
+    return mask
+
+
+def cell_masks(input_mask, spec):
+    """
+    per head (h, w) bool masks of the cells that can predict a center inside input_mask, a center may move
+    -0.5 to 1.5 cells from its cell, so a cell is kept when its [-0.5, 1.5) stride window touches the mask
+    :param input_mask: (input_h, input_w) uint8 mask in network input coordinates
+    """
+    masks = []
+    for stride, (grid_h, grid_w) in zip(spec.strides, spec.cell_size):
+        # 2 * stride 的窗口以 (cell + 0.5) * stride 为中心
+        window = cv2.dilate(input_mask, np.ones((2 * stride, 2 * stride), dtype=np.uint8), anchor=(stride, stride))
+        ys = np.minimum(((np.arange(grid_h) + 0.5) * stride).astype(int), spec.input_h - 1)
+        xs = np.minimum(((np.arange(grid_w) + 0.5) * stride).astype(int), spec.input_w - 1)
+        masks.append(window[np.ix_(ys, xs)] > 0)
+    return masks
+
+
+class RoiGeometry(object):
+    """
+    everything derived from a polygon for one frame size
+    :param rect: xmin, ymin, xmax, ymax of the crop in frame coordinates
+    :param mask: (crop_h, crop_w) uint8 polygon mask of the crop
+    :param cell_masks: per head cell masks for decode
+    """
+
+    def __init__(self, rect, mask, cell_masks):
+        self.rect = rect
+        self.mask = mask
+        self.cell_masks = cell_masks
+
+
+class RegionOfInterest(object):
+    """
+    polygon of one camera, the frame is cropped to the polygon's bounding rectangle before resizing and decode
+    only looks at cells whose possible centers reach the polygon
+    :param polygon: (k, 2) x, y vertices in frame coordinates
+    :param spec: ModelSpec of the model
+    :param margin: pixels added around the bounding rectangle, context for objects at the polygon border
+    :param drop_outside: drop detections whose box center is outside the polygon
+    """
+
+    def __init__(self, polygon, spec, margin=0, drop_outside=True):
+        self.polygon = np.asarray(polygon, dtype=np.float64).reshape((-1, 2))
+        if len(self.polygon) < 3:
+            raise ValueError('a roi polygon needs at least 3 points, got %d' % len(self.polygon))
+        self.spec = spec
+        self.margin = margin
+        self.drop_outside = drop_outside
+        self._geometry = {}
+
+    def geometry(self, img_h, img_w):
+        """
+        computed once per frame size
+        """
+        key = (img_h, img_w)
+        if key not in self._geometry:
+            self._geometry[key] = self._build(img_h, img_w)
+        return self._geometry[key]
+
+    def _build(self, img_h, img_w):
+        spec = self.spec
+        xmin, ymin = np.floor(self.polygon.min(axis=0)).astype(int) - self.margin
+        xmax, ymax = np.ceil(self.polygon.max(axis=0)).astype(int) + self.margin
+        xmin, ymin = max(int(xmin), 0), max(int(ymin), 0)
+        xmax, ymax = min(int(xmax), img_w), min(int(ymax), img_h)
+        if xmax <= xmin or ymax <= ymin:
+            raise ValueError('roi polygon is outside the %dx%d frame' % (img_w, img_h))
+        crop_w, crop_h = xmax - xmin, ymax - ymin
+        local = self.polygon - (xmin, ymin)
+
+        # drop_outside 按裁剪图的整像素判断，decode 的筛选用同一个掩码按 preprocess 的方式缩放到网络输入：
+        # INTER_AREA 缩小时保留任何含有多边形像素的网络像素，放大时向外插值，再外扩 1 个像素抵消取整，
+        # 单独在网络输入上栅格化多边形时边缘与 drop_outside 不一致，会丢掉 drop_outside 保留的框
+        crop_mask = _fill(local, crop_h, crop_w)
+        if spec.letterbox:
+            info = letterbox_info(crop_h, crop_w, spec)
+            x0, y0, new_w, new_h = info.pad_x, info.pad_y, info.new_w, info.new_h
+        else:
+            x0, y0, new_w, new_h = 0, 0, spec.input_w, spec.input_h
+        input_mask = np.zeros((spec.input_h, spec.input_w), dtype=np.uint8)
+        input_mask[y0:y0 + new_h, x0:x0 + new_w] = cv2.resize(crop_mask * 255, (new_w, new_h),
+                                                              interpolation=cv2.INTER_AREA) > 0
+        masks = cell_masks(cv2.dilate(input_mask, np.ones((3, 3), dtype=np.uint8)), spec)
+        return RoiGeometry((xmin, ymin, xmax, ymax), crop_mask, masks)
+
+    def crop(self, image):
+        """
+        :return: view of the roi rectangle of image, RoiGeometry
+        """
+        geometry = self.geometry(*image.shape[:2])
+        xmin, ymin, xmax, ymax = geometry.rect
+        return image[ymin:ymax, xmin:xmax], geometry
+
+    def to_frame(self, predbox, geometry):
+        """
+        Detections of the crop -> Detections of the frame, outside ones dropped if drop_outside
+        """
+        if self.drop_outside and len(predbox):
+            crop_h, crop_w = geometry.mask.shape
+            cx = np.clip(((predbox.boxes[:, 0] + predbox.boxes[:, 2]) / 2).astype(int), 0, crop_w - 1)
+            cy = np.clip(((predbox.boxes[:, 1] + predbox.boxes[:, 3]) / 2).astype(int), 0, crop_h - 1)
+            predbox = predbox[geometry.mask[cy, cx] > 0]
+        xmin, ymin = geometry.rect[:2]
+        return type(predbox)(predbox.boxes + np.array([xmin, ymin, xmin, ymin], dtype=np.float32), predbox.scores,
+                             predbox.class_ids)
+
+
+class RoiDetector(object):
+    """
+    Detector with a RegionOfInterest per camera, cameras without one run on the whole frame
+    :param detector: Detector, or a Backend which is wrapped into one
+    :param rois: dict camera -> RegionOfInterest
+    """
+
+    def __init__(self, detector, rois=None):
+        self.detector = detector if isinstance(detector, Detector) else Detector(detector)
+        self.rois = dict(rois or {})
+
+    def detect(self, image, camera=None):
+        """
+        :param image: RGB HWC uint8 frame
+        :param camera: key of the camera in rois
+        :return: Detections in frame coordinates
+        """
+        roi = self.rois.get(camera)
+        if roi is None:
+            return self.detector.detect(image)
+        crop, geometry = roi.crop(image)
+        return roi.to_frame(self.detector.detect(crop, geometry.cell_masks), geometry)
+
+
+def load_rois(path, spec):
+    """
+    roi config json: {"camera": {"polygon": [[x, y], ...], "margin": 16, "drop_outside": true}, ...}
+    :return: dict camera -> RegionOfInterest
+    """
+    with open(path) as f:
+        config = json.load(f)
+    return {camera: RegionOfInterest(item['polygon'], spec, item.get('margin', 0), item.get('drop_outside', True))
+            for camera, item in config.items()}
+
+
+def main():
+    from .backends.onnx_backend import OnnxBackend
+
+    parser = argparse.ArgumentParser(description='detection inside the roi polygon of a camera')
+    parser.add_argument('--model', type=str, required=True, help='onnx model')
+    parser.add_argument('--image', type=str, required=True)
+    parser.add_argument('--roi', type=str, required=True, help='roi config json, see load_rois')
+    parser.add_argument('--camera', type=str, required=True)
+    parser.add_argument('--output', type=str, default='result_roi.jpg')
+    args = parser.parse_args()
+
+    detector = Detector(OnnxBackend(args.model))
+    rois = load_rois(args.roi, detector.spec)
+    image = cv2.cvtColor(cv2.imread(args.image), cv2.COLOR_BGR2RGB)
+    predbox = RoiDetector(detector, rois).detect(image, args.camera)
+
+    geometry = rois[args.camera].geometry(*image.shape[:2])
+    cells = sum(int(m.sum()) for m in geometry.cell_masks)
+    total = sum(int(m.size) for m in geometry.cell_masks)
+    print('crop %s, decoding %d of %d cells, %d detections' % (geometry.rect, cells, total, len(predbox)))
+
+    draw_detections(image, predbox, detector.spec.classes)
+    cv2.polylines(image, [np.round(rois[args.camera].polygon).astype(np.int32)], True, (255, 0, 0), 2)
+    cv2.imwrite(args.output, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+    print('write:%s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,339 @@
+import argparse
+import io
+import json
+import os
+import queue
+import socketserver
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+from . import metrics
+from .pipeline import Detector
+
+# 请求结束标记
+_END = object()
+# 请求 body 的上限，足够放下一张 4K 的 npy 数组
+MAX_BODY_SIZE = 64 << 20
+
+
+class Overloaded(Exception):
+    pass
+
+
+class Stopped(Overloaded):
+    # batcher 已停止，服务端同样返回 503
+    pass
+
+
+class MicroBatcher(object):
+    """
+    collects images submitted from many threads into one detect_batch() call, a batch is run as soon as it has
+    max_batch_size images or the first image in it has waited max_wait_ms
+    :param detector: Detector, only used from the batching thread
+    :param max_batch_size: images per backend run
+    :param max_wait_ms: how long the first image of a batch waits for more, 0 runs whatever is already queued
+    :param queue_size: pending images, submit() raises Overloaded when full
+    after stop() submit() raises Stopped, images still queued get Stopped set on their futures
+    """
+
+    def __init__(self, detector, max_batch_size=8, max_wait_ms=5.0, queue_size=64):
+        self.detector = detector
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = queue.Queue(queue_size)
+        self.batches = 0
+        self.images = 0
+        self._thread = None
+        self._stopped = threading.Event()
+        # submit 与 stop 互斥，停止后不会再有图片进入队列
+        self._lock = threading.Lock()
+
+    def submit(self, image):
+        """
+        :param image: RGB HWC uint8 image
+        :return: Future of (Detections, batch size, queue seconds, batch seconds)
+        """
+        future = Future()
+        with self._lock:
+            if self._stopped.is_set():
+                raise Stopped('batcher is stopped')
+            try:
+                self.queue.put_nowait((image, future, time.perf_counter()))
+            except queue.Full:
+                raise Overloaded('%d images pending' % self.queue.qsize())
+        return future
+
+    def _collect(self):
+        item = self.queue.get()
+        if item is _END:
+            return None
+        batch = [item]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _END:
+                break
+            batch.append(item)
+        return batch
+
+    def _reject(self, batch):
+        for _, future, _ in batch:
+            future.set_exception(Stopped('batcher is stopped'))
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            batch = self._collect()
+            if batch is None:
+                break
+            if self._stopped.is_set():
+                self._reject(batch)
+                break
+            start = time.perf_counter()
+            try:
+                results = self.detector.detect_batch([image for image, _, _ in batch])
+            except BaseException as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            seconds = time.perf_counter() - start
+            self.batches += 1
+            self.images += len(batch)
+            for (_, future, submitted), predbox in zip(batch, results):
+                future.set_result((predbox, len(batch), start - submitted, seconds))
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, name='micro-batcher', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        the batch already running finishes, images still queued are rejected with Stopped
+        """
+        with self._lock:
+            self._stopped.set()
+        # 队列满时批处理线程不会阻塞在 get 上，下一轮就会看到停止标记
+        try:
+            self.queue.put_nowait(_END)
+        except queue.Full:
+            pass
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _END:
+                self._reject([item])
+
+
+def decode_image(body, content_type):
+    """
+    request body -> RGB HWC uint8 image
+    :param content_type: application/x-npy for an HWC uint8 BGR array saved with np.save, anything else is
+        decoded with cv2.imdecode (jpeg, png, ...)
+    """
+    if content_type == 'application/x-npy':
+        image = np.load(io.BytesIO(body), allow_pickle=False)
+        if image.dtype != np.uint8 or image.ndim != 3 or image.shape[2] != 3:
+            raise ValueError('expected an (h, w, 3) uint8 array, got %s %s' % (image.dtype, image.shape))
+    else:
+        image = cv2.imdecode(np.frombuffer(body, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if image is None:
+            raise ValueError('can not decode the image')
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+
+class DetectHandler(BaseHTTPRequestHandler):
+    """
+    POST /detect  image bytes -> {"detections": [...], ...}
+    GET  /health  batching statistics
+    GET  /metrics Prometheus text of the stage timings and counters
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def address_string(self):
+        # unix socket 没有客户端地址
+        return self.client_address[0] if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def _reply(self, code, body, content_type='application/json', close=False):
+        """
+        :param close: close the connection after the reply, for requests whose body was not read
+        """
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        if close:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body_length(self):
+        """
+        :return: validated Content-Length, None after replying with an error
+        """
+        value = self.headers.get('Content-Length')
+        if value is None:
+            # 不支持 chunked，没有长度时无法知道 body 在哪里结束
+            self._reply(411, {'error': 'Content-Length required'}, close=True)
+            return None
+        try:
+            length = int(value)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self._reply(400, {'error': 'invalid Content-Length %r' % value}, close=True)
+            return None
+        if length > self.server.max_body_size:
+            self._reply(413, {'error': 'body of %d bytes is larger than %d' % (length, self.server.max_body_size)},
+                        close=True)
+            return None
+        return length
+
+    def do_GET(self):
+        if self.path == '/health':
+            batcher = self.server.batcher
+            self._reply(200, {'status': 'ok', 'batches': batcher.batches, 'images': batcher.images,
+                              'pending': batcher.queue.qsize()})
+        elif self.path == '/metrics' and self.server.collector is not None:
+            self._reply(200, self.server.collector.prometheus().encode(), 'text/plain; version=0.0.4')
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = self._body_length()
+        if length is None:
+            return
+        body = self.rfile.read(length)
+        if self.path != '/detect':
+            self._reply(404, {'error': 'not found'})
+            return
+        try:
+            image = decode_image(body, self.headers.get('Content-Type', ''))
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+            return
+
+        try:
+            predbox, batch_size, queued, seconds = self.server.batcher.submit(image).result()
+        except Overloaded as e:
+            self._reply(503, {'error': str(e)})
+            return
+        except Exception as e:
+            self._reply(500, {'error': repr(e)})
+            return
+        self._reply(200, {
+            'detections': predbox.to_list(self.server.classes),
+            'image_size': [image.shape[1], image.shape[0]],
+            'batch_size': batch_size,
+            'queue_ms': queued * 1000,
+            'batch_ms': seconds * 1000,
+        })
+
+
+class DetectServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, batcher, classes, collector=None, quiet=True, max_body_size=MAX_BODY_SIZE):
+        self.batcher = batcher
+        self.max_body_size = max_body_size
+        self.classes = classes
+        self.collector = collector
+        self.quiet = quiet
+        ThreadingHTTPServer.__init__(self, address, DetectHandler)
+
+
+class UnixDetectServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, batcher, classes, collector=None, quiet=True, max_body_size=MAX_BODY_SIZE):
+        self.batcher = batcher
+        self.max_body_size = max_body_size
+        self.classes = classes
+        self.collector = collector
+        self.quiet = quiet
+        if os.path.exists(path):
+            os.remove(path)
+        socketserver.UnixStreamServer.__init__(self, path, DetectHandler)
+
+
+def create_server(backend, host='127.0.0.1', port=8080, unix_socket=None, max_batch_size=8, max_wait_ms=5.0,
+                  queue_size=64, collector=None, quiet=True, max_body_size=MAX_BODY_SIZE):
+    """
+    :param backend: Backend adapter, the model is loaded once and shared by all requests
+    :param unix_socket: listen on this unix socket path instead of host:port
+    :param collector: metrics.MetricsCollector served on /metrics, registered as a hook
+    :param max_body_size: larger request bodies are answered with 413 without being read
+    :return: server, already batching, call serve_forever() and on exit shutdown() / server_close() / batcher.stop()
+    """
+    batcher = MicroBatcher(Detector(backend), max_batch_size, max_wait_ms, queue_size).start()
+    if collector is not None:
+        metrics.add_hook(collector)
+    if unix_socket is not None:
+        return UnixDetectServer(unix_socket, batcher, backend.spec.classes, collector, quiet, max_body_size)
+    return DetectServer((host, port), batcher, backend.spec.classes, collector, quiet, max_body_size)
+
+
+def main():
+    from .backends.onnx_backend import OnnxBackend
+
+    parser = argparse.ArgumentParser(description='long running onnxruntime detection service with micro-batching')
+    parser.add_argument('--model', type=str, default=None, help='onnx model, a synthetic six-head model if not given')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix_socket', type=str, default=None, help='listen on a unix socket instead of a port')
+    parser.add_argument('--max_batch_size', type=int, default=8)
+    parser.add_argument('--max_wait_ms', type=float, default=5.0, help='batching window of the first request')
+    parser.add_argument('--queue_size', type=int, default=64, help='pending images before answering 503')
+    parser.add_argument('--threads', type=int, default=0, help='onnxruntime intra op threads')
+    parser.add_argument('--cpu', action='store_true', help='onnxruntime CPUExecutionProvider only')
+    parser.add_argument('--max_body_mb', type=float, default=MAX_BODY_SIZE / (1 << 20),
+                        help='largest accepted request body, 413 above it')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = args.model
+        providers = ['CPUExecutionProvider'] if args.cpu else None
+        if model is None:
+            from .benchmarks.synthetic_model import make_synthetic_model
+            model = make_synthetic_model(os.path.join(tmp, 'yolov5p6_synthetic.onnx'))
+            providers = ['CPUExecutionProvider']
+            print('no --model, serving a synthetic model')
+
+        backend = OnnxBackend(model, providers=providers, intra_op_num_threads=args.threads,
+                              max_batch_size=args.max_batch_size)
+        server = create_server(backend, args.host, args.port, args.unix_socket, args.max_batch_size,
+                               args.max_wait_ms, args.queue_size, metrics.MetricsCollector(backend.spec.classes),
+                               quiet=not args.verbose, max_body_size=int(args.max_body_mb * (1 << 20)))
+        print('serving on %s' % (args.unix_socket or 'http://%s:%d' % (args.host, args.port)))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            server.batcher.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+import math
+
+CLASSES = ['car', 'ped']
+
+
+class ModelSpec(object):
+    """
+    head layout of an exported yolov5 model
+    :param input_w: network input width
+    :param input_h: network input height
+    :param strides: stride of every output head
+    :param anchors: anchor (w, h) list of every output head
+    :param classes: class names
+    :param obj_thre: per class score threshold
+    :param nms_thre: NMS iou threshold
+    :param nms_pre_topk: max candidates fed into NMS, None for no limit
+    :param max_det: max detections kept by NMS, None for no limit
+    :param presigmoid: sigmoid is already part of the graph (the caffe export)
+    :param layout: memory layout of one head output, NCHW is (anchor * (5 + class), h, w), NHWC is (h, w, anchor * (5 + class))
+    :param output_names: head output names in stride order, for runtimes returning a dict
+    :param letterbox: keep the aspect ratio when resizing and pad the rest, instead of stretching
+    :param pad_value: pixel value of the letterbox padding
+    :param pad_position: center puts the resized image in the middle (yolov5), boundary at the top left with the
+        padding on the right / bottom (horizon PadResizeTransformer)
+    :param skip_padding: in letterbox mode, do not decode grid cells that can only predict centers in the padding
+    :param early_reject: threshold the raw objectness before any sigmoid and decode only the surviving cells
+    """
+
+    def __init__(self, input_w, input_h, strides, anchors, classes=CLASSES, obj_thre=None, nms_thre=0.45,
+                 nms_pre_topk=3000, max_det=300, presigmoid=False, layout='NCHW', output_names=None,
+                 letterbox=False, pad_value=114, pad_position='center', skip_padding=True, early_reject=True):
+        if len(strides) != len(anchors):
+            raise ValueError('got %d strides but %d anchor groups' % (len(strides), len(anchors)))
+        if layout not in ('NCHW', 'NHWC'):
+            raise ValueError(f'invalid layout {layout}')
+        if pad_position not in ('center', 'boundary'):
+            raise ValueError(f'invalid pad_position {pad_position}')
+
+        self.input_w = input_w
+        self.input_h = input_h
+        self.strides = list(strides)
+        self.anchors = [[list(a) for a in head] for head in anchors]
+        self.classes = list(classes)
+        self.obj_thre = list(obj_thre) if obj_thre is not None else [0.4] * len(self.classes)
+        self.nms_thre = nms_thre
+        self.nms_pre_topk = nms_pre_topk
+        self.max_det = max_det
+        self.presigmoid = presigmoid
+        self.layout = layout
+        self.output_names = output_names
+        self.letterbox = letterbox
+        self.pad_value = pad_value
+        self.pad_position = pad_position
+        self.skip_padding = skip_padding
+        self.early_reject = early_reject
+
+    @property
+    def class_num(self):
+        return len(self.classes)
+
+    @property
+    def anchor_num(self):
+        return len(self.anchors[0])
+
+    @property
+    def output_head(self):
+        return len(self.strides)
+
+    @property
+    def cell_size(self):
+        return [[self.input_h // s, self.input_w // s] for s in self.strides]
+
+    def replace(self, **kwargs):
+        """
+        copy of this spec with some fields overridden
+        """
+        fields = dict(self.__dict__)
+        fields.update(kwargs)
+        return ModelSpec(**fields)
+
+
+def rect_spec(spec, img_w, img_h, long_side=None):
+    """
+    spec for rectangular inference on a dynamic shape backend: the long side is long_side (default the current
+    input size), the short side keeps the aspect ratio rounded up to a multiple of the largest stride
+    """
+    long_side = long_side or max(spec.input_w, spec.input_h)
+    step = max(spec.strides)
+    ratio = long_side / max(img_w, img_h)
+    input_w = int(math.ceil(img_w * ratio / step) * step)
+    input_h = int(math.ceil(img_h * ratio / step) * step)
+    return spec.replace(input_w=input_w, input_h=input_h, letterbox=True)
+
+
+# onnx / tensorRT / rknn / horizon 导出的 6 输出头模型
+YOLOV5P6_512X512 = ModelSpec(
+    input_w=512,
+    input_h=512,
+    strides=[8, 16, 32, 64, 128, 256],
+    anchors=[
+        [[16, 14], [9, 30], [25, 22]],
+        [[18, 52], [40, 32], [27, 83]],
+        [[55, 46], [82, 60], [41, 122]],
+        [[100, 84], [75, 162], [138, 110]],
+        [[190, 158], [121, 251], [259, 246]],
+        [[191, 378], [451, 269], [683, 393]]
+    ],
+    obj_thre=[0.4, 0.4],
+)
+
+# caffe 导出的 3 输出头模型，图中已经做了 sigmoid
+YOLOV5N_640X384 = ModelSpec(
+    input_w=640,
+    input_h=384,
+    strides=[8, 16, 32],
+    anchors=[
+        [[10, 13], [16, 30], [33, 23]],
+        [[30, 61], [62, 45], [59, 119]],
+        [[116, 90], [156, 198], [373, 326]]
+    ],
+    obj_thre=[0.4, 0.2],
+    presigmoid=True,
+    output_names=['sigmoid1', 'sigmoid2', 'sigmoid3'],
+)
@@ -0,0 +1,359 @@
+import argparse
+import heapq
+import os
+import queue
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from . import metrics
+from .pipeline import postprocess, draw_detections
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# 流水线结束标记
+_END = object()
+
+
+def iter_images(src_dir):
+    """
+    (name, BGR image) of every image in a directory, sorted by name
+    """
+    for name in sorted(os.listdir(src_dir)):
+        if os.path.splitext(name)[1].lower() not in IMAGE_EXTS:
+            continue
+        image = cv2.imread(os.path.join(src_dir, name))
+        if image is not None:
+            yield name, image
+
+
+def iter_video(video_path):
+    """
+    (name, BGR frame) of every frame of a video file or stream url
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError('can not open %s' % video_path)
+    index = 0
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield '%08d.jpg' % index, frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def open_source(source):
+    return iter_images(source) if os.path.isdir(source) else iter_video(source)
+
+
+class ImageDirSink(object):
+    def __init__(self, dst_dir):
+        os.makedirs(dst_dir, exist_ok=True)
+        self.dst_dir = dst_dir
+
+    def __call__(self, frame_id, name, image, predbox):
+        cv2.imwrite(os.path.join(self.dst_dir, name), image)
+
+    def close(self):
+        pass
+
+
+class VideoSink(object):
+    def __init__(self, video_path, fps=25.0, fourcc='mp4v'):
+        self.video_path = video_path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.writer = None
+
+    def __call__(self, frame_id, name, image, predbox):
+        if self.writer is None:
+            img_h, img_w = image.shape[:2]
+            self.writer = cv2.VideoWriter(self.video_path, cv2.VideoWriter_fourcc(*self.fourcc), self.fps,
+                                          (img_w, img_h))
+        self.writer.write(image)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+
+
+class StageStats(object):
+    """
+    busy time and item count of one pipeline stage, summed over its threads
+    """
+
+    def __init__(self, name, threads=1):
+        self.name = name
+        self.threads = threads
+        self.count = 0
+        self.busy = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds, count=1):
+        with self.lock:
+            self.count += count
+            self.busy += seconds
+
+    @property
+    def capacity(self):
+        """
+        items/sec this stage could sustain with all of its threads busy
+        """
+        return self.count * self.threads / self.busy if self.busy > 0 else float('inf')
+
+    def report(self, elapsed):
+        utilization = self.busy / (elapsed * self.threads) if elapsed > 0 else 0.0
+        return '%-12s threads %2d  items %7d  busy %8.2fs  capacity %8.1f/s  utilization %5.1f%%' % (
+            self.name, self.threads, self.count, self.busy, self.capacity, utilization * 100)
+
+
+class StreamRunner(object):
+    """
+    read -> preprocess -> inference -> postprocess, each stage in its own thread(s) connected by bounded queues,
+    a full queue blocks the stage feeding it so memory stays bounded when a later stage is slow
+    :param backend: Backend adapter, shared by the preprocess workers and the inference thread
+    :param sink: called as sink(frame_id, name, image, predbox) in frame order, None to only count results
+    :param preprocess_workers: number of preprocess threads
+    :param queue_size: capacity of every queue between stages
+    :param batch_size: max frames per backend.run(), frames already waiting are grouped up to this size
+    :param draw: draw the detections on the image before handing it to the sink
+    """
+
+    def __init__(self, backend, sink=None, preprocess_workers=2, queue_size=8, batch_size=1, draw=True):
+        self.backend = backend
+        self.spec = backend.spec
+        self.sink = sink
+        self.preprocess_workers = preprocess_workers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.draw = draw
+
+        self.stats = None
+        self.elapsed = 0.0
+        self._stop = threading.Event()
+        self._errors = []
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, q):
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        return _END
+
+    def _guard(self, func, *args):
+        try:
+            func(*args)
+        except BaseException as e:
+            self._errors.append(e)
+            self._stop.set()
+
+    def _read(self, frames, q_out):
+        frame_id = 0
+        it = iter(frames)
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            item = next(it, _END)
+            if item is _END:
+                break
+            name, image = item
+            self.stats['read'].add(time.perf_counter() - start)
+            if not self._put(q_out, (frame_id, name, image)):
+                return
+            frame_id += 1
+        for _ in range(self.preprocess_workers):
+            self._put(q_out, _END)
+
+    def _preprocess(self, q_in, q_out):
+        while True:
+            item = self._get(q_in)
+            if item is _END:
+                break
+            frame_id, name, image = item
+            start = time.perf_counter()
+            data = self.backend.preprocess(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            seconds = time.perf_counter() - start
+            self.stats['preprocess'].add(seconds)
+            if metrics.hooks:
+                metrics.record('preprocess', seconds)
+            if not self._put(q_out, (frame_id, name, image, data)):
+                return
+        self._put(q_out, _END)
+
+    def _inference(self, q_in, q_out):
+        finished = 0
+        while finished < self.preprocess_workers:
+            item = self._get(q_in)
+            if item is _END:
+                finished += 1
+                if self._stop.is_set():
+                    return
+                continue
+
+            # 把已经在排队的帧凑成一个 batch
+            batch = [item]
+            while len(batch) < self.batch_size:
+                try:
+                    item = q_in.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _END:
+                    finished += 1
+                    continue
+                batch.append(item)
+
+            start = time.perf_counter()
+            if len(batch) == 1:
+                out = self.backend.run(batch[0][3])
+                outs = [out]
+            else:
+                out = self.backend.run(np.concatenate([b[3] for b in batch]))
+                outs = [[res[i:i + 1] for res in out] for i in range(len(batch))]
+            seconds = time.perf_counter() - start
+            self.stats['inference'].add(seconds, len(batch))
+            if metrics.hooks:
+                metrics.record('inference', seconds)
+
+            for (frame_id, name, image, _), out in zip(batch, outs):
+                if not self._put(q_out, (frame_id, name, image, out)):
+                    return
+        self._put(q_out, _END)
+
+    def _postprocess(self, q_in):
+        # 预处理是多线程的，按 frame_id 重新排序后再交给 sink
+        pending = []
+        next_id = 0
+        while True:
+            item = self._get(q_in)
+            if item is _END:
+                break
+            frame_id, name, image, out = item
+
+            start = time.perf_counter()
+            img_h, img_w = image.shape[:2]
+            predbox = postprocess(out, img_h, img_w, self.spec)
+            if self.draw:
+                draw_detections(image, predbox, self.spec.classes)
+            self.stats['postprocess'].add(time.perf_counter() - start)
+
+            heapq.heappush(pending, (frame_id, name, image, predbox))
+            while pending and pending[0][0] == next_id:
+                frame_id, name, image, predbox = heapq.heappop(pending)
+                start = time.perf_counter()
+                if self.sink is not None:
+                    self.sink(frame_id, name, image, predbox)
+                self.stats['sink'].add(time.perf_counter() - start)
+                next_id += 1
+
+    def run(self, frames):
+        """
+        :param frames: iterable of (name, BGR image)
+        :return: dict of StageStats keyed by stage name
+        """
+        self._stop.clear()
+        self._errors = []
+        self.stats = {
+            'read': StageStats('read'),
+            'preprocess': StageStats('preprocess', self.preprocess_workers),
+            'inference': StageStats('inference'),
+            'postprocess': StageStats('postprocess'),
+            'sink': StageStats('sink'),
+        }
+
+        q_read = queue.Queue(self.queue_size)
+        q_pre = queue.Queue(self.queue_size)
+        q_out = queue.Queue(self.queue_size)
+        threads = [threading.Thread(target=self._guard, args=(self._read, frames, q_read), name='read')]
+        for i in range(self.preprocess_workers):
+            threads.append(threading.Thread(target=self._guard, args=(self._preprocess, q_read, q_pre),
+                                            name='preprocess-%d' % i))
+        threads.append(threading.Thread(target=self._guard, args=(self._inference, q_pre, q_out), name='inference'))
+
+        start = time.perf_counter()
+        for t in threads:
+            t.daemon = True
+            t.start()
+        # postprocess 在调用线程中执行
+        self._guard(self._postprocess, q_out)
+        self._stop.set()
+        for t in threads:
+            t.join()
+        self.elapsed = time.perf_counter() - start
+
+        if self._errors:
+            raise self._errors[0]
+        return self.stats
+
+    def report(self):
+        lines = ['%d frames in %.2fs, %.1f fps' % (self.stats['sink'].count, self.elapsed,
+                                                   self.stats['sink'].count / self.elapsed if self.elapsed else 0)]
+        for stage in self.stats.values():
+            lines.append(stage.report(self.elapsed))
+        slowest = min(self.stats.values(), key=lambda s: s.capacity)
+        lines.append('slowest stage: %s' % slowest.name)
+        return '\n'.join(lines)
+
+
+def main():
+    from .backends.onnx_backend import OnnxBackend
+
+    parser = argparse.ArgumentParser(description='run the onnx detector over a directory of images or a video')
+    parser.add_argument('--model', type=str, required=True, help='onnx model')
+    parser.add_argument('--source', type=str, required=True, help='image directory, video file or stream url')
+    parser.add_argument('--output', type=str, default=None,
+                        help='result directory for images, result video for a video source, nothing written if not given')
+    parser.add_argument('--workers', type=int, default=2, help='preprocess threads')
+    parser.add_argument('--queue_size', type=int, default=8)
+    parser.add_argument('--batch_size', type=int, default=1)
+    parser.add_argument('--threads', type=int, default=0, help='onnxruntime intra op threads')
+    parser.add_argument('--no_draw', action='store_true', help='do not draw detections')
+    parser.add_argument('--metrics_prom', type=str, default=None,
+                        help='Prometheus text file with stage timings and per class counts, rewritten periodically')
+    parser.add_argument('--metrics_jsonl', type=str, default=None, help='json lines file, one snapshot per interval')
+    parser.add_argument('--metrics_interval', type=float, default=10.0, help='seconds between metric exports')
+    args = parser.parse_args()
+
+    sink = None
+    if args.output is not None:
+        if os.path.isdir(args.source):
+            sink = ImageDirSink(args.output)
+        else:
+            cap = cv2.VideoCapture(args.source)
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+            cap.release()
+            sink = VideoSink(args.output, fps)
+
+    backend = OnnxBackend(args.model, intra_op_num_threads=args.threads, max_batch_size=args.batch_size)
+    runner = StreamRunner(backend, sink, preprocess_workers=args.workers, queue_size=args.queue_size,
+                          batch_size=args.batch_size, draw=not args.no_draw)
+    exporter = None
+    if args.metrics_prom is not None or args.metrics_jsonl is not None:
+        exporter = metrics.MetricsExporter(metrics.MetricsCollector(backend.spec.classes), args.metrics_interval,
+                                           args.metrics_prom, args.metrics_jsonl).start()
+    try:
+        runner.run(open_source(args.source))
+    finally:
+        if sink is not None:
+            sink.close()
+        if exporter is not None:
+            exporter.stop()
+    print(runner.report())
+
+
+if __name__ == '__main__':
+    main()
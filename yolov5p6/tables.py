@@ -0,0 +1,83 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+_cache = {}
+_lock = threading.Lock()
+
+
+class HeadTable(object):
+    """
+    decode constants of one head, shaped to broadcast against a (batch, anchor, 5 + class, h, w) head view
+    :param stride: stride of the head
+    :param grid_xy: (1, 2, h, w) float32, cell column * stride and cell row * stride
+    :param anchor_wh: (anchor, 2, 1, 1) float32, anchor width and height
+    """
+
+    def __init__(self, stride, grid_xy, anchor_wh):
+        self.stride = stride
+        self.grid_xy = grid_xy
+        self.anchor_wh = anchor_wh
+
+
+def table_key(spec):
+    return (spec.input_w, spec.input_h, tuple(spec.strides),
+            tuple(tuple(tuple(a) for a in head) for head in spec.anchors))
+
+
+def build_decode_tables(spec):
+    tables = []
+    for stride, (grid_h, grid_w), anchors in zip(spec.strides, spec.cell_size, spec.anchors):
+        gx, gy = np.meshgrid(np.arange(grid_w), np.arange(grid_h))
+        grid_xy = (np.stack((gx, gy))[np.newaxis] * stride).astype(np.float32)
+        anchor_wh = np.array(anchors, dtype=np.float32).reshape((-1, 2, 1, 1))
+        tables.append(HeadTable(stride, grid_xy, anchor_wh))
+    return tables
+
+
+def save_decode_tables(path, spec, tables):
+    arrays = {'key': np.array(json.dumps(table_key(spec)))}
+    for head, table in enumerate(tables):
+        arrays['stride%d' % head] = np.array(table.stride)
+        arrays['grid_xy%d' % head] = table.grid_xy
+        arrays['anchor_wh%d' % head] = table.anchor_wh
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_decode_tables(path, spec):
+    """
+    :return: tables stored in path, None if the file was written for a different spec
+    """
+    with np.load(path) as data:
+        if json.loads(str(data['key'])) != json.loads(json.dumps(table_key(spec))):
+            return None
+        return [HeadTable(int(data['stride%d' % head]), data['grid_xy%d' % head], data['anchor_wh%d' % head])
+                for head in range(spec.output_head)]
+
+
+def decode_tables(spec, cache_path=None):
+    """
+    per head decode tables of a spec, built once per (input size, strides, anchors) and shared by every
+    detector in the process
+    :param cache_path: optional .npz file, loaded if it matches the spec, otherwise written after building
+    """
+    key = table_key(spec)
+    tables = _cache.get(key)
+    if tables is not None:
+        return tables
+
+    with _lock:
+        tables = _cache.get(key)
+        if tables is None:
+            if cache_path is not None and os.path.exists(cache_path):
+                tables = load_decode_tables(cache_path, spec)
+            if tables is None:
+                tables = build_decode_tables(spec)
+                if cache_path is not None:
+                    save_decode_tables(cache_path, spec, tables)
+            _cache[key] = tables
+    return tables
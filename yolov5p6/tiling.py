@@ -0,0 +1,118 @@
+import argparse
+
+import cv2
+import numpy as np
+
+from .detections import Detections
+from .nms import NMS
+from .pipeline import Detector, draw_detections
+
+
+def tile_starts(size, tile, overlap):
+    """
+    start offsets along one axis, the fewest tiles that share at least overlap * tile pixels with their
+    neighbours, spread evenly from the first to the last pixel
+    """
+    if size <= tile:
+        return [0]
+    step = max(int(tile * (1 - overlap)), 1)
+    num = int(np.ceil((size - tile) / step)) + 1
+    return np.linspace(0, size - tile, num).round().astype(int).tolist()
+
+
+def tile_grid(img_h, img_w, tile_h, tile_w, overlap=0.2):
+    """
+    :param overlap: fraction of a tile shared with its neighbour, should cover the size of the objects cut at seams
+    :return: (n, 4) int array of xmin, ymin, xmax, ymax, tiles smaller than the image are clipped to it
+    """
+    if not 0 <= overlap < 1:
+        raise ValueError('overlap must be in [0, 1), got %s' % overlap)
+    tiles = [(x, y, min(x + tile_w, img_w), min(y + tile_h, img_h))
+             for y in tile_starts(img_h, tile_h, overlap) for x in tile_starts(img_w, tile_w, overlap)]
+    return np.array(tiles, dtype=np.int64).reshape((-1, 4))
+
+
+class TiledDetector(object):
+    """
+    slices a large frame into overlapping tiles of the network input size so small objects are seen at full
+    resolution. all tiles (and the optional downscaled full frame) go through the backend as one batch, the boxes
+    are moved back to frame coordinates and duplicates at the seams are merged by one class-aware NMS
+    :param detector: Detector, or a Backend which is wrapped into one
+    :param overlap: see tile_grid
+    :param full_frame: also run the whole frame resized to the input size, for objects larger than a tile
+    :param merge_thre: overlap above which the lower scored box is merged, spec.nms_thre if None
+    :param metric: iou or ios, see NMS
+    """
+
+    def __init__(self, detector, overlap=0.2, full_frame=True, merge_thre=None, metric='iou'):
+        self.detector = detector if isinstance(detector, Detector) else Detector(detector)
+        self.spec = self.detector.spec
+        self.overlap = overlap
+        self.full_frame = full_frame
+        self.merge_thre = self.spec.nms_thre if merge_thre is None else merge_thre
+        self.metric = metric
+
+    def tiles(self, img_h, img_w):
+        return tile_grid(img_h, img_w, self.spec.input_h, self.spec.input_w, self.overlap)
+
+    def merge(self, tiles, results):
+        """
+        :param tiles: (n, 4) tile rectangles in frame coordinates
+        :param results: Detections of every tile in tile coordinates, followed by the full frame ones if any
+        :return: Detections in frame coordinates
+        """
+        offsets = np.concatenate((tiles[:, :2], tiles[:, :2]), axis=1).astype(np.float32)
+        counts = [len(d) for d in results]
+        merged = Detections.concat(results)
+        # 整图结果的偏移为 0
+        offsets = np.concatenate((offsets, np.zeros((len(results) - len(tiles), 4), dtype=np.float32)))
+        merged.boxes += np.repeat(offsets, counts, axis=0)
+        keep = NMS(merged.boxes, merged.scores, merged.class_ids, self.merge_thre, None, self.spec.max_det,
+                   self.metric)
+        return merged[keep]
+
+    def detect(self, image):
+        """
+        :param image: RGB HWC uint8 image
+        :return: Detections in image coordinates, highest score first
+        """
+        img_h, img_w = image.shape[:2]
+        tiles = self.tiles(img_h, img_w)
+        crops = [image[y0:y1, x0:x1] for x0, y0, x1, y1 in tiles]
+        if self.full_frame:
+            crops.append(image)
+        return self.merge(tiles, self.detector.detect_batch(crops))
+
+
+def main():
+    from .backends.onnx_backend import OnnxBackend
+    from .spec import CLASSES
+
+    parser = argparse.ArgumentParser(description='tiled detection on a high resolution image')
+    parser.add_argument('--model', type=str, required=True, help='onnx model')
+    parser.add_argument('--image', type=str, required=True)
+    parser.add_argument('--output', type=str, default='result_tiled.jpg')
+    parser.add_argument('--overlap', type=float, default=0.2)
+    parser.add_argument('--no_full_frame', action='store_true', help='only the tiles, no downscaled full frame')
+    parser.add_argument('--metric', type=str, choices=['iou', 'ios'], default='iou')
+    parser.add_argument('--merge_thre', type=float, default=None)
+    args = parser.parse_args()
+
+    detector = Detector(OnnxBackend(args.model))
+    tiled = TiledDetector(detector, args.overlap, not args.no_full_frame, args.merge_thre, args.metric)
+    image = cv2.cvtColor(cv2.imread(args.image), cv2.COLOR_BGR2RGB)
+
+    plain = detector.detect(image)
+    predbox = tiled.detect(image)
+    print('%d tiles, %d detections (%d without tiling)' % (len(tiled.tiles(*image.shape[:2])), len(predbox),
+                                                           len(plain)))
+    for class_id, name in enumerate(CLASSES):
+        print('%-6s %5d %5d' % (name, len(predbox.by_class(class_id)), len(plain.by_class(class_id))))
+
+    draw_detections(image, predbox, CLASSES)
+    cv2.imwrite(args.output, cv2.cvtColor(image, cv2.COLOR_RGB2BGR))
+    print('write:%s' % args.output)
+
+
+if __name__ == '__main__':
+    main()
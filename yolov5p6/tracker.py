@@ -0,0 +1,351 @@
+import numpy as np
+
+from .detections import Detections
+from .nms import box_iou
+from .pipeline import Detector
+
+try:
+    from scipy.optimize import linear_sum_assignment
+except ImportError:
+    linear_sum_assignment = None
+
+TRACKED = 0
+LOST = 1
+
+
+def hungarian(cost):
+    """
+    minimum cost assignment of a dense (n, m) matrix, used when scipy is not installed. one augmenting path per
+    row, every step of the path search is vectorized over the columns
+    :return: row indices, column indices, min(n, m) pairs
+    """
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    # p[j]: 1-based row assigned to column j, column 0 is the virtual start of the path
+    p = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used
+            free[0] = False
+            reduced = cost[i0 - 1] - u[i0] - v[1:]
+            better = free[1:] & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            j1 = int(np.argmin(np.where(free, minv, np.inf)))
+            delta = minv[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    cols = np.nonzero(p[1:])[0]
+    rows = p[1:][cols] - 1
+    order = np.argsort(rows)
+    rows, cols = rows[order], cols[order]
+    return (cols, rows) if transposed else (rows, cols)
+
+
+def components(valid):
+    """
+    connected components of the bipartite graph of acceptable pairs, by propagating the smallest row index
+    along the edges until nothing changes
+    :return: component label of every row, of every column
+    """
+    n, m = valid.shape
+    big = np.iinfo(np.int64).max
+    row_label = np.arange(n)
+    while True:
+        col_label = np.where(valid, row_label[:, np.newaxis], big).min(axis=0)
+        new_label = np.minimum(row_label, np.where(valid, col_label[np.newaxis], big).min(axis=1))
+        if np.array_equal(new_label, row_label):
+            return row_label, col_label
+        row_label = new_label
+
+
+def linear_assignment(cost, max_cost):
+    """
+    minimum cost matching that only accepts pairs with cost <= max_cost. a row whose acceptable columns have
+    no other acceptable row takes the cheapest of them directly (and the same with rows and columns swapped),
+    the optimal assignment is only solved on what is left, separately for every cluster of boxes that overlap
+    each other
+    :return: (k, 2) matched (row, col), unmatched rows, unmatched cols
+    """
+    n, m = cost.shape
+    if n == 0 or m == 0:
+        # 没有轨迹或没有检测框时 argmin 等归约会报错
+        return np.empty((0, 2), dtype=np.int64), np.arange(n), np.arange(m)
+    valid = cost <= max_cost
+    row_degree = valid.sum(axis=1)
+    col_degree = valid.sum(axis=0)
+    masked = np.where(valid, cost, np.inf)
+    # 所有候选列都只有这一行可选，直接取代价最小的列；行列互换同理
+    row_star = (row_degree > 0) & ~(valid & (col_degree[np.newaxis] > 1)).any(axis=1)
+    col_star = (col_degree > 0) & ~(valid & (row_degree[:, np.newaxis] > 1)).any(axis=0)
+    covered_cols = valid[row_star].any(axis=0)
+    col_star &= ~covered_cols
+    covered_cols |= col_star
+    covered_rows = row_star | valid[:, col_star].any(axis=1)
+    star_rows = np.nonzero(row_star)[0]
+    star_cols = np.nonzero(col_star)[0]
+    matches = [np.stack((star_rows, masked[star_rows].argmin(axis=1)), axis=1),
+               np.stack((masked[:, star_cols].argmin(axis=0), star_cols), axis=1)]
+
+    rest_rows = np.nonzero((row_degree > 0) & ~covered_rows)[0]
+    rest_cols = np.nonzero((col_degree > 0) & ~covered_cols)[0]
+    if rest_rows.size and rest_cols.size:
+        row_label, col_label = components(valid[np.ix_(rest_rows, rest_cols)])
+        for label in np.unique(row_label):
+            group_rows = rest_rows[row_label == label]
+            group_cols = rest_cols[col_label == label]
+            sub = cost[np.ix_(group_rows, group_cols)]
+            # 不可接受的配对给一个足够大的代价，解出来后再去掉
+            sub = np.where(sub <= max_cost, sub, max_cost + 1e5)
+            if linear_sum_assignment is not None:
+                r, c = linear_sum_assignment(sub)
+            else:
+                r, c = hungarian(sub)
+            ok = sub[r, c] <= max_cost
+            matches.append(np.stack((group_rows[r[ok]], group_cols[c[ok]]), axis=1))
+
+    matches = np.concatenate(matches).astype(np.int64).reshape((-1, 2))
+    unmatched_rows = np.setdiff1d(np.arange(n), matches[:, 0])
+    unmatched_cols = np.setdiff1d(np.arange(m), matches[:, 1])
+    return matches, unmatched_rows, unmatched_cols
+
+
+def xyxy_to_cxcywh(boxes):
+    wh = boxes[:, 2:] - boxes[:, :2]
+    return np.concatenate((boxes[:, :2] + wh / 2, wh), axis=1)
+
+
+def cxcywh_to_xyxy(state):
+    wh = np.maximum(state[:, 2:4], 1.0)
+    return np.concatenate((state[:, :2] - wh / 2, state[:, :2] + wh / 2), axis=1)
+
+
+class KalmanBoxFilter(object):
+    """
+    constant velocity Kalman filter on (cx, cy, w, h, vx, vy, vw, vh), every method works on all tracks at once,
+    the noise scales with the box size as in ByteTrack
+    """
+
+    def __init__(self, std_position=1. / 20, std_velocity=1. / 160):
+        self.std_position = std_position
+        self.std_velocity = std_velocity
+        self.F = np.eye(8)
+        self.F[:4, 4:] = np.eye(4)
+
+    def _size(self, state):
+        wh = np.maximum(state[:, 2:4], 1.0)
+        return np.concatenate((wh, wh), axis=1)
+
+    def initiate(self, measurement):
+        """
+        :param measurement: (n, 4) cx, cy, w, h
+        :return: mean (n, 8), covariance (n, 8, 8)
+        """
+        mean = np.concatenate((measurement, np.zeros_like(measurement)), axis=1)
+        size = self._size(measurement)
+        std = np.concatenate((2 * self.std_position * size, 10 * self.std_velocity * size), axis=1)
+        covariance = np.zeros((len(measurement), 8, 8))
+        covariance[:, np.arange(8), np.arange(8)] = std ** 2
+        return mean, covariance
+
+    def predict(self, mean, covariance):
+        size = self._size(mean)
+        std = np.concatenate((self.std_position * size, self.std_velocity * size), axis=1)
+        mean = mean @ self.F.T
+        covariance = self.F @ covariance @ self.F.T
+        covariance[:, np.arange(8), np.arange(8)] += std ** 2
+        return mean, covariance
+
+    def update(self, mean, covariance, measurement):
+        """
+        :param measurement: (n, 4) cx, cy, w, h, one per track
+        """
+        std = self.std_position * self._size(mean)[:, :4]
+        projected = covariance[:, :4, :4].copy()
+        projected[:, np.arange(4), np.arange(4)] += std ** 2
+        # K = P H^T S^-1，H 取前 4 维
+        gain = np.linalg.solve(projected, covariance[:, :4, :]).transpose((0, 2, 1))
+        innovation = measurement - mean[:, :4]
+        mean = mean + np.einsum('nij,nj->ni', gain, innovation)
+        covariance = covariance - gain @ projected @ gain.transpose((0, 2, 1))
+        return mean, covariance
+
+
+class ByteTracker(object):
+    """
+    ByteTrack style multi-object tracker on the Detections of postprocess(). high score detections are matched
+    to all tracks first, low score ones then keep the remaining tracked objects alive through occlusion. all
+    association is one iou matrix (boxes of other classes never match) and one linear assignment per step
+    :param high_thre: detections above this start tracks and take part in the first association
+    :param low_thre: detections between low_thre and high_thre only extend existing tracks
+    :param match_iou: min iou of the first association, 0.5 for the low score one
+    :param max_lost: frames a track is kept without a match
+    :param min_hits: matches before a track is reported, tracks of the first frame are reported immediately
+    """
+
+    def __init__(self, high_thre=0.5, low_thre=0.1, match_iou=0.2, max_lost=30, min_hits=2, kalman=None):
+        self.high_thre = high_thre
+        self.low_thre = low_thre
+        self.match_iou = match_iou
+        self.low_match_iou = 0.5
+        self.max_lost = max_lost
+        self.min_hits = min_hits
+        self.kalman = kalman if kalman is not None else KalmanBoxFilter()
+        self.frame_id = 0
+        self.next_id = 1
+
+        self.mean = np.empty((0, 8))
+        self.covariance = np.empty((0, 8, 8))
+        self.ids = np.empty(0, dtype=np.int64)
+        self.class_ids = np.empty(0, dtype=np.uint8)
+        self.scores = np.empty(0, dtype=np.float32)
+        self.state = np.empty(0, dtype=np.int8)
+        self.hits = np.empty(0, dtype=np.int64)
+        self.lost_frames = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _keep(self, mask):
+        self.mean = self.mean[mask]
+        self.covariance = self.covariance[mask]
+        self.ids = self.ids[mask]
+        self.class_ids = self.class_ids[mask]
+        self.scores = self.scores[mask]
+        self.state = self.state[mask]
+        self.hits = self.hits[mask]
+        self.lost_frames = self.lost_frames[mask]
+
+    def _predict(self):
+        self.frame_id += 1
+        if len(self):
+            self.mean, self.covariance = self.kalman.predict(self.mean, self.covariance)
+        self.lost_frames += 1
+
+    def _associate(self, tracks, detections, min_iou):
+        """
+        :param tracks: track indices taking part
+        :return: matched (track index, detection index), unmatched tracks, unmatched detection positions
+        """
+        if len(tracks) == 0 or len(detections) == 0:
+            return np.empty((0, 2), dtype=np.int64), tracks, np.arange(len(detections))
+        # 与检测框一样用 float32，iou 矩阵的计算量减半以上
+        iou = box_iou(cxcywh_to_xyxy(self.mean[tracks, :4]).astype(np.float32), detections.boxes)
+        iou[self.class_ids[tracks][:, np.newaxis] != detections.class_ids[np.newaxis]] = 0
+        matches, unmatched_tracks, unmatched_dets = linear_assignment(1 - iou, 1 - min_iou)
+        matches[:, 0] = tracks[matches[:, 0]]
+        return matches, tracks[unmatched_tracks], unmatched_dets
+
+    def _apply(self, matches, detections):
+        if len(matches) == 0:
+            return
+        t, d = matches[:, 0], matches[:, 1]
+        self.mean[t], self.covariance[t] = self.kalman.update(self.mean[t], self.covariance[t],
+                                                              xyxy_to_cxcywh(detections.boxes[d]))
+        self.scores[t] = detections.scores[d]
+        self.state[t] = TRACKED
+        self.hits[t] += 1
+        self.lost_frames[t] = 0
+
+    def _output(self):
+        reported = (self.state == TRACKED) & (self.lost_frames == 0) & (self.hits >= self.min_hits)
+        return self._tracks(reported)
+
+    def _tracks(self, mask):
+        return Detections(cxcywh_to_xyxy(self.mean[mask, :4]), self.scores[mask], self.class_ids[mask]), \
+            self.ids[mask]
+
+    def update(self, predbox):
+        """
+        :param predbox: Detections of the current frame
+        :return: Detections of the confirmed tracks matched in this frame (Kalman filtered boxes), track ids
+        """
+        self._predict()
+        high = predbox[predbox.scores >= self.high_thre]
+        low = predbox[(predbox.scores >= self.low_thre) & (predbox.scores < self.high_thre)]
+
+        # 第一次关联：高分框对所有轨迹
+        matches, remain, unmatched_high = self._associate(np.arange(len(self)), high, self.match_iou)
+        self._apply(matches, high)
+        # 第二次关联：低分框只延续上一帧还在跟踪的轨迹
+        remain = remain[(self.state[remain] == TRACKED) & (self.hits[remain] >= self.min_hits)]
+        matches, _, _ = self._associate(remain, low, self.low_match_iou)
+        self._apply(matches, low)
+
+        unmatched = self.lost_frames > 0
+        # 未确认的新轨迹没有匹配上直接删除
+        self.state[unmatched] = LOST
+        self._keep(~(unmatched & (self.hits < self.min_hits)) & (self.lost_frames <= self.max_lost))
+
+        new = high[unmatched_high]
+        if len(new):
+            mean, covariance = self.kalman.initiate(xyxy_to_cxcywh(new.boxes.astype(np.float64)))
+            count = len(new)
+            self.mean = np.concatenate((self.mean, mean))
+            self.covariance = np.concatenate((self.covariance, covariance))
+            self.ids = np.concatenate((self.ids, np.arange(self.next_id, self.next_id + count)))
+            self.next_id += count
+            self.class_ids = np.concatenate((self.class_ids, new.class_ids))
+            self.scores = np.concatenate((self.scores, new.scores))
+            self.state = np.concatenate((self.state, np.full(count, TRACKED, dtype=np.int8)))
+            # 第一帧的轨迹直接确认
+            hits = self.min_hits if self.frame_id == 1 else 1
+            self.hits = np.concatenate((self.hits, np.full(count, hits, dtype=np.int64)))
+            self.lost_frames = np.concatenate((self.lost_frames, np.zeros(count, dtype=np.int64)))
+        return self._output()
+
+    def predict(self):
+        """
+        advance every track by one frame without detections, for the frames between detector runs
+        :return: Detections of the confirmed tracked objects at their predicted position, track ids
+        """
+        self._predict()
+        # 没有检测的帧不算丢失
+        self.lost_frames[self.state == TRACKED] -= 1
+        return self._output()
+
+
+class TrackedDetector(object):
+    """
+    runs the detector on every interval-th frame only, the tracker carries the boxes through the frames between
+    :param detector: Detector, or a Backend which is wrapped into one
+    :param tracker: ByteTracker
+    :param interval: 1 runs the detector on every frame
+    """
+
+    def __init__(self, detector, tracker=None, interval=3):
+        self.detector = detector if isinstance(detector, Detector) else Detector(detector)
+        self.tracker = tracker if tracker is not None else ByteTracker()
+        self.interval = interval
+        self.frames = 0
+
+    def detect(self, frame):
+        """
+        :param frame: RGB HWC uint8 frame
+        :return: Detections, track ids
+        """
+        run = self.frames % self.interval == 0
+        self.frames += 1
+        if run:
+            return self.tracker.update(self.detector.detect(frame))
+        return self.tracker.predict()
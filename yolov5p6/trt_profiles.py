@@ -0,0 +1,119 @@
+import json
+import os
+
+from .spec import rect_spec
+
+
+class OptimizationProfile(object):
+    """
+    shape range of the network input for one TensorRT optimization profile, shapes are (batch, 3, h, w)
+    :param name: label of the profile, e.g. the camera it was built for
+    :param min_shape: smallest input shape the profile accepts
+    :param opt_shape: shape the kernels are tuned for
+    :param max_shape: largest input shape the profile accepts, buffers are allocated for it
+    """
+
+    def __init__(self, name, min_shape, opt_shape, max_shape):
+        self.name = name
+        self.min_shape = tuple(min_shape)
+        self.opt_shape = tuple(opt_shape)
+        self.max_shape = tuple(max_shape)
+        for lo, opt, hi in zip(self.min_shape, self.opt_shape, self.max_shape):
+            if not lo <= opt <= hi:
+                raise ValueError('profile %s: expected min <= opt <= max, got %s %s %s' % (
+                    name, self.min_shape, self.opt_shape, self.max_shape))
+
+    def accepts(self, shape):
+        return len(shape) == len(self.min_shape) and all(
+            lo <= dim <= hi for lo, dim, hi in zip(self.min_shape, shape, self.max_shape))
+
+    def to_dict(self):
+        return {'name': self.name, 'min': list(self.min_shape), 'opt': list(self.opt_shape),
+                'max': list(self.max_shape)}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d['name'], d['min'], d['opt'], d['max'])
+
+    def __repr__(self):
+        return 'OptimizationProfile(%r, min=%s, opt=%s, max=%s)' % (
+            self.name, self.min_shape, self.opt_shape, self.max_shape)
+
+
+def make_profile(name, batch=(1, 1, 1), height=(512, 512, 512), width=(512, 512, 512), channels=3):
+    """
+    :param batch: (min, opt, max) batch size
+    :param height: (min, opt, max) input height
+    :param width: (min, opt, max) input width
+    """
+    return OptimizationProfile(name, *[(b, channels, h, w) for b, h, w in zip(batch, height, width)])
+
+
+def camera_profiles(spec, cameras, batch=(1, 1, 1), long_side=None):
+    """
+    one profile per camera resolution for its rect_spec input size (long side long_side, default the spec input
+    size), only the batch size varies within a profile
+    :param cameras: dict of name -> (img_w, img_h)
+    """
+    profiles = []
+    for name, (img_w, img_h) in sorted(cameras.items()):
+        rect = rect_spec(spec, img_w, img_h, long_side)
+        profiles.append(make_profile(name, batch, (rect.input_h,) * 3, (rect.input_w,) * 3))
+    return profiles
+
+
+def replicate_profiles(profiles, copies):
+    """
+    every profile repeated copies times in a row, TensorRT needs a distinct profile for each execution context
+    that runs at the same time, so an engine used with n slots needs n copies of the profile it runs with
+    """
+    return [profile for profile in profiles for _ in range(copies)]
+
+
+def profile_copies(profiles, index):
+    """
+    indices of the profiles with the same name and shapes as profiles[index], starting with index
+    """
+    base = profiles[index].to_dict()
+    return [index] + [i for i, profile in enumerate(profiles) if i != index and profile.to_dict() == base]
+
+
+def select_profile(profiles, shape):
+    """
+    index of the profile to run an input shape with: among the profiles accepting it, the one tuned closest to
+    it, ties broken by the smaller max shape (smaller buffers)
+    """
+    best = None
+    for index, profile in enumerate(profiles):
+        if not profile.accepts(shape):
+            continue
+        distance = sum(abs(dim - opt) for dim, opt in zip(shape, profile.opt_shape))
+        volume = 1
+        for dim in profile.max_shape:
+            volume *= dim
+        if best is None or (distance, volume) < best[0]:
+            best = ((distance, volume), index)
+    if best is None:
+        raise ValueError('no optimization profile accepts input shape %s, profiles: %s' % (tuple(shape), profiles))
+    return best[1]
+
+
+def sidecar_path(engine_path):
+    return os.path.splitext(engine_path)[0] + '.profiles.json'
+
+
+def save_profiles(path, profiles):
+    config = {'profiles': [p.to_dict() for p in profiles]}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_profiles(path):
+    """
+    :return: list of OptimizationProfile in engine profile order
+    """
+    with open(path) as f:
+        config = json.load(f)
+    return [OptimizationProfile.from_dict(d) for d in config['profiles']]
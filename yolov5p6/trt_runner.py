@@ -0,0 +1,179 @@
+import collections
+
+import numpy as np
+
+
+class BindingSpec(object):
+    """
+    :param name: binding name
+    :param shape: binding shape, host buffers are handed out in this shape
+    :param dtype: numpy dtype
+    :param is_input: input or output binding
+    """
+
+    def __init__(self, name, shape, dtype, is_input):
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.is_input = is_input
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+
+# Simple helper data class that's a little nicer to use than a 2-tuple.
+class HostDeviceMem(object):
+    def __init__(self, host_mem, device_mem, shape):
+        self.host = host_mem
+        self.device = device_mem
+        self.shape = shape
+
+    @property
+    def array(self):
+        return self.host.reshape(self.shape)
+
+    def __str__(self):
+        return "Host:\n" + str(self.host) + "\nDevice:\n" + str(self.device)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class InferenceSlot(object):
+    """
+    everything one in-flight frame owns: page-locked host buffers, device buffers, a stream and an execution
+    context, so consecutive frames never share memory that may still be in use
+    """
+
+    def __init__(self, inputs, outputs, bindings, stream, context):
+        self.inputs = inputs
+        self.outputs = outputs
+        self.bindings = bindings
+        self.stream = stream
+        self.context = context
+        self.tag = None
+
+
+def execute_async_v2(context, bindings, stream):
+    context.execute_async_v2(bindings=bindings, stream_handle=stream.handle)
+
+
+class AsyncRunner(object):
+    """
+    runs an engine with several slots in flight, each on its own stream, so the H2D copy, execution and D2H copy
+    of consecutive frames overlap. all buffers are allocated once in __init__
+    :param binding_specs: list of BindingSpec in binding order
+    :param create_context: callable returning a new execution context, one per slot
+    :param cuda: pycuda.driver or an object with the same pagelocked_empty, mem_alloc, Stream,
+        memcpy_htod_async and memcpy_dtoh_async functions
+    :param slots: frames in flight
+    :param execute: execute(context, bindings, stream) enqueueing the engine on the stream
+    """
+
+    def __init__(self, binding_specs, create_context, cuda, slots=2, execute=execute_async_v2):
+        if slots < 1:
+            raise ValueError('slots must be at least 1')
+        self.cuda = cuda
+        self.execute = execute
+        self.binding_specs = binding_specs
+
+        self.slots = []
+        for _ in range(slots):
+            inputs = []
+            outputs = []
+            bindings = []
+            for spec in binding_specs:
+                # Allocate host and device buffers
+                host_mem = cuda.pagelocked_empty(spec.size, spec.dtype)
+                device_mem = cuda.mem_alloc(host_mem.nbytes)
+                bindings.append(int(device_mem))
+                if spec.is_input:
+                    inputs.append(HostDeviceMem(host_mem, device_mem, spec.shape))
+                else:
+                    outputs.append(HostDeviceMem(host_mem, device_mem, spec.shape))
+            self.slots.append(InferenceSlot(inputs, outputs, bindings, cuda.Stream(), create_context()))
+
+        self._free = collections.deque(self.slots)
+        self._in_flight = collections.deque()
+
+    @property
+    def in_flight(self):
+        return len(self._in_flight)
+
+    def input_buffers(self):
+        """
+        page-locked input arrays of the slot the next submit() will use, a preprocessor can write into them
+        directly and call submit() without data
+        """
+        if not self._free:
+            raise RuntimeError('no free slot, collect() a frame first')
+        return [inp.array for inp in self._free[0].inputs]
+
+    def submit(self, data=None, tag=None):
+        """
+        copy data into the next free slot's page-locked input and enqueue H2D copy, execution and D2H copy
+        without waiting for them
+        :param data: input array or list of input arrays, None if already written via input_buffers()
+        :param tag: returned by collect() together with the outputs of this frame
+        """
+        if not self._free:
+            raise RuntimeError('all %d slots are in flight, collect() a frame first' % len(self.slots))
+        slot = self._free.popleft()
+
+        if data is not None:
+            if not isinstance(data, (list, tuple)):
+                data = [data]
+            for inp, arr in zip(slot.inputs, data):
+                # 写入已分配的页锁定内存，而不是替换掉它
+                np.copyto(inp.array, arr.reshape(inp.shape))
+
+        for inp in slot.inputs:
+            self.cuda.memcpy_htod_async(inp.device, inp.host, slot.stream)
+        self.execute(slot.context, slot.bindings, slot.stream)
+        for out in slot.outputs:
+            self.cuda.memcpy_dtoh_async(out.host, out.device, slot.stream)
+
+        slot.tag = tag
+        self._in_flight.append(slot)
+        return slot
+
+    def collect(self, copy=True):
+        """
+        wait for the oldest frame in flight
+        :param copy: return copies of the outputs, otherwise views of the slot's page-locked buffers which are
+            overwritten once the slot is submitted again
+        :return: tag, list of output arrays
+        """
+        if not self._in_flight:
+            raise RuntimeError('nothing in flight')
+        slot = self._in_flight.popleft()
+        slot.stream.synchronize()
+        outputs = [out.array.copy() if copy else out.array for out in slot.outputs]
+        tag = slot.tag
+        slot.tag = None
+        self._free.append(slot)
+        return tag, outputs
+
+    def run(self, data):
+        """
+        synchronous single frame
+        """
+        # 丢弃之前没有取走的结果（例如 run_all 中途退出）
+        while self._in_flight:
+            self.collect()
+        self.submit(data)
+        return self.collect()[1]
+
+    def run_all(self, frames, copy=True):
+        """
+        pipelined inference over an iterable of inputs, a new frame is submitted before the oldest one is waited
+        for so the device always has queued work
+        :return: generator of output lists in input order
+        """
+        for data in frames:
+            if not self._free:
+                yield self.collect(copy)[1]
+            self.submit(data)
+        while self._in_flight:
+            yield self.collect(copy)[1]